@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from companies import statutory
+
+
+def legacy_calculate_paye(taxable_income):
+    """The band walk ``companies.views.calculate_paye`` did before the cumulative brackets."""
+    if taxable_income <= 0:
+        return Decimal('0')
+    tax_bands = [
+        (24000, Decimal('0.10')),
+        (8333, Decimal('0.25')),
+        (467667, Decimal('0.30')),
+        (300000, Decimal('0.325')),
+        (float('inf'), Decimal('0.35')),
+    ]
+    total_tax = Decimal('0')
+    remaining_income = taxable_income
+    for band_limit, rate in tax_bands:
+        if remaining_income <= 0:
+            break
+        taxable_in_band = min(remaining_income, Decimal(str(band_limit)))
+        total_tax += taxable_in_band * rate
+        remaining_income -= taxable_in_band
+    return max(total_tax - Decimal('2400'), Decimal('0')).quantize(Decimal('0.01'))
+
+
+def legacy_deductions(gross_salaries):
+    """The inline per-employee formulas of the payroll loop."""
+    result = {'nssf': [], 'shif': [], 'ahl': [], 'taxable_income': [], 'paye': []}
+    for gross in gross_salaries:
+        nssf = min(gross * Decimal("0.06"), Decimal("1080")).quantize(Decimal("0.01"))
+        shif = max(gross * Decimal("0.0275"), Decimal("300")).quantize(Decimal("0.01"))
+        ahl = (gross * Decimal("0.015")).quantize(Decimal("0.01"))
+        taxable_income = gross - (nssf + shif + ahl)
+        result['nssf'].append(nssf)
+        result['shif'].append(shif)
+        result['ahl'].append(ahl)
+        result['taxable_income'].append(taxable_income)
+        result['paye'].append(legacy_calculate_paye(taxable_income).quantize(Decimal("0.01")))
+    return result
+
+
+class Command(BaseCommand):
+    help = "Benchmark statutory deductions over random salaries, per-salary band walk vs statutory.batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salaries', type=int, default=100_000, help="Number of gross salaries")
+        parser.add_argument('--max-salary', type=int, default=1_500_000, help="Largest gross salary")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per path, the median latency is reported")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the salary generator")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        salaries = [Decimal(rng.randrange(options['max_salary'] * 100)) / 100 for _ in range(options['salaries'])]
+
+        results = []
+        for label, compute in (('before', legacy_deductions), ('after', statutory.batch)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                data = compute(salaries)
+                timings.append((time.perf_counter() - start) * 1000)
+            results.append((label, statistics.median(timings), data))
+
+        if results[0][2] != results[1][2]:
+            raise CommandError("statutory.batch disagrees with the per-salary computation")
+
+        self.stdout.write(f"{'path':>7} {'median ms':>10} {'salaries/s':>12}")
+        for label, latency, _ in results:
+            self.stdout.write(f"{label:>7} {latency:>10.2f} {len(salaries) / latency * 1000:>12.0f}")
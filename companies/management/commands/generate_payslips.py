@@ -0,0 +1,33 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from companies import payslips
+from companies.models import Company
+
+
+class Command(BaseCommand):
+    help = "Render the payslip PDFs of a month in a pool of processes, skipping payslips whose inputs are unchanged."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help="Company id")
+        parser.add_argument('--month', required=True, help="Payroll month, YYYY-MM")
+        parser.add_argument('--workers', type=int, help="Render processes, defaults to PAYSLIP_WORKERS or one per CPU")
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.datetime.strptime(options['month'], "%Y-%m")
+        except ValueError:
+            raise CommandError("--month must be YYYY-MM")
+        company = Company.objects.filter(pk=options['company']).first()
+        if company is None:
+            raise CommandError(f"Company {options['company']} not found")
+
+        start = time.perf_counter()
+        result = payslips.generate(company, month, workers=options['workers'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{result['rendered']} rendered, {result['skipped']} unchanged, "
+                          f"{result['failed']} failed in {elapsed:.1f}s")
+        if result['failed']:
+            raise CommandError("Some payslips failed to render, see the log")
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:47
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_rename_effective_month_employeeremuneration_effective_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('include_unpaid_commissions', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('computing', 'Computing'), ('rendering', 'Rendering'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('total_employees', models.PositiveIntegerField(default=0)),
+                ('processed_employees', models.PositiveIntegerField(default=0)),
+                ('last_employee_id', models.PositiveIntegerField(default=0)),
+                ('result_path', models.CharField(blank=True, max_length=255)),
+                ('summary', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_runs', to='companies.company')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PayrollRunChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_employee_id', models.PositiveIntegerField()),
+                ('last_employee_id', models.PositiveIntegerField()),
+                ('lines', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='companies.payrollrun')),
+            ],
+            options={
+                'ordering': ['first_employee_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payrollrun',
+            index=models.Index(fields=['company', 'month', 'status'], name='payrollrun_company_month_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='payrollrunchunk',
+            unique_together={('run', 'first_employee_id')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0011_payroll_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payslip',
+            name='inputs_digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
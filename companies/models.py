@@ -1,3 +1,6 @@
+import uuid
+from decimal import Decimal
+
 from django.db import models
 from django.db import models
 from rest_framework.exceptions import ValidationError
@@ -257,14 +260,17 @@ class EmployeePayroll(models.Model):
         ordering = ['-payment_year', '-payment_month']
 
     def __str__(self):
-        return f"{self.employee.get_full_name()} - {self.payment_month}/{self.payment_year}"
+        return f"{self.get_employee_name()} - {self.payment_month}/{self.payment_year}"
+
+    def get_employee_name(self):
+        return self.employee.user.get_full_name() or self.employee.user.username
 
-    # Calculation Methods
+    # Calculation Methods; the JSON amounts are floats, totals are kept in Decimal
     def get_total_allowances(self):
-        return sum(self.allowances.values()) if self.allowances else 0
+        return sum((Decimal(str(value)) for value in self.allowances.values()), Decimal('0'))
 
     def get_total_deductions(self):
-        return sum(self.deductions.values()) if self.deductions else 0
+        return sum((Decimal(str(value)) for value in self.deductions.values()), Decimal('0'))
 
     def get_gross_pay(self):
         return self.basic_salary + self.get_total_allowances() + self.bonuses
@@ -274,7 +280,7 @@ class EmployeePayroll(models.Model):
 
     def generate_payslip(self):
         return {
-            "employee": self.employee.get_full_name(),
+            "employee": self.get_employee_name(),
             "month": self.payment_month,
             "year": self.payment_year,
             "basic_salary": self.basic_salary,
@@ -295,6 +301,70 @@ class Payslip(models.Model):
     payroll = models.OneToOneField(EmployeePayroll, on_delete=models.CASCADE)
     generated_on = models.DateTimeField(auto_now_add=True)
     pdf_path = models.CharField(max_length=255, blank=True)  # Optional path to PDF
+    # Digest of the data and template the PDF was rendered from, see companies.payslips
+    inputs_digest = models.CharField(max_length=64, blank=True)
 
     def __str__(self):
         return f"Payslip for {self.payroll}"
+
+
+class PayrollRun(models.Model):
+    """
+    A payroll of one company and month, computed in chunks of employees and
+    rendered to PDF by the render worker, see companies.payroll_runs.
+    """
+    QUEUED = 'queued'
+    COMPUTING = 'computing'
+    RENDERING = 'rendering'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (COMPUTING, 'Computing'),
+        (RENDERING, 'Rendering'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE = [QUEUED, COMPUTING, RENDERING]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="payroll_runs")
+    requested_by = models.ForeignKey('core.CustomUser', on_delete=models.SET_NULL, null=True, blank=True)
+    month = models.DateField()  # first day of the payroll month
+    include_unpaid_commissions = models.BooleanField(default=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    chunk_size = models.PositiveIntegerField()
+    total_employees = models.PositiveIntegerField(default=0)
+    processed_employees = models.PositiveIntegerField(default=0)
+    # Checkpoint: employees are processed in id order, up to and including this one
+    last_employee_id = models.PositiveIntegerField(default=0)
+    result_path = models.CharField(max_length=255, blank=True)  # relative to MEDIA_ROOT
+    summary = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'month', 'status'], name='payrollrun_company_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"PayrollRun {self.id} - {self.company_id} {self.month:%Y-%m} ({self.status})"
+
+
+class PayrollRunChunk(models.Model):
+    """The payroll lines of one committed chunk of employees of a PayrollRun."""
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name="chunks")
+    first_employee_id = models.PositiveIntegerField()
+    last_employee_id = models.PositiveIntegerField()
+    lines = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('run', 'first_employee_id')
+        ordering = ['first_employee_id']
+
+    def __str__(self):
+        return f"PayrollRunChunk {self.run_id} {self.first_employee_id}-{self.last_employee_id}"
@@ -4,32 +4,12 @@ from django.http import JsonResponse
 from weasyprint import HTML
 from io import BytesIO
 from datetime import datetime
+from decimal import Decimal
 from django.conf import settings
+from . import statutory
 from .models import Company, Employee, EmployeeRemuneration
 
 
-def calculate_paye(taxable_income):
-    tax = 0
-    bands = [
-        (24000, 0.10),
-        (8333, 0.25),
-        (467667, 0.30),
-        (300000, 0.325),
-        (float('inf'), 0.35),
-    ]
-
-    for band_limit, rate in bands:
-        if taxable_income > band_limit:
-            tax += band_limit * rate
-            taxable_income -= band_limit
-        else:
-            tax += taxable_income * rate
-            break
-
-    tax -= 2400  # personal relief
-    return max(tax, 0)
-
-
 def generate_payroll(request):
     company_id = request.POST.get("company_id")
     month_str = request.POST.get("month")  # Format: YYYY-MM
@@ -42,14 +22,9 @@ def generate_payroll(request):
 
     for employee in employees:
         remunerations = EmployeeRemuneration.objects.filter(employee=employee)
-        gross_salary = sum(r.amount for r in remunerations)
-
-        nssf = min(gross_salary * 0.06, 1080)
-        shif = max(gross_salary * 0.0275, 300)
-        ahl = gross_salary * 0.015
-
-        taxable_income = gross_salary - (nssf + shif + ahl)
-        paye = calculate_paye(taxable_income)
+        gross_salary = sum((r.amount for r in remunerations), Decimal('0'))
+        deductions = statutory.deductions(gross_salary, month)
+        nssf, shif, ahl, paye = deductions['nssf'], deductions['shif'], deductions['ahl'], deductions['paye']
 
         net_salary = gross_salary - (nssf + shif + ahl + paye)
 
@@ -0,0 +1,200 @@
+"""
+Batched payroll computation.
+
+``compute`` loads the month's inputs of every active employee of a company
+with one query each (employees, remunerations, voluntary deductions and
+unpaid commissions) and computes the payroll lines in memory, the statutory
+deductions of all salaries in one batch (companies.statutory). ``persist``
+writes all ``EmployeePayroll`` rows with one upsert and marks the included
+commissions paid with one UPDATE. ``run`` does both in a single transaction,
+with the commission rows locked so a commission recorded meanwhile is not
+marked paid without having been counted. ``compute_employees`` works on a
+given list of employees, which is how companies.payroll_runs computes a run
+chunk by chunk. ``preview`` is the read-only dry run behind
+``CompanyPayrollAPI``'s ``dry_run`` flag.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import statutory
+from .models import Employee, EmployeeCommission, EmployeeDeduction, EmployeePayroll, EmployeeRemuneration
+
+PAYROLL_FIELDS = ['basic_salary', 'allowances', 'bonuses', 'deductions', 'payment_method', 'account_number',
+                  'bank_name', 'is_paid']
+
+
+def month_bounds(month):
+    """First day of ``month`` and of the month after it."""
+    start = datetime.date(month.year, month.month, 1)
+    end = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return start, end
+
+
+def active_employees(company):
+    return Employee.objects.filter(company=company, is_deleted=False, is_active=True).select_related('user')
+
+
+def _inputs(employees, month, include_unpaid_commissions, for_update):
+    start, end = month_bounds(month)
+    ids = [employee.pk for employee in employees]
+
+    remunerations = defaultdict(list)
+    for rem in EmployeeRemuneration.objects.filter(employee_id__in=ids, effective_date__gte=start,
+                                                   effective_date__lt=end).order_by('pk'):
+        remunerations[rem.employee_id].append(rem)
+
+    # Same range as get_employee_deductions_for_month
+    deductions = defaultdict(list)
+    for deduction in EmployeeDeduction.objects.filter(employee_id__in=ids, effective_month__lte=end).filter(
+            Q(end_month__isnull=True) | Q(end_month__gte=start)):
+        deductions[deduction.employee_id].append(deduction)
+
+    commissions = defaultdict(list)
+    if include_unpaid_commissions:
+        rows = EmployeeCommission.objects.filter(employee_id__in=ids, date_calculate__gte=start,
+                                                 date_calculate__lt=end, paid=False)
+        if for_update:
+            rows = rows.select_for_update()
+        for pk, employee_id, amount in rows.values_list('pk', 'employee_id', 'commission_amount'):
+            commissions[employee_id].append((pk, amount or Decimal('0')))
+
+    return remunerations, deductions, commissions
+
+
+def earnings(employee, remunerations, commissions):
+    """(allowances, bonuses, gross salary) of one employee."""
+    base_salary = employee.salary or Decimal('0')
+    allowances = {}
+    bonuses = Decimal('0')
+    for rem in remunerations:
+        if rem.remuneration_type == "Bonus":
+            bonuses += rem.amount
+        else:
+            allowances[rem.name or rem.remuneration_type] = float(rem.amount)
+            base_salary += rem.amount
+    bonuses += sum((amount for _, amount in commissions), Decimal('0'))
+    return allowances, bonuses, base_salary + bonuses
+
+
+def compute(company, month, include_unpaid_commissions=True, for_update=False):
+    """Payroll lines of the company's active employees for ``month``, sorted by name."""
+    return compute_employees(list(active_employees(company)), month, include_unpaid_commissions, for_update)
+
+
+def compute_employees(employees, month, include_unpaid_commissions=True, for_update=False):
+    """Payroll lines of ``employees`` for ``month``, sorted by name."""
+    remunerations, deductions, commissions = _inputs(employees, month, include_unpaid_commissions, for_update)
+    paid = []
+    for employee in employees:
+        allowances, bonuses, gross = earnings(employee, remunerations[employee.pk], commissions[employee.pk])
+        if gross > 0:
+            paid.append((employee, allowances, bonuses, gross))
+
+    statutory_deductions = statutory.batch([gross for *_, gross in paid], month)
+    lines = []
+    for i, (employee, allowances, bonuses, gross) in enumerate(paid):
+        nssf, shif, ahl, paye = (statutory_deductions[key][i] for key in ('nssf', 'shif', 'ahl', 'paye'))
+        deduction_amounts = {"NSSF": float(nssf), "SHIF": float(shif), "AHL": float(ahl), "PAYE": float(paye)}
+        other = Decimal('0')
+        for deduction in deductions[employee.pk]:
+            label = deduction.deduction_type.title()
+            deduction_amounts[label] = deduction_amounts.get(label, 0.0) + float(deduction.amount)
+            other += deduction.amount
+
+        lines.append({
+            'employee': employee,
+            'employee_id': employee.id,
+            'name': employee.user.get_full_name() or employee.user.username,
+            'position': employee.position or 'N/A',
+            'employee_number': f"EMP{employee.id:04d}",
+            'allowances': allowances,
+            'bonuses': bonuses,
+            'deductions': deduction_amounts,
+            'commission_ids': [pk for pk, _ in commissions[employee.pk]],
+            'gross': gross,
+            'nssf': nssf,
+            'shif': shif,
+            'ahl': ahl,
+            'taxable_income': statutory_deductions['taxable_income'][i],
+            'paye': paye,
+            'other': other,
+            'net': gross - (nssf + shif + ahl + paye + other),
+        })
+    lines.sort(key=lambda line: line['name'])
+    return lines
+
+
+def totals(lines):
+    """Company totals of the payroll lines."""
+    result = {
+        f'total_{key}': sum((line[key] for line in lines), Decimal('0'))
+        for key in ('gross', 'nssf', 'shif', 'ahl', 'paye', 'net')
+    }
+    result['total_other_deductions'] = sum((line['other'] for line in lines), Decimal('0'))
+    result['total_deductions'] = (result['total_nssf'] + result['total_shif'] + result['total_ahl']
+                                  + result['total_paye'])
+    result['total_employees'] = len(lines)
+    return result
+
+
+def preview(company, month, include_unpaid_commissions=True):
+    """
+    The payroll of ``month`` as it would be generated now, for a dry run.
+
+    Only reads: no row is written or locked and no PDF is rendered.
+    """
+    lines = compute(company, month, include_unpaid_commissions)
+    return {
+        'dry_run': True,
+        'month': month.strftime('%Y-%m'),
+        'summary': totals(lines),
+        'lines': [
+            {
+                **{key: value for key, value in line.items() if key not in ('employee', 'commission_ids')},
+                'commissions': len(line['commission_ids']),
+            }
+            for line in lines
+        ],
+    }
+
+
+def persist(lines, month):
+    """Upsert the EmployeePayroll rows of ``lines`` and mark their commissions paid."""
+    EmployeePayroll.objects.bulk_create(
+        [
+            EmployeePayroll(
+                employee=line['employee'],
+                payment_month=month.month,
+                payment_year=month.year,
+                basic_salary=line['employee'].salary or Decimal('0'),
+                allowances=line['allowances'],
+                bonuses=line['bonuses'],
+                deductions=line['deductions'],
+                payment_method="bank_transfer",
+                account_number=line['employee'].account_number or "",
+                bank_name=line['employee'].bank_name or "",
+                is_paid=False,
+            )
+            for line in lines
+        ],
+        update_conflicts=True,
+        unique_fields=['employee', 'payment_month', 'payment_year'],
+        update_fields=PAYROLL_FIELDS,
+    )
+    commission_ids = [pk for line in lines for pk in line['commission_ids']]
+    if commission_ids:
+        EmployeeCommission.objects.filter(pk__in=commission_ids).update(paid=True, date_paid=timezone.now())
+
+
+def run(company, month, include_unpaid_commissions=True):
+    """Compute and save the payroll of ``month`` in one transaction; returns the lines."""
+    with transaction.atomic():
+        lines = compute(company, month, include_unpaid_commissions, for_update=True)
+        if lines:
+            persist(lines, month)
+    return lines
@@ -0,0 +1,215 @@
+"""
+Resumable background payroll runs.
+
+``start`` records a PayrollRun for a company and month (or returns the one
+still in progress) and queues it on the render job queue, so the API returns
+at once; clients poll the run for progress. The worker executes
+companies.renders.render_payroll, which takes the run through
+
+    queued -> computing -> rendering -> done
+
+Any active state can go to ``failed``, and ``retry`` puts a failed run back
+in the queue. A run whose job the queue gave up on (its workers kept dying)
+is failed by reports.jobs through ``companies.renders.payroll_failed``.
+
+While computing, employees are taken in id order, ``chunk_size`` at a time.
+Each chunk is computed and saved (companies.payroll_engine), and
+checkpointed in the same transaction: its lines are stored in a
+PayrollRunChunk and the run's ``last_employee_id`` moves past it. A failure
+therefore never leaves a chunk half written. When the job is requeued after a
+worker died, or the failed run is retried, computing resumes after the
+checkpoint, and the commissions paid by committed chunks are still counted
+through the stored lines.
+"""
+import datetime
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from reports import jobs, singleflight
+from reports.models import RenderJob
+from . import payroll_engine
+from .models import PayrollRun, PayrollRunChunk
+
+TRANSITIONS = {
+    PayrollRun.QUEUED: [PayrollRun.COMPUTING, PayrollRun.FAILED],
+    PayrollRun.COMPUTING: [PayrollRun.RENDERING, PayrollRun.FAILED],
+    PayrollRun.RENDERING: [PayrollRun.DONE, PayrollRun.FAILED],
+    PayrollRun.FAILED: [PayrollRun.QUEUED],
+    PayrollRun.DONE: [],
+}
+
+# Line fields kept in the checkpoints, for the PDF and the summary
+LINE_FIELDS = ['employee_id', 'name', 'position', 'employee_number']
+DECIMAL_FIELDS = ['gross', 'nssf', 'shif', 'ahl', 'taxable_income', 'paye', 'other', 'net']
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def _transition(run_id, status, **fields):
+    sources = [source for source, targets in TRANSITIONS.items() if status in targets]
+    if not PayrollRun.objects.filter(pk=run_id, status__in=sources).update(status=status, **fields):
+        raise InvalidTransition(f"Payroll run {run_id} cannot move to {status}")
+
+
+def start(company, month, include_unpaid_commissions=True, user=None, base_url=None, generated_by=''):
+    """
+    Queue the payroll of ``month`` (any date in it) for ``company``.
+
+    While a run with the same options is still queued or in progress, it is
+    returned instead of a second one being started. A run whose latest job
+    failed is no longer in progress and is marked failed.
+    """
+    month = datetime.date(month.year, month.month, 1)
+
+    def find_or_create():
+        run = PayrollRun.objects.filter(
+            company=company, month=month, include_unpaid_commissions=include_unpaid_commissions,
+            status__in=PayrollRun.ACTIVE,
+        ).order_by('created_at').first()
+        if run is not None:
+            job = (RenderJob.objects.filter(company=company, kind='payroll', params__run=str(run.pk))
+                   .order_by('-created_at').first())
+            if job is None or job.status != RenderJob.FAILED:
+                return run, False
+            fail(run.pk, job.error)
+        return PayrollRun.objects.create(
+            company=company, month=month, include_unpaid_commissions=include_unpaid_commissions,
+            requested_by=user if user and user.is_authenticated else None,
+            chunk_size=settings.PAYROLL_CHUNK_SIZE,
+        ), True
+
+    (run, created), led = singleflight.coalesce(
+        f"payroll-run:{company.pk}:{month}:{include_unpaid_commissions}", find_or_create
+    )
+    if created and led:
+        _enqueue(run, user, base_url, generated_by)
+        run.refresh_from_db()
+    return run
+
+
+def retry(run, user=None, base_url=None, generated_by=''):
+    """Queue a failed run again; it resumes after its last checkpoint."""
+    _transition(run.pk, PayrollRun.QUEUED, error='', finished_at=None)
+    _enqueue(run, user, base_url, generated_by)
+    run.refresh_from_db()
+    return run
+
+
+def _enqueue(run, user, base_url, generated_by):
+    jobs.enqueue('payroll', run.company, user, {
+        'run': str(run.pk),
+        'base_url': base_url,
+        'generated_by': generated_by,
+    })
+
+
+def compute(run_id):
+    """Compute the chunks not yet checkpointed and move the run to rendering; returns the run."""
+    run = PayrollRun.objects.select_related('company').get(pk=run_id)
+    if run.status == PayrollRun.QUEUED:
+        try:
+            _transition(run_id, PayrollRun.COMPUTING, started_at=timezone.now(),
+                        total_employees=payroll_engine.active_employees(run.company).count())
+        except InvalidTransition:
+            pass  # another worker given the same job started it; the status is checked under the lock below
+    elif run.status == PayrollRun.RENDERING:
+        return run  # the worker died while rendering, only the PDF is left
+    elif run.status != PayrollRun.COMPUTING:
+        raise InvalidTransition(f"Payroll run {run_id} is {run.status}")
+
+    while _compute_chunk(run_id):
+        pass
+    with transaction.atomic():
+        run = PayrollRun.objects.select_for_update().select_related('company').get(pk=run_id)
+        if run.status == PayrollRun.COMPUTING:
+            _transition(run_id, PayrollRun.RENDERING)
+            run.status = PayrollRun.RENDERING
+        elif run.status != PayrollRun.RENDERING:
+            # Moving on from rendering is left to the worker that got there first
+            raise InvalidTransition(f"Payroll run {run_id} is {run.status}")
+    return run
+
+
+def _compute_chunk(run_id):
+    """Compute, save and checkpoint the next chunk of employees; False once none is left."""
+    with transaction.atomic():
+        # The row lock keeps a second worker, e.g. one given the requeued job, off the same chunk
+        run = PayrollRun.objects.select_for_update().select_related('company').get(pk=run_id)
+        if run.status != PayrollRun.COMPUTING:
+            return False
+        employees = list(
+            payroll_engine.active_employees(run.company)
+            .filter(pk__gt=run.last_employee_id)
+            .order_by('pk')[:run.chunk_size]
+        )
+        if not employees:
+            return False
+
+        lines = payroll_engine.compute_employees(employees, run.month, run.include_unpaid_commissions,
+                                                 for_update=True)
+        if lines:
+            payroll_engine.persist(lines, run.month)
+        PayrollRunChunk.objects.create(
+            run=run, first_employee_id=employees[0].pk, last_employee_id=employees[-1].pk,
+            lines=[
+                {**{key: line[key] for key in LINE_FIELDS}, **{key: str(line[key]) for key in DECIMAL_FIELDS}}
+                for line in lines
+            ],
+        )
+        run.last_employee_id = employees[-1].pk
+        run.processed_employees += len(employees)
+        run.save(update_fields=['last_employee_id', 'processed_employees'])
+    return True
+
+
+def lines(run):
+    """Payroll lines of all checkpointed chunks, sorted by name."""
+    result = [
+        {**line, **{key: Decimal(line[key]) for key in DECIMAL_FIELDS}}
+        for chunk in run.chunks.all()
+        for line in chunk.lines
+    ]
+    result.sort(key=lambda line: line['name'])
+    return result
+
+
+def finish(run_id, result_path, summary):
+    _transition(run_id, PayrollRun.DONE, result_path=result_path, summary=summary, finished_at=timezone.now())
+
+
+def fail(run_id, error):
+    """Mark the run failed unless it already finished."""
+    PayrollRun.objects.filter(pk=run_id, status__in=PayrollRun.ACTIVE).update(
+        status=PayrollRun.FAILED, error=error, finished_at=timezone.now()
+    )
+
+
+def run_payload(run, request):
+    """Representation returned by the payroll endpoints."""
+    payload = {
+        'run_id': str(run.id),
+        'status': run.status,
+        'month': run.month.strftime('%Y-%m'),
+        'total_employees': run.total_employees,
+        'processed_employees': run.processed_employees,
+        'progress': min(100, run.processed_employees * 100 // run.total_employees) if run.total_employees else 0,
+        'progress_url': request.build_absolute_uri(reverse('payroll-run', args=[run.id])),
+        'result_url': None,
+        'summary': run.summary,
+        'error': run.error or None,
+        'created_at': run.created_at,
+        'started_at': run.started_at,
+        'finished_at': run.finished_at,
+    }
+    if run.status == PayrollRun.DONE and run.result_path:
+        payload['result_url'] = request.build_absolute_uri(
+            settings.MEDIA_URL + run.result_path.replace(os.sep, '/')
+        )
+    return payload
@@ -0,0 +1,202 @@
+"""
+Per-employee payslip PDFs.
+
+``generate`` renders one PDF per EmployeePayroll of a company and month and
+records it in the payroll's Payslip. The HTML is rendered here; the PDF
+conversion, which is where the time goes, is spread over a pool of
+processes. Each Payslip stores a digest of the data and the template its PDF
+came from, so a payslip is only rendered again when one of them changed or
+its file is gone.
+
+Render worker processes are daemonic and cannot start a pool of their own;
+there, and for a single payslip, the PDFs are written in-process. The API
+therefore spreads a month over several render jobs, one per chunk of
+``pending`` payslips (companies.renders.render_payslips), and the worker
+pool renders the chunks side by side.
+
+``stream_zip`` sends the payslips of a month as one ZIP, written while it is
+sent.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+
+import django
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from weasyprint import HTML
+
+from core import metrics
+from .models import EmployeePayroll, Payslip
+
+logger = logging.getLogger("csm")
+
+TEMPLATE = "payslip_template.html"
+ZIP_CHUNK = 64 * 1024
+
+
+def payslip_context(payroll, company):
+    """Everything the payslip shows; also what its digest is computed over."""
+    employee = payroll.employee
+    return {
+        **payroll.generate_payslip(),
+        'company': {'name': company.name, 'address': company.address, 'email': company.email},
+        'employee_number': f"EMP{employee.id:04d}",
+        'position': employee.position or 'N/A',
+        'period': datetime.date(payroll.payment_year, payroll.payment_month, 1).strftime('%B %Y'),
+        'total_deductions': payroll.get_total_deductions(),
+    }
+
+
+def _payslips(company, month, payroll_ids=None):
+    """(payroll, context, digest, path, up to date) of every payroll of the month, or of ``payroll_ids``."""
+    template_digest = hashlib.sha256(get_template(TEMPLATE).template.source.encode()).hexdigest()
+    payrolls = (
+        EmployeePayroll.objects
+        .filter(employee__company=company, payment_year=month.year, payment_month=month.month)
+        .select_related('employee__user', 'payslip')
+        .order_by('employee_id')
+    )
+    if payroll_ids is not None:
+        payrolls = payrolls.filter(pk__in=payroll_ids)
+    for payroll in payrolls:
+        context = payslip_context(payroll, company)
+        digest = hashlib.sha256(
+            (template_digest + json.dumps(context, sort_keys=True, default=str)).encode()
+        ).hexdigest()
+        path = os.path.join('payslips', str(company.pk), f"{month:%Y_%m}", f"payslip_{context['employee_number']}.pdf")
+        try:
+            payslip = payroll.payslip
+        except Payslip.DoesNotExist:
+            payslip = None
+        current = (payslip is not None and payslip.inputs_digest == digest and payslip.pdf_path
+                   and os.path.exists(os.path.join(settings.MEDIA_ROOT, payslip.pdf_path)))
+        yield payroll, context, digest, path, current
+
+
+def _write_pdf(task):
+    """Convert one payslip; runs in a pool process. Returns (payroll id, error or None)."""
+    payroll_id, html_string, base_url, path = task
+    # Written aside and renamed, so a failed render never replaces a good file;
+    # the name is unique, so two jobs rendering the same payslip do not collide
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        with metrics.timed('weasyprint'):
+            HTML(string=html_string, base_url=base_url).write_pdf(tmp_path)
+        os.replace(tmp_path, path)
+        return payroll_id, None
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return payroll_id, f"{type(e).__name__}: {e}"
+
+
+def _pool_size(workers, tasks):
+    if multiprocessing.current_process().daemon:
+        return 1
+    workers = workers or settings.PAYSLIP_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, tasks))
+
+
+def generate(company, month, workers=None, base_url=None, payroll_ids=None):
+    """
+    Render the payslips of ``month`` (any date in it) that are missing or out
+    of date, only those of ``payroll_ids`` if given; returns the counts of
+    rendered, skipped and failed payslips.
+    """
+    tasks, pending, skipped = [], {}, 0
+    for payroll, context, digest, path, current in _payslips(company, month, payroll_ids):
+        if current:
+            skipped += 1
+            continue
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tasks.append((payroll.pk, render_to_string(TEMPLATE, context), base_url, full_path))
+        pending[payroll.pk] = (path, digest)
+
+    processes = _pool_size(workers, len(tasks))
+    if processes > 1:
+        # Spawned like the render worker's pool; django.setup() runs before a task is unpickled
+        with multiprocessing.get_context('spawn').Pool(processes, initializer=django.setup) as pool:
+            results = list(pool.imap_unordered(_write_pdf, tasks))
+    else:
+        results = [_write_pdf(task) for task in tasks]
+
+    failed = [(payroll_id, error) for payroll_id, error in results if error]
+    for payroll_id, error in failed:
+        logger.error("Payslip of payroll %s failed to render: %s", payroll_id, error)
+    rendered = [payroll_id for payroll_id, error in results if not error]
+    Payslip.objects.bulk_create(
+        [
+            Payslip(payroll_id=payroll_id, pdf_path=pending[payroll_id][0], inputs_digest=pending[payroll_id][1])
+            for payroll_id in rendered
+        ],
+        update_conflicts=True,
+        unique_fields=['payroll'],
+        update_fields=['pdf_path', 'inputs_digest', 'generated_on'],
+    )
+    return {'rendered': len(rendered), 'skipped': skipped, 'failed': len(failed)}
+
+
+def pending(company, month):
+    """Ids of the payrolls of the month whose payslip is missing or out of date."""
+    return [payroll.pk for payroll, *_, current in _payslips(company, month) if not current]
+
+
+def outdated(company, month):
+    """Number of payslips of the month that are missing or out of date."""
+    return len(pending(company, month))
+
+
+class _ZipStream:
+    """Unseekable file object collecting what ZipFile writes, drained between chunks."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _zip_chunks(files):
+    stream = _ZipStream()
+    # PDFs are compressed already; stored entries stream without buffering
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for name, path in files:
+            with open(path, 'rb') as source, archive.open(name, 'w') as target:
+                while chunk := source.read(ZIP_CHUNK):
+                    target.write(chunk)
+                    yield stream.drain()
+    yield stream.drain()
+
+
+def stream_zip(company, month):
+    """The month's payslip PDFs as a streamed ZIP download."""
+    payslips = (
+        Payslip.objects
+        .filter(payroll__employee__company=company, payroll__payment_year=month.year,
+                payroll__payment_month=month.month)
+        .exclude(pdf_path='')
+        .order_by('payroll__employee_id')
+    )
+    files = [(os.path.basename(payslip.pdf_path), os.path.join(settings.MEDIA_ROOT, payslip.pdf_path))
+             for payslip in payslips]
+    response = StreamingHttpResponse(_zip_chunks(files), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="payslips_{company.pk}_{month:%Y_%m}.zip"'
+    return response
@@ -0,0 +1,111 @@
+"""Render functions for the background job queue, see reports.jobs.RENDERERS."""
+import datetime
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+from weasyprint import HTML
+
+from core import metrics
+from reports import jobs
+
+from . import payroll_engine, payroll_runs, payslips
+from .models import PayrollRun
+
+
+def render_payroll(job):
+    """Compute the PayrollRun of the job (resuming after its checkpoint) and render its PDF."""
+    run_id = job.params['run']
+    try:
+        run = payroll_runs.compute(run_id)
+        payroll_data = payroll_runs.lines(run)
+        if not payroll_data:
+            raise ValueError('No payroll generated. Possibly already exists or no salaries found.')
+        result_path, result = _render_payroll_pdf(run.company, run.month, payroll_data, job.params)
+        payroll_runs.finish(run_id, result_path, result['summary'])
+    except payroll_runs.InvalidTransition:
+        # A second worker given the same job (requeued while the first was
+        # still alive) lost the race; the run is the other worker's to finish or fail.
+        run = PayrollRun.objects.get(pk=run_id)
+        if run.status != PayrollRun.DONE:
+            raise
+        return run.result_path, {'message': 'Payroll generated by another worker', 'summary': run.summary}
+    except Exception as e:
+        payroll_runs.fail(run_id, str(e))
+        raise
+    return result_path, result
+
+
+def payroll_failed(job, error):
+    """Failure hook of payroll jobs, see reports.jobs.FAILURE_HOOKS."""
+    payroll_runs.fail(job.params['run'], error)
+
+
+def _render_payroll_pdf(company, month, payroll_data, params):
+    month_str = month.strftime("%Y-%m")
+    summary = payroll_engine.totals(payroll_data)
+    summary.update({
+        'average_salary': summary['total_gross'] / len(payroll_data),
+        'generation_date': timezone.now().strftime('%d %B %Y at %I:%M %p'),
+        'month_name': month.strftime("%B %Y"),
+        'month_short': month.strftime("%b %Y"),
+    })
+
+    context = {
+        "company": company,
+        "month": summary['month_name'],
+        "month_year": month_str,
+        "payroll": payroll_data,
+        "summary": summary,
+        "generated_by": params.get('generated_by') or '',
+        "current_date": timezone.now().strftime('%d %B %Y'),
+        "current_time": timezone.now().strftime('%I:%M %p'),
+    }
+
+    html_string = render_to_string("payroll_template.html", context)
+    output_dir = os.path.join(settings.MEDIA_ROOT, 'payrolls')
+    os.makedirs(output_dir, exist_ok=True)
+
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"payroll_{company.id}_{month.strftime('%Y_%m')}_{timestamp}.pdf"
+
+    with metrics.timed('weasyprint'):
+        HTML(string=html_string, base_url=params.get('base_url')).write_pdf(os.path.join(output_dir, filename))
+
+    return os.path.join('payrolls', filename), {
+        'message': f'Payroll generated successfully for {summary["month_name"]}',
+        'filename': filename,
+        'summary': {
+            'total_employees': summary['total_employees'],
+            'total_gross': float(summary['total_gross']),
+            'total_net': float(summary['total_net']),
+            'generation_date': summary['generation_date']
+        }
+    }
+
+
+def render_payslips(job):
+    """
+    Queue one payslips job per PAYSLIP_CHUNK_SIZE pending payslips of the
+    month, or, for such a job (``payrolls`` given), render its chunk.
+    """
+    month = datetime.datetime.strptime(job.params['month'], "%Y-%m")
+    if 'payrolls' in job.params:
+        result = payslips.generate(job.company, month, base_url=job.params.get('base_url'),
+                                   payroll_ids=job.params['payrolls'])
+        if result['failed']:
+            raise RuntimeError(f"{result['failed']} payslip(s) failed to render, the others were saved")
+        return '', {'message': f'Payslips generated for {month:%B %Y}', **result}
+
+    pending = payslips.pending(job.company, month)
+    size = settings.PAYSLIP_CHUNK_SIZE
+    chunks = [
+        jobs.enqueue('payslips', job.company, job.requested_by, {**job.params, 'payrolls': pending[i:i + size]})
+        for i in range(0, len(pending), size)
+    ]
+    return '', {
+        'message': f'{len(pending)} payslip(s) of {month:%B %Y} queued in {len(chunks)} job(s)',
+        'pending': len(pending),
+        'jobs': [str(chunk.pk) for chunk in chunks],
+    }
@@ -0,0 +1,127 @@
+"""
+Statutory payroll deductions: NSSF, SHIF, the Affordable Housing Levy and PAYE.
+
+Rates live in ``TABLES``, one entry per version with the date it takes
+effect; ``table_for`` picks the version in force for a payroll month. When
+the law changes, add a version rather than editing one, so payrolls of
+earlier months can still be recomputed the way they were paid.
+
+``Table`` turns the marginal PAYE bands into cumulative brackets once: the
+lower bound of every band and the tax due up to it. PAYE of an income is
+then one binary search plus one multiplication instead of a walk over the
+bands. ``deductions`` computes one salary; ``batch`` applies it to a whole
+sequence of gross salaries, returning one list per deduction.
+
+All amounts are Decimals; every deduction is rounded to the cent with the
+default (half-even) rounding, as on the payslips.
+"""
+import datetime
+from bisect import bisect_right
+from decimal import Decimal
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+
+TABLES = [
+    {
+        # The rates the payroll has applied since it was written, for every month
+        'effective_from': datetime.date.min,
+        # (band width, rate); the last band is open ended
+        'paye_bands': [
+            (Decimal('24000'), Decimal('0.10')),
+            (Decimal('8333'), Decimal('0.25')),
+            (Decimal('467667'), Decimal('0.30')),
+            (Decimal('300000'), Decimal('0.325')),
+            (None, Decimal('0.35')),
+        ],
+        'personal_relief': Decimal('2400'),
+        'nssf_rate': Decimal('0.06'),
+        'nssf_cap': Decimal('1080'),
+        'shif_rate': Decimal('0.0275'),
+        'shif_minimum': Decimal('300'),
+        'ahl_rate': Decimal('0.015'),
+    },
+]
+
+
+class Table:
+    """One version of the rates, with the PAYE bands precomputed into cumulative brackets."""
+
+    def __init__(self, effective_from, paye_bands, personal_relief, nssf_rate, nssf_cap, shif_rate,
+                 shif_minimum, ahl_rate):
+        self.effective_from = effective_from
+        self.personal_relief = personal_relief
+        self.nssf_rate = nssf_rate
+        self.nssf_cap = nssf_cap
+        self.shif_rate = shif_rate
+        self.shif_minimum = shif_minimum
+        self.ahl_rate = ahl_rate
+
+        self.lower_bounds, self.base_tax, self.rates = [], [], []
+        lower, tax = ZERO, ZERO
+        for width, rate in paye_bands:
+            self.lower_bounds.append(lower)
+            self.base_tax.append(tax)
+            self.rates.append(rate)
+            if width is None:
+                break
+            lower += width
+            tax += width * rate
+
+    def paye(self, taxable_income):
+        """PAYE on a monthly taxable income, after personal relief."""
+        if taxable_income <= 0:
+            return ZERO
+        i = bisect_right(self.lower_bounds, taxable_income) - 1
+        tax = self.base_tax[i] + (taxable_income - self.lower_bounds[i]) * self.rates[i]
+        return max(tax - self.personal_relief, ZERO).quantize(CENT)
+
+    def deductions(self, gross):
+        """Statutory deductions of one gross monthly salary."""
+        nssf = min(gross * self.nssf_rate, self.nssf_cap).quantize(CENT)
+        shif = max(gross * self.shif_rate, self.shif_minimum).quantize(CENT)
+        ahl = (gross * self.ahl_rate).quantize(CENT)
+        taxable_income = gross - (nssf + shif + ahl)
+        return {
+            'nssf': nssf,
+            'shif': shif,
+            'ahl': ahl,
+            'taxable_income': taxable_income,
+            'paye': self.paye(taxable_income),
+        }
+
+    def batch(self, gross_salaries):
+        """``deductions`` of every salary, as one list per deduction in the input order."""
+        result = {'nssf': [], 'shif': [], 'ahl': [], 'taxable_income': [], 'paye': []}
+        for gross in gross_salaries:
+            for key, value in self.deductions(gross).items():
+                result[key].append(value)
+        return result
+
+
+_TABLES = sorted((Table(**version) for version in TABLES), key=lambda table: table.effective_from)
+_EFFECTIVE_DATES = [table.effective_from for table in _TABLES]
+
+
+def table_for(day=None):
+    """The version of the rates in force on ``day`` (a date or datetime, default today)."""
+    if day is None:
+        day = datetime.date.today()
+    elif isinstance(day, datetime.datetime):
+        day = day.date()
+    i = bisect_right(_EFFECTIVE_DATES, day) - 1
+    if i < 0:
+        raise ValueError(f"No statutory rates before {_EFFECTIVE_DATES[0]}, got {day}")
+    return _TABLES[i]
+
+
+def paye(taxable_income, day=None):
+    return table_for(day).paye(taxable_income)
+
+
+def deductions(gross, day=None):
+    return table_for(day).deductions(gross)
+
+
+def batch(gross_salaries, day=None):
+    return table_for(day).batch(gross_salaries)
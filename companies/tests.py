@@ -1,3 +1,380 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import random
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.models import CustomUser
+from reports import jobs, synthetic
+from reports.models import RenderJob
+from . import payroll_engine, payroll_runs, payslips, renders, statutory
+from .models import (
+    Employee, EmployeeCommission, EmployeeDeduction, EmployeePayroll, EmployeeRemuneration, PayrollRun, Payslip,
+)
+
+
+class PayrollEngineTests(TestCase):
+    def setUp(self):
+        self.month = datetime.date.today().replace(day=1)
+        self.company = self._company(0, employees=3)
+        self.employee = Employee.objects.filter(company=self.company).order_by('pk').first()
+        EmployeeRemuneration.objects.create(employee=self.employee, remuneration_type='House Allowance',
+                                            amount=Decimal('5000'), effective_date=self.month)
+        EmployeeRemuneration.objects.create(employee=self.employee, remuneration_type='Bonus',
+                                            amount=Decimal('2000'), effective_date=self.month)
+        EmployeeDeduction.objects.create(employee=self.employee, deduction_type='loan', amount=Decimal('1500'),
+                                         effective_month=self.month)
+
+    def _company(self, index, employees):
+        return synthetic.generate_company(index, "payroll", random.Random(index), customers=3, employees=employees,
+                                          services=2, products=2, days=2, sales_per_day=4)
+
+    def test_run_saves_payroll_and_marks_commissions_paid(self):
+        commissions = EmployeeCommission.objects.filter(employee=self.employee, paid=False)
+        commission_total = sum(commission.commission_amount for commission in commissions)
+
+        lines = payroll_engine.run(self.company, self.month)
+
+        self.assertEqual(len(lines), 3)
+        line = next(line for line in lines if line['employee_id'] == self.employee.pk)
+        gross = self.employee.salary + Decimal('5000') + Decimal('2000') + commission_total
+        self.assertEqual(line['gross'], gross)
+        self.assertEqual(line['bonuses'], Decimal('2000') + commission_total)
+        self.assertEqual(line['deductions']['Loan'], 1500.0)
+        self.assertEqual(line['net'], gross - (line['nssf'] + line['shif'] + line['ahl'] + line['paye']
+                                               + Decimal('1500')))
+
+        payroll = EmployeePayroll.objects.get(employee=self.employee)
+        self.assertEqual(payroll.allowances, {'House Allowance': 5000.0})
+        self.assertEqual(payroll.bonuses, line['bonuses'])
+        self.assertEqual(payroll.basic_salary, self.employee.salary)
+        self.assertFalse(EmployeeCommission.objects.filter(employee__company=self.company, paid=False).exists())
+
+    def test_rerun_updates_the_rows_in_place(self):
+        payroll_engine.run(self.company, self.month)
+        lines = payroll_engine.run(self.company, self.month)
+
+        self.assertEqual(EmployeePayroll.objects.filter(employee__company=self.company).count(), 3)
+        # Commissions were paid by the first run
+        payroll = EmployeePayroll.objects.get(employee=self.employee)
+        self.assertEqual(payroll.bonuses, Decimal('2000'))
+        self.assertEqual(sum(len(line['commission_ids']) for line in lines), 0)
+
+    def test_commissions_can_be_left_out(self):
+        lines = payroll_engine.run(self.company, self.month, include_unpaid_commissions=False)
+
+        self.assertEqual(sum(len(line['commission_ids']) for line in lines), 0)
+        self.assertTrue(EmployeeCommission.objects.filter(employee__company=self.company, paid=False).exists())
+
+    def test_query_count_does_not_grow_with_employees(self):
+        larger = self._company(1, employees=8)
+        counts = []
+        for company in (self.company, larger):
+            with CaptureQueriesContext(connection) as ctx:
+                payroll_engine.run(company, self.month)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class StatutoryTests(TestCase):
+    def test_paye_golden_values(self):
+        table = statutory.table_for(datetime.date(2025, 1, 1))
+        for taxable, expected in [
+            ('-5', '0'), ('0', '0'), ('24000', '0.00'), ('32333', '2083.25'),
+            ('46795', '6421.85'), ('100000', '22383.35'), ('800000', '239883.35'), ('1000000', '309883.35'),
+        ]:
+            with self.subTest(taxable=taxable):
+                self.assertEqual(table.paye(Decimal(taxable)), Decimal(expected))
+
+    def test_deductions_golden_values(self):
+        for gross, expected in [
+            ('10000', ('600.00', '300.00', '150.00', '8950.00', '0')),
+            ('12345.67', ('740.74', '339.51', '185.19', '11080.23', '0')),
+            ('50000', ('1080.00', '1375.00', '750.00', '46795.00', '6421.85')),
+        ]:
+            with self.subTest(gross=gross):
+                result = statutory.deductions(Decimal(gross))
+                self.assertEqual(
+                    tuple(result[key] for key in ('nssf', 'shif', 'ahl', 'taxable_income', 'paye')),
+                    tuple(Decimal(value) for value in expected),
+                )
+
+    def test_batch_matches_single_salaries(self):
+        rng = random.Random(7)
+        salaries = [Decimal(rng.randrange(150_000_000)) / 100 for _ in range(500)]
+        result = statutory.batch(salaries)
+        for i, gross in enumerate(salaries):
+            single = statutory.deductions(gross)
+            self.assertEqual({key: values[i] for key, values in result.items()}, single)
+
+    def test_version_in_force_is_picked_by_date(self):
+        base = statutory.TABLES[0]
+        tables = [statutory.Table(**{**base, 'effective_from': datetime.date(2020, 1, 1)}),
+                  statutory.Table(**{**base, 'effective_from': datetime.date(2025, 7, 1),
+                                     'personal_relief': Decimal('3000')})]
+        with mock.patch.object(statutory, '_TABLES', tables), \
+                mock.patch.object(statutory, '_EFFECTIVE_DATES', [table.effective_from for table in tables]):
+            self.assertIs(statutory.table_for(datetime.date(2025, 6, 30)), tables[0])
+            self.assertIs(statutory.table_for(datetime.datetime(2025, 7, 1, 12, 0)), tables[1])
+            self.assertEqual(statutory.paye(Decimal('32333'), datetime.date(2025, 7, 1)), Decimal('1483.25'))
+            with self.assertRaises(ValueError):
+                statutory.table_for(datetime.date(2019, 12, 31))
+
+    def test_benchmark_command_agrees_with_the_legacy_computation(self):
+        out = io.StringIO()
+        call_command('benchmark_statutory', salaries=200, repeat=1, stdout=out)
+        self.assertIn('after', out.getvalue())
+
+
+@override_settings(PAYROLL_CHUNK_SIZE=2, MEDIA_ROOT=tempfile.gettempdir())
+class PayrollRunTests(TestCase):
+    def setUp(self):
+        self.month = datetime.date.today().replace(day=1)
+        self.company = synthetic.generate_company(0, "run", random.Random(0), customers=3, employees=3,
+                                                  services=2, products=2, days=2, sales_per_day=4)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(company=self.company, role='CompanyOwner'))
+        pdf = mock.patch('companies.renders.HTML')
+        pdf.start()
+        self.addCleanup(pdf.stop)
+
+    def _generate(self):
+        return self.client.post('/api/v1/companies/payroll/generate',
+                                {'companyId': self.company.pk, 'month': f"{self.month:%Y-%m}"}, format='json')
+
+    @override_settings(RENDER_JOBS_EAGER=True)
+    def test_run_is_computed_in_chunks_and_reports_progress(self):
+        response = self._generate()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], PayrollRun.DONE)
+        self.assertEqual((response.data['processed_employees'], response.data['progress']), (3, 100))
+        self.assertTrue(response.data['result_url'].endswith('.pdf'))
+        self.assertEqual(response.data['summary']['total_employees'], 3)
+        run = PayrollRun.objects.get(pk=response.data['run_id'])
+        self.assertEqual(run.chunks.count(), 2)
+        self.assertEqual(EmployeePayroll.objects.filter(employee__company=self.company).count(), 3)
+
+        progress = self.client.get(response.data['progress_url'])
+        self.assertEqual(progress.status_code, 200)
+        self.assertEqual(progress.data['status'], PayrollRun.DONE)
+
+    @override_settings(RENDER_JOBS_EAGER=True)
+    def test_failed_run_resumes_after_the_last_checkpoint(self):
+        compute = payroll_engine.compute_employees
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return compute(*args, **kwargs)
+
+        with mock.patch.object(payroll_engine, 'compute_employees', side_effect=fail_second_chunk):
+            response = self._generate()
+
+        self.assertEqual(response.data['status'], PayrollRun.FAILED)
+        self.assertEqual(response.data['error'], "database went away")
+        self.assertEqual(response.data['processed_employees'], 2)
+        first_chunk = [employee.pk for employee in calls[0]]
+        self.assertFalse(EmployeeCommission.objects.filter(employee_id__in=first_chunk, paid=False).exists())
+        self.assertTrue(EmployeeCommission.objects.filter(employee__company=self.company, paid=False).exists())
+
+        retried = self.client.post(f"/api/v1/companies/payroll/runs/{response.data['run_id']}/retry")
+
+        self.assertEqual(retried.status_code, 202)
+        self.assertEqual(retried.data['status'], PayrollRun.DONE)
+        self.assertEqual(retried.data['processed_employees'], 3)
+        # Employees of the first chunk are counted from its checkpoint, commissions included
+        self.assertEqual(retried.data['summary']['total_employees'], 3)
+        run = PayrollRun.objects.get(pk=response.data['run_id'])
+        expected = sum(line['gross'] for line in payroll_runs.lines(run))
+        self.assertAlmostEqual(retried.data['summary']['total_gross'], float(expected))
+        self.assertFalse(EmployeeCommission.objects.filter(employee__company=self.company, paid=False).exists())
+
+    def test_dry_run_computes_without_writing_locking_or_rendering(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/v1/companies/payroll/generate',
+                                        {'companyId': self.company.pk, 'month': f"{self.month:%Y-%m}", 'dry_run': True},
+                                        format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['dry_run'])
+        self.assertEqual(response.data['summary']['total_employees'], 3)
+        statements = [query['sql'].split()[0].upper() for query in ctx.captured_queries]
+        self.assertEqual(set(statements), {'SELECT'})
+        self.assertFalse(any('FOR UPDATE' in query['sql'] for query in ctx.captured_queries))
+        self.assertFalse(EmployeePayroll.objects.filter(employee__company=self.company).exists())
+        self.assertFalse(PayrollRun.objects.exists())
+        self.assertFalse(EmployeeCommission.objects.filter(employee__company=self.company, paid=True).exists())
+
+        lines = payroll_engine.run(self.company, self.month)
+        self.assertEqual([line['net'] for line in response.data['lines']], [line['net'] for line in lines])
+        self.assertEqual(response.data['summary']['total_net'], payroll_engine.totals(lines)['total_net'])
+
+    def test_dry_run_false_generates_the_payroll(self):
+        response = self.client.post('/api/v1/companies/payroll/generate',
+                                    {'companyId': self.company.pk, 'month': f"{self.month:%Y-%m}", 'dry_run': 'false'},
+                                    format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], PayrollRun.QUEUED)
+
+    def test_other_companies_payroll_is_not_found(self):
+        other = synthetic.generate_company(1, "other", random.Random(1), customers=1, employees=2,
+                                           services=1, products=1, days=1, sales_per_day=1)
+        for dry_run in (True, False):
+            response = self.client.post('/api/v1/companies/payroll/generate',
+                                        {'companyId': other.pk, 'month': f"{self.month:%Y-%m}", 'dry_run': dry_run},
+                                        format='json')
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('lines', response.data)
+        self.assertFalse(PayrollRun.objects.filter(company=other).exists())
+
+    def test_identical_requests_share_the_active_run(self):
+        first = self._generate()
+        second = self._generate()
+
+        self.assertEqual(first.data['status'], PayrollRun.QUEUED)
+        self.assertEqual(first.data['run_id'], second.data['run_id'])
+        self.assertEqual(RenderJob.objects.filter(company=self.company, kind='payroll').count(), 1)
+
+        conflict = self.client.post(f"/api/v1/companies/payroll/runs/{first.data['run_id']}/retry")
+        self.assertEqual(conflict.status_code, 409)
+
+
+    def test_abandoned_job_fails_its_run(self):
+        run = PayrollRun.objects.get(pk=self._generate().data['run_id'])
+        job = RenderJob.objects.get(company=self.company, kind='payroll')
+        with self.settings(RENDER_JOB_MAX_ATTEMPTS=2):
+            self.assertEqual(jobs.claim_jobs(1), [job.pk])
+            self.assertEqual(jobs.claim_jobs(1, stale_after=-1), [job.pk])
+            self.assertEqual(jobs.claim_jobs(1, stale_after=-1), [])
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, PayrollRun.FAILED)
+        self.assertEqual(run.error, 'Worker did not finish the render')
+        with override_settings(RENDER_JOBS_EAGER=True):
+            retried = self.client.post(f"/api/v1/companies/payroll/runs/{run.pk}/retry")
+        self.assertEqual(retried.status_code, 202)
+        self.assertEqual(retried.data['status'], PayrollRun.DONE)
+
+    def test_run_whose_job_failed_is_not_returned_again(self):
+        first = self._generate()
+        RenderJob.objects.filter(company=self.company, kind='payroll').update(status=RenderJob.FAILED,
+                                                                              error='lost')
+
+        second = self._generate()
+
+        self.assertNotEqual(second.data['run_id'], first.data['run_id'])
+        self.assertEqual(second.data['status'], PayrollRun.QUEUED)
+        failed = PayrollRun.objects.get(pk=first.data['run_id'])
+        self.assertEqual((failed.status, failed.error), (PayrollRun.FAILED, 'lost'))
+
+    def test_second_worker_on_the_same_run_does_not_fail_it(self):
+        self._generate()
+        job = RenderJob.objects.get(company=self.company, kind='payroll')
+        run_id = job.params['run']
+
+        compute_chunk = payroll_runs._compute_chunk
+
+        # The other worker moves the run to rendering once the last chunk is checkpointed
+        def overtaken(run_id):
+            if compute_chunk(run_id):
+                return True
+            payroll_runs._transition(run_id, PayrollRun.RENDERING)
+            return False
+
+        payroll_runs._transition(run_id, PayrollRun.COMPUTING)
+        with mock.patch.object(payroll_runs, '_compute_chunk', side_effect=overtaken):
+            self.assertEqual(payroll_runs.compute(run_id).status, PayrollRun.RENDERING)
+
+        renders.render_payroll(job)
+        self.assertEqual(PayrollRun.objects.get(pk=run_id).status, PayrollRun.DONE)
+        # A duplicate worker arriving after the run finished leaves it done
+        path, _ = renders.render_payroll(job)
+        run = PayrollRun.objects.get(pk=run_id)
+        self.assertEqual((run.status, run.result_path), (PayrollRun.DONE, path))
+
+
+class FakeHTML:
+    def __init__(self, string, base_url=None):
+        self.string = string
+
+    def write_pdf(self, target):
+        with open(target, 'wb') as fh:
+            fh.write(b'%PDF-' + self.string.encode())
+
+
+class PayslipTests(TestCase):
+    def setUp(self):
+        self.month = datetime.date.today().replace(day=1)
+        self.company = synthetic.generate_company(0, "slip", random.Random(0), customers=3, employees=3,
+                                                  services=2, products=2, days=2, sales_per_day=4)
+        self.lines = payroll_engine.run(self.company, self.month)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name, PAYSLIP_WORKERS=1)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        patcher = mock.patch('companies.payslips.HTML', side_effect=FakeHTML)
+        self.html = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(company=self.company, role='CompanyOwner'))
+
+    def test_payslip_data_matches_the_payroll_line(self):
+        line = self.lines[0]
+        payslip = EmployeePayroll.objects.get(employee_id=line['employee_id']).generate_payslip()
+
+        self.assertEqual(payslip['employee'], line['name'])
+        self.assertEqual(payslip['gross_pay'], line['gross'])
+        self.assertEqual(payslip['net_pay'], line['net'])
+
+    def test_only_missing_or_changed_payslips_are_rendered(self):
+        self.assertEqual(payslips.generate(self.company, self.month), {'rendered': 3, 'skipped': 0, 'failed': 0})
+        self.assertEqual(payslips.generate(self.company, self.month), {'rendered': 0, 'skipped': 3, 'failed': 0})
+        self.assertEqual(self.html.call_count, 3)
+
+        payroll = EmployeePayroll.objects.filter(employee__company=self.company).first()
+        payroll.bonuses += 100
+        payroll.save()
+        self.assertEqual(payslips.generate(self.company, self.month), {'rendered': 1, 'skipped': 2, 'failed': 0})
+        self.assertIn('PAYE', open(os.path.join(settings.MEDIA_ROOT, payroll.payslip.pdf_path)).read())
+
+    def test_failed_render_keeps_the_others(self):
+        self.html.side_effect = [FakeHTML('one'), ValueError("bad font"), FakeHTML('three')]
+
+        self.assertEqual(payslips.generate(self.company, self.month), {'rendered': 2, 'skipped': 0, 'failed': 1})
+        self.assertEqual(Payslip.objects.filter(payroll__employee__company=self.company).count(), 2)
+        written = [name for _, _, names in os.walk(settings.MEDIA_ROOT) for name in names]
+        self.assertEqual(len(written), 2)  # no temporary file left behind
+
+    @override_settings(RENDER_JOBS_EAGER=True, PAYSLIP_CHUNK_SIZE=2)
+    def test_batch_is_generated_by_chunk_jobs_and_downloaded_as_a_zip(self):
+        url = '/api/v1/companies/payroll/payslips'
+        self.assertEqual(self.client.get(url, {'month': f"{self.month:%Y-%m}"}).status_code, 409)
+
+        response = self.client.post(url, {'month': f"{self.month:%Y-%m}"}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], RenderJob.DONE)
+        self.assertEqual(response.data['result']['pending'], 3)
+        chunks = RenderJob.objects.filter(pk__in=response.data['result']['jobs'])
+        self.assertEqual(sorted(len(chunk.params['payrolls']) for chunk in chunks), [1, 2])
+        self.assertEqual(sum(chunk.result['rendered'] for chunk in chunks), 3)
+
+        download = self.client.get(url, {'month': f"{self.month:%Y-%m}"})
+        self.assertEqual(download.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(download.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 3)
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b'%PDF-'))
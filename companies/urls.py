@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested.routers import NestedDefaultRouter
-from .views import CompanyViewSet, EmployeeViewSet,EmployeeChoicesAPIView,CompanyPayrollAPI,CompanyRegistrationAPIView
+from .views import CompanyViewSet, EmployeeViewSet,EmployeeChoicesAPIView,CompanyPayrollAPI,CompanyRegistrationAPIView,PayrollRunView,PayrollRunRetryView,PayslipBatchAPI
 
 # Main router
 router = DefaultRouter()
@@ -17,5 +17,8 @@ urlpatterns = [
     path("", include(company_router.urls)),  # /api/v1/companies/<company_id>/employees/
     path("employee/choices", EmployeeChoicesAPIView.as_view(), name='employee-choices'),
     path("payroll/generate", CompanyPayrollAPI.as_view(), name='payroll'),
+    path("payroll/runs/<uuid:run_id>", PayrollRunView.as_view(), name='payroll-run'),
+    path("payroll/runs/<uuid:run_id>/retry", PayrollRunRetryView.as_view(), name='payroll-run-retry'),
+    path("payroll/payslips", PayslipBatchAPI.as_view(), name='payroll-payslips'),
     path('company/register/', CompanyRegistrationAPIView.as_view(), name='company_registration'),
 ]
@@ -18,7 +18,8 @@ from .models import (
     EmployeeDeduction,
     EmployeeCommission,
     EmployeeCommissionSetting,
-EmployeePayroll
+EmployeePayroll,
+    PayrollRun,
 )
 from .serializers import (
     CompanySerializer,
@@ -45,48 +46,14 @@ import os
 from django.template.loader import render_to_string
 from weasyprint import HTML
 from core.permissions import IsCompanyActive
+from reports import jobs
+from . import payroll_engine, payroll_runs, payslips
 User = get_user_model()
 import logging
 
 logger = logging.getLogger("csm")
 
 
-from decimal import Decimal
-
-
-def calculate_paye(taxable_income):
-    """
-    Enhanced PAYE calculation function with updated tax bands
-    """
-    if taxable_income <= 0:
-        return Decimal('0')
-
-    # Kenya PAYE tax bands (2024 rates)
-    tax_bands = [
-        (24000, Decimal('0.10')),  # 10% on first 24,000
-        (8333, Decimal('0.25')),  # 25% on next 8,333 (24,001 - 32,333)
-        (467667, Decimal('0.30')),  # 30% on next 467,667 (32,334 - 500,000)
-        (300000, Decimal('0.325')),  # 32.5% on next 300,000 (500,001 - 800,000)
-        (float('inf'), Decimal('0.35'))  # 35% on amount above 800,000
-    ]
-
-    total_tax = Decimal('0')
-    remaining_income = taxable_income
-
-    for band_limit, rate in tax_bands:
-        if remaining_income <= 0:
-            break
-
-        taxable_in_band = min(remaining_income, Decimal(str(band_limit)))
-        total_tax += taxable_in_band * rate
-        remaining_income -= taxable_in_band
-
-    # Personal relief deduction
-    personal_relief = Decimal('2400')  # Monthly personal relief
-    final_tax = max(total_tax - personal_relief, Decimal('0'))
-
-    return final_tax.quantize(Decimal('0.01'))
-
 class CompanyViewSet(viewsets.ModelViewSet):
     """
     View for managing companies. Only the CSM Super Admin can create companies.
@@ -301,8 +268,6 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         user = self.request.user
         company_id = self.kwargs.get("company_pk")
 
-        print("Company ID ", company_id)
-
         if user.role == "SuperAdmin":
             if company_id:
                 return Employee.objects.filter(company_id=company_id, is_deleted=False)
@@ -346,7 +311,7 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         employee_user = user_serializer.save()
-        print("Created User:", employee_user)
+        logger.debug("Created user %s for a new employee", employee_user.pk)
 
         # --- Step 2: Create the Employee and assign to the company ---
         data["user_id"] = employee_user.id
@@ -728,7 +693,7 @@ class EmployeeViewSet(viewsets.ModelViewSet):
                 pk=pk,
                 company_id=company_pk
             )
-            print("DATA. ",request.data)
+            logger.debug("Commission settings payload: %s", request.data)
             # Extract commissions data from request
             commissions_data = request.data.get('commissions', [])
 
@@ -909,7 +874,7 @@ class EmployeeChoicesAPIView(APIView):
         choices.append({"roles":roles})
         return Response(choices)
 def str_to_bool(value):
-    return str(value).lower() in ['true', '1', 'yes','false']
+    return str(value).lower() in ['true', '1', 'yes']
 def get_employee_deductions_for_month(employee, month_str):
     """
     Get deductions where both effective_month and end_month fall within the given YYYY-MM.
@@ -943,6 +908,7 @@ class CompanyPayrollAPI(APIView):
             company_id = request.data.get("companyId")
             month_str = request.data.get("month")  # Format: YYYY-MM
             include_unpaid_commissions = str_to_bool(request.data.get("include_unpaid_commissions", True))
+            dry_run = str_to_bool(request.data.get("dry_run", False))
 
             if not company_id or not month_str:
                 return Response({'status': 'error', 'message': 'Company ID and month are required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -953,186 +919,93 @@ class CompanyPayrollAPI(APIView):
                 return Response({'status': 'error', 'message': 'Invalid month format. Use YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                company = Company.objects.get(id=company_id)
+                # Only the caller's own company; another one is reported as not found
+                company = Company.objects.get(id=company_id, pk=request.user.company_id)
             except Company.DoesNotExist:
                 return Response({'status': 'error', 'message': 'Company not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            employees = Employee.objects.filter(company=company, is_deleted=False, is_active=True).select_related('user')
-
-            if not employees.exists():
+            if not Employee.objects.filter(company=company, is_deleted=False, is_active=True).exists():
                 return Response({'status': 'error', 'message': 'No active employees found for this company'}, status=status.HTTP_404_NOT_FOUND)
 
-            payroll_data = []
-            total_other_deductions = total_gross = total_nssf = total_shif = total_ahl = total_paye = total_net = Decimal('0')
-
-            for employee in employees:
-                base_salary = employee.salary or Decimal('0')
-
-                # Remunerations
-                remunerations = EmployeeRemuneration.objects.filter(
-                    employee=employee,
-                    effective_date__year=month.year,
-                    effective_date__month=month.month
-                )
-
-                employee_deductions = get_employee_deductions_for_month(employee,month_str)
+            if dry_run:
+                # Computed inline from reads only: nothing saved, locked or rendered
+                return Response(payroll_engine.preview(company, month, include_unpaid_commissions))
 
+            # Computed in chunks and rendered by the render worker, see companies.payroll_runs
+            run = payroll_runs.start(
+                company, month, include_unpaid_commissions, user=request.user,
+                base_url=request.build_absolute_uri('/'),
+                generated_by=request.user.get_full_name() if hasattr(request.user, 'get_full_name') else request.user.username,
+            )
+            return Response(payroll_runs.run_payload(run, request), status=status.HTTP_202_ACCEPTED)
 
-                allowances = {}
-                bonuses = Decimal('0')
-
-                for rem in remunerations:
-                    if rem.remuneration_type == "Bonus":
-                        bonuses += rem.amount
-                    else:
-                        allowances[rem.name or rem.remuneration_type] = float(rem.amount)
-                        base_salary += rem.amount
+        except Exception:
+            logger.exception("Could not queue the payroll of %s", request.data.get("month"))
+            return Response({'status': 'error', 'message': 'An error occurred while generating payroll'},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                # Commissions
-                if include_unpaid_commissions:
-                    commissions = EmployeeCommission.objects.filter(
-                        employee=employee,
-                        date_calculate__year=month.year,
-                        date_calculate__month=month.month,
-                        paid=False
-                    )
-                    commission_total = commissions.aggregate(total=Sum('commission_amount'))['total'] or Decimal('0')
-                    bonuses += commission_total
-
-                gross_salary = base_salary + bonuses
-
-                if gross_salary <= 0:
-                    continue
-
-                # Deductions
-                # Deductions
-                nssf = min(gross_salary * Decimal("0.06"), Decimal("1080")).quantize(Decimal("0.01"))
-                shif = max(gross_salary * Decimal("0.0275"), Decimal("300")).quantize(Decimal("0.01"))
-                ahl = (gross_salary * Decimal("0.015")).quantize(Decimal("0.01"))
-                taxable_income = gross_salary - (nssf + shif + ahl)
-                paye = calculate_paye(taxable_income).quantize(Decimal("0.01"))
-
-                deductions = {
-                    "NSSF": float(nssf),
-                    "SHIF": float(shif),
-                    "AHL": float(ahl),
-                    "PAYE": float(paye)
-                }
-
-                # Add voluntary/extra deductions
-                additional_deductions_total = Decimal('0')
-                for d in employee_deductions:
-                    label = d.deduction_type.title()
-                    amount = float(d.amount)
-                    deductions[label] = deductions.get(label, 0.0) + amount
-                    additional_deductions_total += Decimal(str(amount))  # ensure Decimal
-
-                # Compute net salary
-                net_salary = gross_salary - (nssf + shif + ahl + paye + additional_deductions_total)
-                # Save or update payroll
-                EmployeePayroll.objects.update_or_create(
-                    employee=employee,
-                    payment_month=month.month,
-                    payment_year=month.year,
-                    defaults={
-                        'basic_salary': employee.salary or Decimal('0'),
-                        'allowances': allowances or {},
-                        'bonuses': bonuses or Decimal('0'),
-                        'deductions': deductions or {},
-                        'payment_method': "bank_transfer",
-                        'account_number': employee.account_number or "",
-                        'bank_name': employee.bank_name or "",
-                        'is_paid': False
-                    }
-                )
 
-                # Mark commissions as paid
-                commissions.update(paid=True, date_paid=timezone.now())
-
-                employee_name = employee.user.get_full_name() or employee.user.username
-                payroll_data.append({
-                    'employee_id': employee.id,
-                    'name': employee_name,
-                    'position': employee.position or 'N/A',
-                    'employee_number': f"EMP{employee.id:04d}",
-                    'gross': gross_salary,
-                    'nssf': nssf,
-                    'shif': shif,
-                    'ahl': ahl,
-                    'taxable_income': taxable_income,
-                    'paye': paye,
-                    'other': additional_deductions_total,
-                    'net': net_salary
-                })
-
-                total_gross += gross_salary
-                total_nssf += nssf
-                total_shif += shif
-                total_ahl += ahl
-                total_paye += paye
-                total_net += net_salary
-                total_other_deductions+=additional_deductions_total
-
-            if not payroll_data:
-                return Response({'status': 'error', 'message': 'No payroll generated. Possibly already exists or no salaries found.'}, status=status.HTTP_404_NOT_FOUND)
-
-            payroll_data.sort(key=lambda x: x['name'])
-
-            summary = {
-                'total_employees': len(payroll_data),
-                'total_gross': total_gross,
-                'total_nssf': total_nssf,
-                'total_shif': total_shif,
-                'total_ahl': total_ahl,
-                'total_paye': total_paye,
-                'total_net': total_net,
-                'total_other_deductions': total_other_deductions,
-                'total_deductions': total_nssf + total_shif + total_ahl + total_paye,
-                'average_salary': total_gross / len(payroll_data),
-                'generation_date': timezone.now().strftime('%d %B %Y at %I:%M %p'),
-                'month_name': month.strftime("%B %Y"),
-                'month_short': month.strftime("%b %Y"),
-            }
+class PayrollRunView(APIView):
+    """Progress of a payroll run; result_url is set once it is done."""
+    permission_classes = [IsCompanyManager | IsCompanyOwner]
 
-            context = {
-                "company": company,
-                "month": summary['month_name'],
-                "month_year": month_str,
-                "payroll": payroll_data,
-                "summary": summary,
-                "generated_by": request.user.get_full_name() if hasattr(request.user, 'get_full_name') else request.user.username,
-                "current_date": timezone.now().strftime('%d %B %Y'),
-                "current_time": timezone.now().strftime('%I:%M %p'),
-            }
+    def get(self, request, run_id):
+        run = get_object_or_404(PayrollRun, pk=run_id, company=request.user.company)
+        return Response(payroll_runs.run_payload(run, request))
 
-            html_string = render_to_string("payroll_template.html", context)
-            output_dir = os.path.join(settings.MEDIA_ROOT, 'payrolls')
-            os.makedirs(output_dir, exist_ok=True)
 
-            timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"payroll_{company.id}_{month.strftime('%Y_%m')}_{timestamp}.pdf"
-            file_path = os.path.join(output_dir, filename)
+class PayrollRunRetryView(APIView):
+    """Queue a failed payroll run again, resuming after its last checkpoint."""
+    permission_classes = [IsCompanyManager | IsCompanyOwner]
 
-            HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf(file_path)
+    def post(self, request, run_id):
+        run = get_object_or_404(PayrollRun, pk=run_id, company=request.user.company)
+        if run.status != PayrollRun.FAILED:
+            return Response({'status': 'error', 'message': f'Only failed payroll runs can be retried, this one is {run.status}'},
+                            status=status.HTTP_409_CONFLICT)
+        run = payroll_runs.retry(
+            run, user=request.user, base_url=request.build_absolute_uri('/'),
+            generated_by=request.user.get_full_name() if hasattr(request.user, 'get_full_name') else request.user.username,
+        )
+        return Response(payroll_runs.run_payload(run, request), status=status.HTTP_202_ACCEPTED)
+
+class PayslipBatchAPI(APIView):
+    """
+    POST renders the payslip PDFs of a month in render jobs, one per chunk,
+    skipping unchanged ones; GET downloads them as one ZIP. See
+    companies.payslips.
+    """
+    permission_classes = [IsCompanyManager | IsCompanyOwner]
 
-            file_url = request.build_absolute_uri(os.path.join(settings.MEDIA_URL, 'payrolls', filename))
+    def _month(self, value):
+        try:
+            return datetime.datetime.strptime(value or '', "%Y-%m")
+        except ValueError:
+            return None
 
-            return Response({
-                'status': 'success',
-                'message': f'Payroll generated successfully for {summary["month_name"]}',
-                'pdf_url': file_url,
-                'filename': filename,
-                'summary': {
-                    'total_employees': summary['total_employees'],
-                    'total_gross': float(summary['total_gross']),
-                    'total_net': float(summary['total_net']),
-                    'generation_date': summary['generation_date']
-                }
-            }, status=status.HTTP_200_OK)
+    def post(self, request):
+        month = self._month(request.data.get("month"))
+        if month is None:
+            return Response({'status': 'error', 'message': 'Invalid month format. Use YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
+        job = jobs.enqueue('payslips', request.user.company, request.user, {
+            'month': month.strftime("%Y-%m"),
+            'base_url': request.build_absolute_uri('/'),
+        })
+        return Response(jobs.job_payload(job, request), status=status.HTTP_202_ACCEPTED)
 
-        except Exception as e:
-            return Response({'status': 'error', 'message': f'An error occurred while generating payroll: {str(e)}'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    def get(self, request):
+        month = self._month(request.query_params.get("month"))
+        if month is None:
+            return Response({'status': 'error', 'message': 'Invalid month format. Use YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
+        company = request.user.company
+        if not EmployeePayroll.objects.filter(employee__company=company, payment_year=month.year,
+                                              payment_month=month.month).exists():
+            return Response({'status': 'error', 'message': 'No payroll found for this month'}, status=status.HTTP_404_NOT_FOUND)
+        outdated = payslips.outdated(company, month)
+        if outdated:
+            return Response({'status': 'error', 'message': f'{outdated} payslip(s) are missing or out of date, generate them first'},
+                            status=status.HTTP_409_CONFLICT)
+        return payslips.stream_zip(company, month)
 
 # @method_decorator(csrf_exempt, name='dispatch')
 class CompanyRegistrationAPIView(APIView):
@@ -1148,10 +1021,7 @@ class CompanyRegistrationAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
         """Handle POST request for company registration."""
-        # Debug prints
-        print(f"Request method: {request.method}")
-        print(f"Request user: {request.user}")
-        print(f"Permission classes: {self.permission_classes}")
+        logger.debug("Company registration requested by %s", request.user)
 
         try:
             serializer = CompanyRegistrationSerializer(data=request.data)
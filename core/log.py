@@ -0,0 +1,87 @@
+"""
+Asynchronous, structured logging.
+
+``QueueFileHandler`` is what the request thread sees: ``emit`` only puts
+the record on an in-memory queue. A ``QueueListener`` thread formats the
+records as JSON lines and writes them to a size-rotated file (and, with
+``console=True``, to stderr), so formatting and I/O stay off the request
+path.
+
+``RequestIdFilter`` stamps every record with the id of the request being
+served. ``RequestIdMiddleware`` sets that id from the ``X-Request-ID`` header
+or a new uuid, and returns it in the response.
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with any ``extra=`` fields merged in."""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        payload.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class QueueFileHandler(logging.handlers.QueueHandler):
+    """Enqueue records; a listener thread writes them to a rotating file."""
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, console=False):
+        super().__init__(queue.SimpleQueue())
+        formatter = JSONFormatter()
+        targets = [logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8', delay=True)]
+        if console:
+            targets.append(logging.StreamHandler(sys.stderr))
+        for target in targets:
+            target.setFormatter(formatter)
+        self.listener = logging.handlers.QueueListener(self.queue, *targets, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Only merge the arguments, which may be mutated after the call;
+        # JSON formatting happens on the listener thread.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def stop(self):
+        """Flush the queue and stop the listener thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,172 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters and histograms live in the memory of each worker process. When
+``METRICS_DIR`` is set, every process also writes its snapshot to a file of
+its own in that directory, at most every ``METRICS_FLUSH_INTERVAL`` seconds
+and at exit, and ``/metrics`` sums the files of all processes, so any
+worker can answer a scrape for the whole server. Files of stopped workers
+are kept so counters never go backwards; clear the directory on deploy.
+
+Out of the box:
+
+* ``csm_http_requests_total`` / ``csm_http_request_duration_seconds`` per
+  URL name, method and status, recorded by ``RequestMetricsMiddleware``;
+* ``csm_subsystem_duration_seconds`` per subsystem and outcome, recorded by
+  ``timed()`` around WeasyPrint renders, SMTP sends, Daraja calls and
+  render/payroll jobs.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS = {
+    'csm_http_requests_total': ('counter', "HTTP requests by URL name, method and status."),
+    'csm_http_request_duration_seconds': ('histogram', "HTTP request latency by URL name and method."),
+    'csm_subsystem_duration_seconds': ('histogram', "Time spent in expensive subsystems, by outcome."),
+}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}  # key -> [per-bucket counts..., +Inf count, sum]
+        self._file = f"metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        self._flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(DEFAULT_BUCKETS, value)] += 1
+            histogram[-1] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def maybe_flush(self):
+        if getattr(settings, 'METRICS_DIR', None) and \
+                time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        self._flushed_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self.snapshot(), fh)
+        os.replace(tmp_path, os.path.join(directory, self._file))
+
+    def collect(self):
+        """Counters and histograms of this process plus those flushed by the other processes."""
+        counters, histograms = {}, {}
+        snapshots = [self.snapshot()]
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory:
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                if os.path.basename(path) == self._file:
+                    continue
+                try:
+                    with open(path) as fh:
+                        snapshots.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue  # removed or replaced while reading
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return counters, histograms
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(subsystem):
+    """Record the duration of the block (or decorated function) under ``subsystem``."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        observe('csm_subsystem_duration_seconds', time.perf_counter() - start, subsystem=subsystem, outcome=outcome)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def exposition():
+    """All metrics in the Prometheus text format, version 0.0.4."""
+    counters, histograms = REGISTRY.collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(DEFAULT_BUCKETS) + ['+Inf'], values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,160 @@
+"""
+Request instrumentation.
+
+``RequestIdMiddleware`` tags the request, and every log record written while
+serving it, with an id (core.log).
+
+``RequestMetricsMiddleware`` records the latency of every request in the
+metrics registry (core.metrics).
+
+``QueryInstrumentationMiddleware`` adds per-request SQL instrumentation,
+enabled with ``QUERY_INSTRUMENTATION=True``.
+
+Every statement run while the view executes goes through a database
+execute wrapper, which works with DEBUG off. Per request the middleware
+records the query count, total DB time, statements repeated with the same
+shape (the usual sign of an N+1) and the slowest statements. The numbers
+are returned in a ``Server-Timing`` header and logged on the ``csm`` logger
+as fields of the structured record (core.log).
+
+``QUERY_BUDGETS`` maps URL names to the number of queries the endpoint may
+run (``QUERY_BUDGET_DEFAULT`` for the others). Exceeding it is logged as an
+error, or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT`` is
+set, which makes tests fail on a regression.
+
+Queries run while a streaming response is consumed happen after the view
+returns and are not counted.
+"""
+import logging
+import re
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import log, metrics
+
+logger = logging.getLogger("csm")
+
+SLOWEST = 3
+DUPLICATES = 5
+SQL_PREVIEW = 300
+
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+class RequestIdMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Reuse the id of a proxy or client when it sent one, so log lines can be joined up
+        request.id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+        token = log.request_id.set(request.id)
+        try:
+            response = self.get_response(request)
+        finally:
+            log.request_id.reset(token)
+        response['X-Request-ID'] = request.id
+        return response
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # URL names rather than paths keep the label set bounded
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        metrics.observe('csm_http_request_duration_seconds', elapsed, view=view, method=request.method)
+        metrics.inc('csm_http_requests_total', view=view, method=request.method, status=response.status_code)
+        return response
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """The statement with IN lists and inlined numbers collapsed, so N+1 repeats compare equal."""
+    return _NUMBER.sub('N', _IN_LIST.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    """Database execute wrapper collecting the statements and their durations."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+    def stats(self):
+        shapes = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {
+            'queries': len(self.queries),
+            'db_ms': round(sum(duration for _, duration in self.queries), 2),
+            'duplicates': [
+                {'sql': sql[:SQL_PREVIEW], 'count': count}
+                for sql, count in shapes.most_common(DUPLICATES) if count > 1
+            ],
+            'slowest': [
+                {'sql': sql[:SQL_PREVIEW], 'ms': round(duration, 2)}
+                for sql, duration in sorted(self.queries, key=lambda query: -query[1])[:SLOWEST]
+            ],
+        }
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        stats = recorder.stats()
+        endpoint = request.resolver_match.view_name if request.resolver_match else None
+        response['Server-Timing'] = (
+            f'db;desc="{stats["queries"]} queries";dur={stats["db_ms"]:.2f}, '
+            f'dup;desc="{sum(row["count"] - 1 for row in stats["duplicates"])} duplicates", '
+            f'total;dur={total_ms:.2f}'
+        )
+        record = {
+            'event': 'request_queries',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            **stats,
+        }
+        logger.info("%s %s ran %s queries", request.method, request.path, stats['queries'], extra=record)
+
+        budget = settings.QUERY_BUDGETS.get(endpoint, settings.QUERY_BUDGET_DEFAULT)
+        if budget is not None and stats['queries'] > budget:
+            message = f"{request.method} {request.path} ({endpoint}) ran {stats['queries']} queries, budget {budget}"
+            logger.error(message, extra={**record, 'event': 'query_budget_exceeded', 'budget': budget})
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+        return response
@@ -0,0 +1,124 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering such as ``('-date', '-id')``.
+
+    Unlike OFFSET paging, and unlike DRF's CursorPagination which only seeks
+    on the first ordering field, every page is fetched with a
+    ``WHERE (date, id) < (last_date, last_id)`` condition, so a deep page
+    costs the same as the first one. The last field must be unique and all
+    fields must share the same direction. Cursors are opaque base64 tokens.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        descending = self.ordering[0].startswith('-')
+
+        reverse, position = self.decode_cursor(request, queryset.model)
+        if reverse:
+            order = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        else:
+            order = self.ordering
+        queryset = queryset.order_by(*order)
+
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position, descending != reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def seek_filter(self, position, descending):
+        """``(f1, f2, ...) < (v1, v2, ...)`` (or ``>``) expanded into ORed equality prefixes."""
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            prefix = {name: value for name, value in zip(self.fields[:i], position[:i])}
+            condition |= Q(**prefix, **{f'{field}__{lookup}': position[i]})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, reverse, obj):
+        payload = {'r': int(reverse), 'p': [getattr(obj, field) for field in self.fields]}
+        token = base64.urlsafe_b64encode(json.dumps(payload, cls=DjangoJSONEncoder).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+            return bool(payload.get('r')), position
+        except Exception:
+            raise ParseError(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
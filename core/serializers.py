@@ -16,7 +16,6 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ['id', 'email', 'username', 'password', 'role', 'company','first_name','last_name']
 
     def create(self, validated_data):
-        print("Validate Data ",validated_data)
         user = User.objects.create_user(
             email=validated_data['email'],
             password=validated_data['password'],
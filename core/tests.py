@@ -1,3 +1,153 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from companies.models import Company
+from core.models import CustomUser
+from . import log, metrics
+from .middleware import QueryBudgetExceeded, fingerprint
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_BUDGET_STRICT=False)
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        # Report responses are cached, see reports.response_cache
+        cache.clear()
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/reports/{self.company.pk}/chart-data/"
+
+    def test_server_timing_and_log_record(self):
+        with self.assertLogs('csm', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        self.assertRegex(response['Server-Timing'], r'^db;desc="\d+ queries";dur=[\d.]+, dup;desc="\d+ duplicates", total;dur=[\d.]+$')
+        record = logs.records[-1]
+        self.assertEqual(record.endpoint, 'chart-data')
+        self.assertEqual(record.status, 200)
+        self.assertGreater(record.queries, 0)
+        self.assertTrue(record.slowest)
+
+    def test_exceeded_budget_is_logged(self):
+        with self.settings(QUERY_BUDGETS={'chart-data': 0}), self.assertLogs('csm', 'ERROR') as logs:
+            self.client.get(self.url)
+        self.assertEqual(logs.records[0].event, 'query_budget_exceeded')
+
+    def test_strict_mode_fails_the_request(self):
+        with self.settings(QUERY_BUDGETS={'chart-data': 0}, QUERY_BUDGET_STRICT=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.url)
+
+    def test_disabled_by_default(self):
+        with self.settings(QUERY_INSTRUMENTATION=False):
+            response = APIClient().get(self.url)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_fingerprint_groups_n_plus_one_shapes(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "sale" WHERE "sale"."id" IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT * FROM "sale" WHERE "sale"."id" IN (%s) LIMIT 21'),
+        )
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.REGISTRY = metrics.Registry()
+        self.addCleanup(setattr, metrics, 'REGISTRY', metrics.REGISTRY)
+
+    def test_histogram_exposition(self):
+        with metrics.timed('smtp'):
+            pass
+        with self.assertRaises(ValueError), metrics.timed('smtp'):
+            raise ValueError
+        metrics.observe('csm_subsystem_duration_seconds', 0.3, subsystem='weasyprint', outcome='ok')
+
+        text = metrics.exposition()
+        self.assertIn('# TYPE csm_subsystem_duration_seconds histogram', text)
+        self.assertIn('csm_subsystem_duration_seconds_bucket{outcome="ok",subsystem="weasyprint",le="0.25"} 0', text)
+        self.assertIn('csm_subsystem_duration_seconds_bucket{outcome="ok",subsystem="weasyprint",le="0.5"} 1', text)
+        self.assertIn('csm_subsystem_duration_seconds_bucket{outcome="ok",subsystem="weasyprint",le="+Inf"} 1', text)
+        self.assertIn('csm_subsystem_duration_seconds_count{outcome="error",subsystem="smtp"} 1', text)
+
+    def test_workers_are_aggregated_through_the_directory(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            other_worker = metrics.Registry()
+            other_worker.inc('csm_http_requests_total', view='sale-list', method='GET', status=200)
+            other_worker.flush()
+            metrics.inc('csm_http_requests_total', view='sale-list', method='GET', status=200)
+
+            text = metrics.exposition()
+        self.assertIn('csm_http_requests_total{method="GET",status="200",view="sale-list"} 2', text)
+
+    def test_requests_are_recorded_and_exposed(self):
+        self.client.get('/api/v1/sales/sales/')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('csm_http_requests_total{method="GET",status="401",view="sale-list"} 1', response.content.decode())
+
+    def test_token_protects_the_endpoint(self):
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+
+class StructuredLoggingTests(TestCase):
+    def attach(self, path, **kwargs):
+        handler = log.QueueFileHandler(path, **kwargs)
+        handler.addFilter(log.RequestIdFilter())
+        logger = logging.getLogger('csm.tests')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler
+
+    def test_file_rotates_by_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.log')
+            logger, handler = self.attach(path, max_bytes=400, backup_count=2)
+            for i in range(10):
+                logger.info("filler %s", i)
+            handler.close()
+            self.assertTrue(os.path.exists(path + '.1'))
+            self.assertLessEqual(os.path.getsize(path), 400)
+
+    def test_json_fields(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.log')
+            logger, handler = self.attach(path)
+
+            token = log.request_id.set('abc123')
+            try:
+                items = ['a']
+                logger.warning("Sale %s has %s", 7, items, extra={'company': 3})
+                items.append('b')  # after the call, must not change the message
+            finally:
+                log.request_id.reset(token)
+            handler.close()
+
+            with open(path) as fh:
+                record = json.loads(fh.readline())
+        self.assertEqual(record['message'], "Sale 7 has ['a']")
+        self.assertEqual(record['level'], 'WARNING')
+        self.assertEqual(record['request_id'], 'abc123')
+        self.assertEqual(record['company'], 3)
+
+    def test_request_id_header(self):
+        response = self.client.get('/metrics', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        self.assertEqual(len(self.client.get('/metrics')['X-Request-ID']), 32)
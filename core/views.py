@@ -4,7 +4,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.http import HttpResponse
+from . import metrics
 from .serializers import RegisterSerializer, LoginSerializer,UserSerializer
 from .models import CustomUser
 from .permissions import IsCompanyActive
@@ -83,4 +86,12 @@ class LogoutView(APIView):
             return Response(
                 {"error": "Invalid token"}, 
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -19,6 +19,22 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'  # URL to access media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  #
+# Budget of the rendered invoice PDF cache in MEDIA_ROOT/invoices
+INVOICE_PDF_CACHE_MAX_FILES = int(os.getenv('INVOICE_PDF_CACHE_MAX_FILES', 1000))
+INVOICE_PDF_CACHE_MAX_BYTES = int(os.getenv('INVOICE_PDF_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+# PDF render jobs, executed by `manage.py run_render_worker`. Eager mode renders inside the request.
+RENDER_JOBS_EAGER = os.getenv('RENDER_JOBS_EAGER', 'False') == 'True'
+RENDER_JOB_MAX_ATTEMPTS = int(os.getenv('RENDER_JOB_MAX_ATTEMPTS', 3))
+# Employees computed and checkpointed per transaction of a payroll run, see companies/payroll_runs.py
+PAYROLL_CHUNK_SIZE = int(os.getenv('PAYROLL_CHUNK_SIZE', 100))
+# Processes rendering payslip PDFs, 0 for one per CPU, see companies/payslips.py
+PAYSLIP_WORKERS = int(os.getenv('PAYSLIP_WORKERS', 0))
+# Payslips rendered per render job when the API generates a month, see companies/renders.py
+PAYSLIP_CHUNK_SIZE = int(os.getenv('PAYSLIP_CHUNK_SIZE', 50))
+# Dashboard/report responses cached per company, see reports/response_cache.py
+REPORT_CACHE_TIMEOUT = int(os.getenv('REPORT_CACHE_TIMEOUT', 300))
+# Seconds identical concurrent report/render requests wait for the first one, see reports/singleflight.py
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', 30))
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -59,6 +75,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestIdMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -68,8 +86,29 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryInstrumentationMiddleware',
 ]
 
+# Per-request SQL counts/timings in Server-Timing headers and the log, see core/middleware.py
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', 'False') == 'True'
+# Queries allowed per URL name; exceeding one logs an error, or raises with QUERY_BUDGET_STRICT (tests)
+QUERY_BUDGETS = {
+    'sale-list': 10,
+    'invoice-list': 10,
+    'create_payment': 10,
+    'dashboard-insights': 5,
+    'chart-data': 4,
+    'top-data': 5,
+}
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT')) if os.getenv('QUERY_BUDGET_DEFAULT') else None
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+# Prometheus metrics at /metrics, see core/metrics.py. Workers share their numbers through METRICS_DIR.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# When set, scrapes must send "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 ROOT_URLCONF = 'csm.urls'
 
 TEMPLATES = [
@@ -122,6 +161,15 @@ DATABASES = {
 }
 
 
+# Local memory by default; with several worker processes point CACHE_BACKEND at
+# django.core.cache.backends.filebased.FileBasedCache so they share one cache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'csm'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -165,37 +213,34 @@ STATIC_URL = 'static/'
 # DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #
 # INSTALLED_APPS += ["payments"]
+# JSON lines written by a background thread, see core/log.py. Production runs at INFO.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', 'debug.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'True') == 'True'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {message} [Line: {lineno}]',
-            'style': '{',
-        },
-        'detailed': {
-            'format': '{levelname} {asctime} {module} {message} '
-                      '[File: {pathname}, Line: {lineno}, Function: {funcName}]',
-            'style': '{',
+    'filters': {
+        'request_id': {
+            '()': 'core.log.RequestIdFilter',
         },
     },
     'handlers': {
-        'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
-            'formatter': 'detailed',
-        },
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
-            'formatter': 'detailed',
+        'async': {
+            'class': 'core.log.QueueFileHandler',
+            'filename': LOG_FILE,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
+            'console': LOG_CONSOLE,
+            'filters': ['request_id'],
         },
     },
     'loggers': {
         'csm': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['async'],
+            'level': LOG_LEVEL,
             'propagate': True,
         },
     },
@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework import serializers
 
 from services.models import Service
@@ -13,6 +15,8 @@ CustomerAddress,
 AppointmentService
 )
 
+logger = logging.getLogger("csm")
+
 class CustomerAddressSerializer(serializers.ModelSerializer):
     formatted_address = serializers.ReadOnlyField()
 
@@ -48,7 +52,7 @@ class CustomerSerializer(serializers.ModelSerializer):
         return CustomerAddressSerializer(addresses, many=True).data
 
     def create(self, validated_data):
-        print("validated_data =", validated_data)
+        logger.debug("Customer create data: %s", validated_data)
         address_data = validated_data.pop("address", None)
         customer = Customer.objects.create(**validated_data)
 
@@ -246,13 +250,13 @@ class CustomerAppointmentSerializer(serializers.ModelSerializer):
                     services_list.append(service_data)
 
                 except Exception as e:
-                    print(f"Error processing individual service {as_obj.service.id}: {e}")
+                    logger.warning("Could not serialize service %s of appointment %s: %s", as_obj.service_id, obj.pk, e)
                     continue
 
             return services_list
 
         except Exception as e:
-            print(f"Error getting services: {e}")
+            logger.exception("Could not list the services of appointment %s", obj.pk)
             return []
 
     def get_service(self, obj):
@@ -267,7 +271,7 @@ class CustomerAppointmentSerializer(serializers.ModelSerializer):
             service_names = [as_obj.service.name for as_obj in appointment_services]
             return ", ".join(service_names)
         except Exception as e:
-            print(f"Error getting service names: {e}")
+            logger.exception("Could not list the service names of appointment %s", obj.pk)
             return ""
 
     def create(self, validated_data):
@@ -1,9 +1,14 @@
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import os
 from dotenv import load_dotenv
+
+from core import metrics
+
+logger = logging.getLogger("csm")
 load_dotenv()
 
 
@@ -71,7 +76,7 @@ def send_email(recipient_email, subject, body, html_body=None, attachments=None)
             message = mixed_message
 
         # Create SMTP session
-        with smtplib.SMTP(EMAIL_HOST, int(EMAIL_HOST_PORT)) as server:
+        with metrics.timed('smtp'), smtplib.SMTP(EMAIL_HOST, int(EMAIL_HOST_PORT)) as server:
             # Start TLS for security
             server.starttls()
 
@@ -81,11 +86,11 @@ def send_email(recipient_email, subject, body, html_body=None, attachments=None)
             # Send the email
             server.send_message(message)
 
-        print("Email sent successfully!")
+        logger.info("Email %r sent to %s", subject, recipient_email)
         return True
 
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.exception("Sending email %r to %s failed", subject, recipient_email)
         return False
 
 
@@ -1,3 +1,5 @@
+import logging
+
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.response import Response
@@ -18,6 +20,9 @@ from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from services.models import Service
 from django.db import transaction
+
+logger = logging.getLogger("csm")
+
 class CustomerViewSet(viewsets.ModelViewSet):
     """
     Manage Customer CRUD with role-based access:
@@ -361,7 +366,7 @@ class CustomerServiceRecordViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You cannot create a service record for a customer in a different company.")
 
     def create(self, request, *args, **kwargs):
-        print("Request data",request.data)
+        logger.debug("Service record payload: %s", request.data)
         try:
             response = super().create(request, *args, **kwargs)
             return Response({
@@ -0,0 +1,56 @@
+"""Render functions for the background job queue, see reports.jobs.RENDERERS."""
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from weasyprint import HTML
+
+from core import metrics
+from .models import InventoryItem
+
+
+def render_inventory_report(job):
+    company = job.company
+
+    # 1. Read date filters
+    start_date = job.params.get('start_date')
+    end_date = job.params.get('end_date')
+    # Parse dates safely
+    if start_date:
+        start_date = parse_date(start_date)
+    if end_date:
+        end_date = parse_date(end_date)
+
+    # 2. Get inventory items
+    inventory_items = InventoryItem.objects.filter(
+        company=company,
+        is_deleted=False
+    ).prefetch_related("transactions")
+
+    # 3. Filter transactions queryset manually and attach
+    for item in inventory_items:
+        transactions = item.transactions.all()
+        if start_date:
+            transactions = transactions.filter(timestamp__date__gte=start_date)
+        if end_date:
+            transactions = transactions.filter(timestamp__date__lte=end_date)
+        item.filtered_transactions = transactions  # attach filtered transactions manually
+
+    html_string = render_to_string("inventory-report.html", {
+        "inventory_items": inventory_items,
+        "company_name": company.name,
+        "user": job.requested_by,
+        "current_date": timezone.now(),
+    })
+
+    # 4. Generate and save PDF
+    filename = f"inventory_report_{timezone.now().strftime('%Y%m%d_%H%M%S')}_{job.id.hex[:8]}.pdf"
+    file_path = os.path.join("reports", filename)
+    full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with metrics.timed('weasyprint'):
+        HTML(string=html_string).write_pdf(full_path)
+    return file_path, {}
@@ -10,6 +10,7 @@ from django.template.loader import render_to_string
 from weasyprint import HTML
 from django.http import HttpResponse
 from companies.models import Company
+from reports import jobs
 from .models import InventoryCategory, InventoryItem
 from .serializers import InventoryCategorySerializer, InventoryItemSerializer
 import os
@@ -188,57 +189,10 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='generate-inventory-report')
     def generate_inventory_report(self, request):
-        company = request.user.company
-
-        # 1. Read date filters from query params
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        # Parse dates safely
-        if start_date:
-            start_date = parse_date(start_date)
-        if end_date:
-            end_date = parse_date(end_date)
-
-        # 2. Get inventory items
-        inventory_items = InventoryItem.objects.filter(
-            company=company,
-            is_deleted=False
-        ).prefetch_related("transactions")
-
-        # 3. Filter transactions inside template context (optional, depending on how you want to render)
-
-        # 4. OR, filter transactions queryset manually and attach
-        for item in inventory_items:
-            transactions = item.transactions.all()
-            if start_date:
-                transactions = transactions.filter(timestamp__date__gte=start_date)
-            if end_date:
-                transactions = transactions.filter(timestamp__date__lte=end_date)
-            item.filtered_transactions = transactions  # attach filtered transactions manually
-
-        current_date = timezone.now()
-
-        html_string = render_to_string("inventory-report.html", {
-            "inventory_items": inventory_items,
-            "company_name": company.name,
-            "user": request.user,
-            "current_date": current_date,
+        # Rendered by a worker, see inventory.renders.render_inventory_report
+        job = jobs.enqueue('inventory_report', request.user.company, request.user, {
+            'start_date': request.query_params.get('start_date'),
+            'end_date': request.query_params.get('end_date'),
         })
-
-        # 5. Generate PDF
-        pdf_file = HTML(string=html_string).write_pdf()
-
-        # 6. Save PDF
-        filename = f"inventory_report_{now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        file_path = os.path.join("reports", filename)
-        full_path = os.path.join(settings.MEDIA_ROOT, file_path)
-
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, 'wb') as f:
-            f.write(pdf_file)
-
-        # 7. Return report URL
-        report_url = request.build_absolute_uri(settings.MEDIA_URL + file_path)
-
-        return Response({"report_url": report_url})
+        return Response(jobs.job_payload(job, request), status=status.HTTP_202_ACCEPTED)
 
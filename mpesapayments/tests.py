@@ -1,3 +1,42 @@
+import json
+
 from django.test import TestCase
 
-# Create your tests here.
+
+class CallbackLoggingTests(TestCase):
+    """Callback payloads carry the payer's MSISDN, so INFO only gets the identifiers."""
+
+    def post(self, path, payload):
+        with self.assertLogs('csm', level='DEBUG') as logs:
+            self.client.post(path, json.dumps(payload), content_type='application/json')
+        return logs.records
+
+    def assert_phone_only_at_debug(self, records, phone):
+        info = [r.getMessage() for r in records if r.levelname != 'DEBUG']
+        debug = [r.getMessage() for r in records if r.levelname == 'DEBUG']
+        self.assertTrue(info)
+        self.assertFalse(any(phone in message for message in info))
+        self.assertTrue(any(phone in message for message in debug))
+
+    def test_stk_callback(self):
+        payload = {'Body': {'stkCallback': {
+            'CheckoutRequestID': 'ws_CO_1',
+            'ResultCode': 0,
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 150},
+                {'Name': 'PhoneNumber', 'Value': 254712345678},
+            ]},
+        }}}
+        records = self.post('/api/v1/payments/callback/', payload)
+
+        self.assert_phone_only_at_debug(records, '254712345678')
+        self.assertIn(
+            'M-Pesa callback for CheckoutRequestID ws_CO_1: result code 0, amount 150',
+            [r.getMessage() for r in records],
+        )
+
+    def test_paybill_confirmation_and_validation(self):
+        payload = {'TransID': 'QK123', 'TransAmount': '150.00', 'MSISDN': '254712345678'}
+        for path in ('/api/v1/payments/confirmation/', '/api/v1/payments/validation/'):
+            with self.subTest(path=path):
+                self.assert_phone_only_at_debug(self.post(path, payload), '254712345678')
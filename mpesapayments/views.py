@@ -1,5 +1,6 @@
 from time import timezone
 
+import logging
 import requests
 from django.conf import settings
 import json
@@ -10,18 +11,21 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 from rest_framework.views import APIView
 from sales_invoices.models import Payment
+from core import metrics
+
+logger = logging.getLogger("csm")
+
 def get_mpesa_token():
     """Fetches M-Pesa OAuth access token"""
     url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    response = requests.get(url, auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET))
+    with metrics.timed('daraja_oauth'):
+        response = requests.get(url, auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET))
 
     if response.status_code == 200:
-        print("Token Response ",json.dumps(response.json(), indent=4))
-
         return response.json().get('access_token')
+    logger.error("M-Pesa token request failed with status %s", response.status_code)
     return None
 def format_phone_number(number):
-    print("Number ",number)
     if number.startswith("0"):
         return "254" + number[1:]
     return number
@@ -53,8 +57,9 @@ def lipa_na_mpesa(phone_number, amount,invoice=None,sale=None):
         "TransactionDesc": "Payment"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-    print("Lipa Na Mpesa response ",response.json())
+    with metrics.timed('daraja_stk_push'):
+        response = requests.post(url, json=payload, headers=headers)
+    logger.info("STK push response: %s", response.json())
     response_dict = json.loads(json.dumps(response.json(), indent=4))
     payment = Payment.objects.create(
         checkoutrequest_id=response_dict.get('CheckoutRequestID'),
@@ -86,8 +91,9 @@ def query_stk_push_status(checkoutrequest_id):
         "CheckoutRequestID": checkoutrequest_id
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-    print("Query STK Push Status response ",json.dumps(response.json(), indent=4))
+    with metrics.timed('daraja_stk_query'):
+        response = requests.post(url, json=payload, headers=headers)
+    logger.info("STK push status response: %s", response.json())
     return json.loads(json.dumps(response.json(), indent=4))
 
 @csrf_exempt
@@ -95,13 +101,21 @@ def mpesa_callback(request):
     if request.method == "POST":
         try:
             data = json.loads(request.body)
-            print("Mpesa callback ",data)
+            # The raw payload carries the payer's phone number; keep it out of INFO
+            logger.debug("M-Pesa callback: %s", data)
             # Extract callback details
             callback = data.get("Body", {}).get("stkCallback", {})
             result_code = callback.get("ResultCode", None)
             checkoutrequestid = callback.get("CheckoutRequestID",None)
-
-            print("Processing payment with checkoutrequestid ", checkoutrequestid)
+            callback_amount = next(
+                (item.get("Value") for item in callback.get("CallbackMetadata", {}).get("Item", [])
+                 if item.get("Name") == "Amount"),
+                None,
+            )
+            logger.info("M-Pesa callback for CheckoutRequestID %s: result code %s, amount %s",
+                        checkoutrequestid, result_code, callback_amount)
+
+            logger.debug("Processing payment with CheckoutRequestID %s", checkoutrequestid)
             # Process only successful transactions
             if result_code == 0:
                 metadata = callback.get("CallbackMetadata", {}).get("Item", [])
@@ -127,7 +141,6 @@ def mpesa_callback(request):
                     transaction_date = datetime.strptime(str(transaction_date), "%Y%m%d%H%M%S")
 
                 # Save to Payment model
-                print("Saving transaction")
                 payment = Payment.objects.filter(checkoutrequest_id=checkoutrequestid).first()
 
                 payment.amount_paid = amount
@@ -137,7 +150,7 @@ def mpesa_callback(request):
                 payment.remarks = f"Payment from {phone_number}"
 
                 payment.save()
-                print("Saved transaction")
+                logger.info("Saved M-Pesa payment %s for CheckoutRequestID %s", payment.pk, checkoutrequestid)
 
                 # if payment:
                 #     PaymentInvoice.objects.create(
@@ -149,13 +162,12 @@ def mpesa_callback(request):
 
             else:
                 # Handle failed transactions (log them or save for further review)
-                print("Cleaning up transaction payment was not successful")
+                logger.warning("M-Pesa transaction %s failed with result code %s, cleaning up its payment", checkoutrequestid, result_code)
                 payment = Payment.objects.filter(checkoutrequest_id=checkoutrequestid).first()
 
                 payment.is_deleted = True
                 payment.deleted_at = timezone.now()
                 payment.save()
-                print("Successfully cleaned up transaction payment")
                 return JsonResponse({"ResultCode": 1, "ResultDesc": "Transaction failed"}, status=400)
                 # print("Successfully cleaned up transaction payment")
                 # return JsonResponse({"ResultCode": 1, "ResultDesc": "Transaction failed"}, status=400)
@@ -185,8 +197,9 @@ def register_mpesa_urls():
         "ValidationURL": f"{settings.MPESA_VALIDATION_URL}"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-    print("Register URLs response ",json.dumps(response.json(), indent=4))
+    with metrics.timed('daraja_register_urls'):
+        response = requests.post(url, json=payload, headers=headers)
+    logger.info("Register URLs response: %s", response.json())
     return response.json()
 
 
@@ -195,7 +208,9 @@ def mpesa_confirmation(request):
     """Handles Paybill confirmation callback"""
     if request.method == "POST":
         data = json.loads(request.body)
-        print("M-Pesa Confirmation Data:", data)
+        logger.debug("M-Pesa confirmation: %s", data)
+        logger.info("M-Pesa confirmation for transaction %s: amount %s",
+                    data.get("TransID"), data.get("TransAmount"))
 
         transaction = {
             "TransactionID": data.get("TransID"),
@@ -218,7 +233,9 @@ def mpesa_validation(request):
     """Handles Paybill validation callback"""
     if request.method == "POST":
         data = json.loads(request.body)
-        print("M-Pesa Validation Data:", data)
+        logger.debug("M-Pesa validation: %s", data)
+        logger.info("M-Pesa validation for transaction %s: amount %s",
+                    data.get("TransID"), data.get("TransAmount"))
 
         # Validate transaction (optional)
         # Example: Check if AccountNumber exists in your system
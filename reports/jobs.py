@@ -0,0 +1,171 @@
+"""
+Background PDF rendering jobs.
+
+API views call ``enqueue`` and return the job id straight away; the
+``run_render_worker`` management command claims queued jobs from the
+database and runs ``run_job`` in a pool of worker processes. The database is
+the only state shared between the web and worker processes.
+"""
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import metrics
+from . import singleflight
+from .models import RenderJob
+
+logger = logging.getLogger("csm")
+
+# Job kind -> callable(job) returning (path relative to MEDIA_ROOT, extra result dict)
+RENDERERS = {
+    'invoice_pdf': 'sales_invoices.renders.render_invoice_pdf',
+    'sales_report': 'sales_invoices.renders.render_sales_report',
+    'payroll': 'companies.renders.render_payroll',
+    'inventory_report': 'inventory.renders.render_inventory_report',
+    'payslips': 'companies.renders.render_payslips',
+}
+
+# Job kind -> callable(job, error) run when a job is failed without its
+# renderer having reported it, i.e. abandoned after RENDER_JOB_MAX_ATTEMPTS
+FAILURE_HOOKS = {
+    'payroll': 'companies.renders.payroll_failed',
+}
+
+
+def enqueue(kind, company, user=None, params=None):
+    """
+    Queue a render. With RENDER_JOBS_EAGER the job runs inline (development/tests).
+
+    A request identical to a job that is still queued or running (same
+    company, kind and params) gets that job back instead of a new one, so
+    repeated clicks and retries render the document once.
+    """
+    params = params or {}
+    key = f"render:{company.pk}:{kind}:{json.dumps(params, sort_keys=True, default=str)}"
+    (job, created), led = singleflight.coalesce(key, lambda: _find_or_create(kind, company, user, params))
+    if created and led and getattr(settings, 'RENDER_JOBS_EAGER', False):
+        RenderJob.objects.filter(pk=job.pk).update(status=RenderJob.RUNNING, started_at=timezone.now(), attempts=1)
+        run_job(job.pk, close_connections=False)
+        job.refresh_from_db()
+    return job
+
+
+def _find_or_create(kind, company, user, params):
+    pending = (
+        RenderJob.objects
+        .filter(company=company, kind=kind, params=params, status__in=[RenderJob.QUEUED, RenderJob.RUNNING])
+        .order_by('created_at')
+        .first()
+    )
+    if pending is not None:
+        return pending, False
+    job = RenderJob.objects.create(
+        kind=kind,
+        company=company,
+        requested_by=user if user and user.is_authenticated else None,
+        params=params,
+    )
+    return job, True
+
+
+def claim_jobs(limit, stale_after=None):
+    """
+    Atomically mark up to ``limit`` queued jobs as running and return their ids.
+
+    ``SKIP LOCKED`` lets several worker commands poll the same table without
+    handing out a job twice. Jobs left running longer than ``stale_after``
+    (a worker died mid-render) are put back in the queue first, or failed once
+    they have used up RENDER_JOB_MAX_ATTEMPTS.
+    """
+    now = timezone.now()
+    if stale_after:
+        max_attempts = getattr(settings, 'RENDER_JOB_MAX_ATTEMPTS', 3)
+        stale = RenderJob.objects.filter(
+            status=RenderJob.RUNNING, started_at__lt=now - timedelta(seconds=stale_after)
+        )
+        abandoned = list(stale.filter(attempts__gte=max_attempts).select_related('company'))
+        if abandoned:
+            error = 'Worker did not finish the render'
+            RenderJob.objects.filter(pk__in=[job.pk for job in abandoned], status=RenderJob.RUNNING).update(
+                status=RenderJob.FAILED, error=error, finished_at=now
+            )
+            for job in abandoned:
+                _job_failed(job, error)
+        stale.filter(attempts__lt=max_attempts).update(status=RenderJob.QUEUED)
+
+    with transaction.atomic():
+        ids = list(
+            RenderJob.objects.select_for_update(skip_locked=True)
+            .filter(status=RenderJob.QUEUED)
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if ids:
+            RenderJob.objects.filter(pk__in=ids).update(
+                status=RenderJob.RUNNING, started_at=now, attempts=F('attempts') + 1
+            )
+    return ids
+
+
+def _job_failed(job, error):
+    hook = FAILURE_HOOKS.get(job.kind)
+    if hook is None:
+        return
+    try:
+        import_string(hook)(job, error)
+    except Exception:
+        logger.exception("Failure hook of render job %s (%s) failed", job.pk, job.kind)
+
+
+def run_job(job_id, close_connections=True):
+    """Execute one claimed job. Runs inside a render worker process."""
+    try:
+        job = RenderJob.objects.select_related('company', 'requested_by').get(pk=job_id)
+        try:
+            renderer = import_string(RENDERERS[job.kind])
+            # job_payroll times whole payroll runs, job_* the other renders
+            with metrics.timed(f'job_{job.kind}'):
+                result_path, result = renderer(job)
+        except Exception as e:
+            logger.exception("Render job %s (%s) failed", job_id, job.kind)
+            RenderJob.objects.filter(pk=job_id).update(
+                status=RenderJob.FAILED, error=str(e), finished_at=timezone.now()
+            )
+            return RenderJob.FAILED
+
+        RenderJob.objects.filter(pk=job_id).update(
+            status=RenderJob.DONE, result_path=result_path, result=result or {}, error='',
+            finished_at=timezone.now(),
+        )
+        return RenderJob.DONE
+    finally:
+        if close_connections:
+            connections.close_all()
+
+
+def job_payload(job, request):
+    """Representation returned by the enqueueing endpoints and the status endpoint."""
+    payload = {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('render-job', args=[job.id])),
+        'result_url': None,
+        'result': job.result,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == RenderJob.DONE and job.result_path:
+        payload['result_url'] = request.build_absolute_uri(
+            settings.MEDIA_URL + job.result_path.replace(os.sep, '/')
+        )
+    return payload
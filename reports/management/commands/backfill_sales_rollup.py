@@ -0,0 +1,23 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+
+from reports.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from the sale items, for all companies or one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help="Only rebuild this company's rollup")
+        parser.add_argument('--start-date', type=datetime.date.fromisoformat, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = backfill(company_id=options['company'], start_date=options['start_date'],
+                        end_date=options['end_date'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} rollup rows in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,123 @@
+import datetime
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from companies.models import Company
+from customers.models import Customer
+from inventory.models import InventoryItem
+from sales_invoices.models import Sale, SaleItem
+from services.models import Service
+
+
+class _Rollback(Exception):
+    pass
+
+
+def legacy_dashboard_insights(company_id):
+    """The eight-query ``SaleManager.dashboard_insights`` used before the single aggregation."""
+    qs = Sale.objects.active().filter(company_id=company_id)
+    this_month = qs.filter(date__gte=now().date().replace(day=1))
+    services = qs.filter(items__type='service')
+    products = qs.filter(items__type='product')
+
+    return {
+        "total_sales": qs.count(),
+        "total_revenue": qs.aggregate(total=Sum('total'))['total'] or 0,
+        "monthly_sales": this_month.count(),
+        "monthly_revenue": this_month.aggregate(total=Sum('total'))['total'] or 0,
+        "total_services": services.count(),
+        "total_products": products.count(),
+        "total_service_sale_amount": services.aggregate(total=Sum('items__total'))['total'] or 0,
+        "total_product_sale_amount": products.aggregate(total=Sum('items__total'))['total'] or 0,
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark dashboard_insights on a synthetic company, eight queries vs one aggregation."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1_000_000, help="Number of synthetic sales")
+        parser.add_argument('--items-per-sale', type=int, default=3, help="Sale items per sale")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Sales inserted per batch")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path, the median latency is reported")
+        parser.add_argument('--keep', action='store_true', help="Commit the synthetic data instead of rolling back")
+
+    def handle(self, *args, **options):
+        results = []
+        try:
+            with transaction.atomic():
+                company = self._create_dataset(options['sales'], options['items_per_sale'], options['batch_size'])
+                with connection.cursor() as cursor:
+                    # Fresh planner statistics for the tables just filled
+                    if connection.vendor == 'postgresql':
+                        cursor.execute('ANALYZE sales_invoices_sale, sales_invoices_saleitem')
+                for label, insights in (('before', legacy_dashboard_insights),
+                                        ('after', Sale.objects.dashboard_insights)):
+                    results.append((label,) + self._measure(insights, company.pk, options['repeat']))
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'path':>7} {'queries':>8} {'median ms':>10}")
+        for label, queries, latency, data in results:
+            self.stdout.write(f"{label:>7} {queries:>8} {latency:>10.2f}")
+        before, after = results[0][3], results[1][3]
+        for key in after:
+            if before[key] != after[key]:
+                # total_services/total_products counted join rows before, see SaleManager.dashboard_insights
+                self.stdout.write(f"  {key}: before={before[key]} after={after[key]}")
+
+    def _measure(self, insights, company_id, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                data = insights(company_id=company_id)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(ctx.captured_queries), statistics.median(timings), data
+
+    def _create_dataset(self, sales, items_per_sale, batch_size):
+        tag = uuid.uuid4().hex[:8]
+        company = Company.objects.create(
+            name=f"Benchmark {tag}", email=f"bench-{tag}@example.com", phone=tag,
+            address="-", subscription_fee=0, is_active=True,
+        )
+        customer = Customer.objects.create(company=company, full_name="Bench Customer",
+                                           email=f"cust-{tag}@example.com", phone=tag)
+        service = Service.objects.create(company=company, name="Service", price=500)
+        product = InventoryItem.objects.create(company=company, name="Product", quantity=10 ** 6,
+                                               buying_unit_price=50, selling_unit_price=100)
+
+        # Even items are services, odd ones products; the stored sale total matches its items.
+        prices = [500 if i % 2 == 0 else 100 for i in range(items_per_sale)]
+        today = datetime.date.today()
+        created = 0
+        while created < sales:
+            size = min(batch_size, sales - created)
+            batch = Sale.objects.bulk_create([
+                Sale(company=company, customer=customer, total=sum(prices), subtotal=sum(prices))
+                for _ in range(size)
+            ])
+            # date is auto_now_add, so each batch is moved one day further back afterwards.
+            Sale.objects.filter(pk__in=[sale.pk for sale in batch]).update(
+                date=today - datetime.timedelta(days=created // batch_size)
+            )
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sale, type='service', service=service, amount=price, subtotal=price, total=price)
+                if i % 2 == 0 else
+                SaleItem(sale=sale, type='product', product=product, amount=price, subtotal=price, total=price)
+                for sale in batch
+                for i, price in enumerate(prices)
+            ], batch_size=batch_size)
+            created += size
+            self.stdout.write(f"\rCreated {created}/{sales} sales", ending='')
+        self.stdout.write('')
+        return company
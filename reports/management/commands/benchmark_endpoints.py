@@ -0,0 +1,190 @@
+import datetime
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from companies.models import Company
+from core.models import CustomUser
+from sales_invoices.models import Invoice, Sale, SaleItem
+from reports import response_cache
+from reports.synthetic import NAME_PREFIX
+
+
+class _Rollback(Exception):
+    pass
+
+
+def endpoints(company, today):
+    """(name, method, path, data) of the hot endpoints, for ``company``."""
+    month_ago = today - datetime.timedelta(days=30)
+    last_month = (today.replace(day=1) - datetime.timedelta(days=1)).strftime('%Y-%m')
+    return [
+        ('sales_list', 'get', '/api/v1/sales/sales/', None),
+        ('invoices_list', 'get', '/api/v1/sales/invoices/', None),
+        ('payments_list', 'get', '/api/v1/sales/payments/', None),
+        ('sales_export_csv', 'get', '/api/v1/sales/sales/generate-sales-report/',
+         {'format': 'csv', 'start_date': month_ago.isoformat(), 'end_date': today.isoformat()}),
+        ('dashboard_insights', 'get', f'/api/v1/reports/{company.pk}/dashboard-insights/', None),
+        ('chart_data_year', 'get', f'/api/v1/reports/{company.pk}/chart-data/', {'time_filter': '1_year'}),
+        ('top_data_year', 'get', f'/api/v1/reports/{company.pk}/top-data/', {'time_filter': 'this_year'}),
+        ('payroll', 'post', '/api/v1/companies/payroll/generate',
+         {'companyId': company.pk, 'month': last_month}),
+        ('payroll_preview', 'post', '/api/v1/companies/payroll/generate',
+         {'companyId': company.pk, 'month': last_month, 'dry_run': True}),
+    ]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Drive the hot API endpoints through the DRF test client against a (synthetic) company and "
+            "record latency percentiles, query counts and peak memory as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help="Company id, defaults to the latest synthetic company")
+        parser.add_argument('--repeat', type=int, default=20, help="Measured requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests per endpoint")
+        parser.add_argument('--only', help="Comma separated endpoint names to run")
+        parser.add_argument('--warm-cache', action='store_true',
+                            help="Keep the report response cache between requests instead of clearing it")
+        parser.add_argument('--output', default='benchmark.json', help="Where to write the JSON results")
+        parser.add_argument('--compare', help="Earlier results file to print the differences against")
+
+    def handle(self, *args, **options):
+        company = self._company(options['company'])
+        user = CustomUser.objects.filter(company=company, role='CompanyOwner').first()
+        if user is None:
+            raise CommandError(f"Company {company.pk} has no CompanyOwner user to authenticate as")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        selected = endpoints(company, datetime.date.today())
+        if options['only']:
+            names = set(options['only'].split(','))
+            selected = [endpoint for endpoint in selected if endpoint[0] in names]
+
+        results = {}
+        # Payroll renders inline so its cost is part of the request; every
+        # request is rolled back and its files go to a scratch MEDIA_ROOT, so
+        # each repetition does the same work and the company is left as it was.
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(RENDER_JOBS_EAGER=True, MEDIA_ROOT=media_root):
+            for name, method, path, data in selected:
+                self.stdout.write(f"\r{name:<24}", ending='')
+                results[name] = self._measure(client, company, method, path, data, options)
+        self.stdout.write('')
+
+        report = {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'company': company.pk,
+            'dataset': {
+                'sales': Sale.objects.filter(company=company).count(),
+                'sale_items': SaleItem.objects.filter(sale__company=company).count(),
+                'invoices': Invoice.objects.filter(company=company).count(),
+            },
+            'repeat': options['repeat'],
+            'warm_cache': options['warm_cache'],
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)['endpoints']
+        self._print(results, baseline)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _company(self, company_id):
+        companies = Company.objects.all()
+        if company_id:
+            companies = companies.filter(pk=company_id)
+        else:
+            companies = companies.filter(name__startswith=f"{NAME_PREFIX} ").order_by('-pk')
+        company = companies.first()
+        if company is None:
+            raise CommandError("No company to benchmark, run generate_synthetic_data or pass --company")
+        return company
+
+    def _request(self, client, method, path, data):
+        """Send one request and read its whole body; returns (response, elapsed ms)."""
+        start = time.perf_counter()
+        if method == 'post':
+            response = client.post(path, data, format='json')
+        else:
+            response = client.get(path, data)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response, (time.perf_counter() - start) * 1000
+
+    def _measure(self, client, company, method, path, data, options):
+        timings, queries, peaks, statuses = [], [], [], set()
+        for run in range(options['warmup'] + options['repeat']):
+            if not options['warm_cache']:
+                # Only the company's report responses, not the whole cache
+                response_cache.bump_version(company.pk)
+            tracemalloc.start()
+            try:
+                with CaptureQueriesContext(connection) as ctx:
+                    try:
+                        with transaction.atomic():
+                            response, elapsed = self._request(client, method, path, data)
+                            raise _Rollback
+                    except _Rollback:
+                        pass
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            if run < options['warmup']:
+                continue
+            timings.append(elapsed)
+            queries.append(len(ctx.captured_queries))
+            peaks.append(peak)
+            statuses.add(response.status_code)
+
+        return {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p90_ms': round(percentile(timings, 90), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'max_ms': round(max(timings), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries': max(queries),
+            'peak_memory_kib': round(max(peaks) / 1024, 1),
+            'status_codes': sorted(statuses),
+        }
+
+    def _print(self, results, baseline):
+        self.stdout.write(f"{'endpoint':<24} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>10}")
+        for name, result in results.items():
+            line = (f"{name:<24} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                    f"{result['queries']:>8} {result['peak_memory_kib']:>10.1f}")
+            before = baseline.get(name)
+            if before:
+                change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line += f"   p50 {change:+.0f}%, queries {result['queries'] - before['queries']:+d}"
+            self.stdout.write(line)
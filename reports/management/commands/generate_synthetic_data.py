@@ -0,0 +1,54 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from companies.models import EmployeeCommission
+from customers.models import Customer
+from sales_invoices.models import Invoice, Payment, Sale, SaleItem
+from reports.synthetic import generate_company
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic companies with years of sales, invoices, payments and commissions for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=3, help="Number of companies")
+        parser.add_argument('--customers', type=int, default=200, help="Customers (with one vehicle each) per company")
+        parser.add_argument('--employees', type=int, default=10, help="Employees per company")
+        parser.add_argument('--services', type=int, default=10, help="Services per company")
+        parser.add_argument('--products', type=int, default=20, help="Inventory items per company")
+        parser.add_argument('--days', type=int, default=3 * 365, help="Days of sales history, ending today")
+        parser.add_argument('--sales-per-day', type=int, default=20, help="Average sales per company and day")
+        parser.add_argument('--items-per-sale', type=int, default=2, help="Average items per sale")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed gives the same data")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Unique per run so datasets can be generated next to each other
+        tag = uuid.uuid4().hex[:6]
+        start = time.perf_counter()
+
+        companies = []
+        for index in range(options['companies']):
+            company = generate_company(
+                index, tag, rng,
+                customers=options['customers'], employees=options['employees'],
+                services=options['services'], products=options['products'], days=options['days'],
+                sales_per_day=options['sales_per_day'], items_per_sale=options['items_per_sale'],
+                log=lambda message: self.stdout.write(f"\r{message}", ending=''),
+            )
+            companies.append(company)
+            self.stdout.write('')
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{company.name} (id {company.pk}): "
+                f"{Customer.objects.filter(company=company).count()} customers, "
+                f"{Sale.objects.filter(company=company).count()} sales, "
+                f"{SaleItem.objects.filter(sale__company=company).count()} items, "
+                f"{Invoice.objects.filter(company=company).count()} invoices, "
+                f"{Payment.objects.filter(paymentinvoice__invoice__company=company).count()} payments, "
+                f"{EmployeeCommission.objects.filter(employee__company=company).count()} commissions"
+            ))
+        self.stdout.write(f"Generated {len(companies)} companies in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,50 @@
+import multiprocessing
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from reports.jobs import claim_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued PDF render jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of render processes")
+        parser.add_argument('--max-jobs-per-worker', type=int, default=50,
+                            help="Replace a render process after this many jobs to bound WeasyPrint memory growth")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Requeue jobs that have been running for longer than this many seconds")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is drained")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        # Spawned processes start without the parent's database connections;
+        # django.setup() runs before any job is unpickled in the child.
+        context = multiprocessing.get_context('spawn')
+        connections.close_all()
+
+        self.stdout.write(f"Render worker started with {workers} processes")
+        with context.Pool(workers, initializer=django.setup,
+                          maxtasksperchild=options['max_jobs_per_worker']) as pool:
+            in_flight = []
+            try:
+                while True:
+                    in_flight = [result for result in in_flight if not result.ready()]
+                    free = workers - len(in_flight)
+                    job_ids = claim_jobs(free, stale_after=options['stale_after']) if free else []
+                    for job_id in job_ids:
+                        in_flight.append(pool.apply_async(run_job, (job_id,)))
+
+                    if options['once'] and not job_ids and not in_flight:
+                        break
+                    if not job_ids:
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                # Unfinished jobs stay running and are requeued by --stale-after.
+                pool.terminate()
+        self.stdout.write(self.style.SUCCESS("Render worker stopped"))
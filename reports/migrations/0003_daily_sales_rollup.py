@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_rename_effective_month_employeeremuneration_effective_date'),
+        ('inventory', '0001_initial'),
+        ('reports', '0002_renderjob'),
+        ('services', '0002_service_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('type', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='companies.company')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventory.inventoryitem')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='services.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'date'], name='dailysalesrollup_company_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='renderjob',
+            name='kind',
+            field=models.CharField(choices=[('invoice_pdf', 'Invoice PDF'), ('sales_report', 'Sales Report'), ('payroll', 'Payroll'), ('inventory_report', 'Inventory Report'), ('payslips', 'Payslips')], max_length=30),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from companies.models import Company
 
@@ -9,3 +11,71 @@ class Report(models.Model):
 
     def __str__(self):
         return f"Report {self.id} - {self.report_type}"
+
+
+class RenderJob(models.Model):
+    """A PDF render queued by an API request and executed by the run_render_worker command."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('invoice_pdf', 'Invoice PDF'),
+        ('sales_report', 'Sales Report'),
+        ('payroll', 'Payroll'),
+        ('inventory_report', 'Inventory Report'),
+        ('payslips', 'Payslips'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="render_jobs")
+    requested_by = models.ForeignKey('core.CustomUser', on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    result_path = models.CharField(max_length=255, blank=True)  # relative to MEDIA_ROOT
+    result = models.JSONField(default=dict)  # extra output, e.g. payroll summary
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='renderjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"RenderJob {self.id} - {self.kind} ({self.status})"
+
+
+class DailySalesRollup(models.Model):
+    """
+    Sale items of non-deleted sales summed per company, day and service/product.
+
+    Kept current by reports.rollups; charts and top-N lists read these rows
+    instead of scanning SaleItem.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="daily_sales")
+    date = models.DateField()
+    type = models.CharField(max_length=10)  # SaleItem.type
+    service = models.ForeignKey('services.Service', on_delete=models.CASCADE, blank=True, null=True)
+    product = models.ForeignKey('inventory.InventoryItem', on_delete=models.CASCADE, blank=True, null=True)
+    count = models.PositiveIntegerField(default=0)  # number of sale items
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'date'], name='dailysalesrollup_company_date'),
+        ]
+
+    def __str__(self):
+        return f"DailySalesRollup {self.company_id} {self.date} {self.type}"
@@ -0,0 +1,91 @@
+"""
+Per-company cache of the dashboard and report responses.
+
+Every company has a data version in the default cache. Saving or deleting
+one of its sales, sale items, invoices or payments bumps the version once the
+transaction commits (reports.signals, plus explicit calls on the bulk paths
+that send no signals). Responses are cached under the company, the version,
+the view, the query parameters and the current date, since periods such as
+``this_month`` are relative to today. A bump therefore orphans every cached
+response of the company; the orphans expire after ``REPORT_CACHE_TIMEOUT``.
+
+The ETag is derived from the same key, so an ``If-None-Match`` that still
+matches is answered with 304 before anything is computed or read. Concurrent
+misses of the same key are coalesced (reports.singleflight): one request
+computes, the others wait for it and read its result.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import singleflight
+
+VERSION_KEY = 'reports:version:{}'
+RESPONSE_KEY = 'reports:response:{}:{}:{}'
+
+
+def data_version(company_id):
+    key = VERSION_KEY.format(company_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version evicted from the
+        # cache never comes back with a value responses were cached under.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(company_id):
+    try:
+        cache.incr(VERSION_KEY.format(company_id))
+    except ValueError:
+        data_version(company_id)
+
+
+def invalidate(company_ids):
+    """Bump the data version of the given companies once the current transaction commits."""
+    company_ids = set(company_ids) - {None}
+    if company_ids:
+        transaction.on_commit(lambda: [bump_version(company_id) for company_id in company_ids])
+
+
+def cached_response(request, name, company_id, compute):
+    """
+    Response for report ``name`` of ``company_id``; ``compute()`` returns its data.
+
+    The data is computed only when neither the client (ETag) nor the cache
+    holds the current version of it.
+    """
+    version = data_version(company_id)
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    digest = hashlib.sha256(
+        json.dumps([name, str(company_id), timezone.localdate().isoformat(), params]).encode()
+    ).hexdigest()[:32]
+    etag = f'"{company_id}-{version}-{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = RESPONSE_KEY.format(company_id, version, digest)
+    data = cache.get(key)
+    if data is None:
+        data, _ = singleflight.coalesce(key, lambda: _compute_once(key, compute))
+    return Response(data, headers=headers)
+
+
+def _compute_once(key, compute):
+    # Another process may have stored it while this one waited for the lock
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, settings.REPORT_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,107 @@
+"""
+Maintenance of the DailySalesRollup table.
+
+A (company, day) bucket is rebuilt from its sale items whenever one of its
+sales or items changes, so the rollup cannot drift from SaleItem however
+the change was made. Rebuilding one bucket costs one day of one company's
+items, so it is deferred until the writing transaction commits and runs
+outside that transaction's locks. A transaction-scoped advisory lock per
+bucket keeps two rebuilds of the same day from interleaving their delete
+and insert; writers of other days of the company are not held up.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from sales_invoices.models import Sale, SaleItem
+from .models import DailySalesRollup
+
+BATCH_SIZE = 5000
+
+
+def _aggregated(items):
+    """Rollup rows for ``items``, grouped by company, day and service/product."""
+    rows = (
+        items.order_by()
+        .values('sale__company_id', 'sale__date', 'type', 'service_id', 'product_id')
+        .annotate(count=Count('id'), quantity=Sum('quantity'), total=Sum('total'))
+    )
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        yield DailySalesRollup(
+            company_id=row['sale__company_id'],
+            date=row['sale__date'],
+            type=row['type'],
+            service_id=row['service_id'],
+            product_id=row['product_id'],
+            count=row['count'],
+            quantity=row['quantity'] or 0,
+            total=row['total'] or 0,
+        )
+
+
+def _bulk_insert(rollups):
+    batch = []
+    for rollup in rollups:
+        batch.append(rollup)
+        if len(batch) >= BATCH_SIZE:
+            DailySalesRollup.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        DailySalesRollup.objects.bulk_create(batch)
+
+
+def refresh_days(days):
+    """Rebuild the rollup buckets of the given ``(company_id, date)`` pairs once the transaction commits."""
+    days = {(company_id, day) for company_id, day in days if company_id and day}
+    if not days:
+        return
+
+    # robust: the write has committed already, a bucket left behind is repaired by backfill
+    transaction.on_commit(lambda: _rebuild(days), robust=True)
+
+
+def _lock_buckets(days):
+    """Hold the advisory lock of each bucket until the transaction ends; PostgreSQL only."""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        # Sorted, so two rebuilds take their locks in the same order
+        for company_id, day in sorted(days):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [company_id, day.toordinal()])
+
+
+def _rebuild(days):
+    buckets = Q()
+    item_buckets = Q()
+    for company_id, day in days:
+        buckets |= Q(company_id=company_id, date=day)
+        item_buckets |= Q(sale__company_id=company_id, sale__date=day)
+
+    with transaction.atomic():
+        _lock_buckets(days)
+        DailySalesRollup.objects.filter(buckets).delete()
+        _bulk_insert(_aggregated(SaleItem.objects.filter(item_buckets, sale__is_deleted=False)))
+
+
+def refresh_for_sales(sale_ids):
+    """Rebuild the buckets the given sales fall in."""
+    refresh_days(Sale.objects.filter(pk__in=sale_ids).values_list('company_id', 'date'))
+
+
+def backfill(company_id=None, start_date=None, end_date=None):
+    """Rebuild every bucket in scope from scratch; returns the number of rollup rows written."""
+    rollups = DailySalesRollup.objects.all()
+    items = SaleItem.objects.filter(sale__is_deleted=False)
+    if company_id:
+        rollups = rollups.filter(company_id=company_id)
+        items = items.filter(sale__company_id=company_id)
+    if start_date:
+        rollups = rollups.filter(date__gte=start_date)
+        items = items.filter(sale__date__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(date__lte=end_date)
+        items = items.filter(sale__date__lte=end_date)
+
+    with transaction.atomic():
+        rollups.delete()
+        _bulk_insert(_aggregated(items))
+        return rollups.count()
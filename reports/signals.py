@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from sales_invoices.models import Sale, SaleItem, Invoice, Payment, PaymentInvoice, PaymentSale
+from . import response_cache, rollups
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def handle_sale_item_rollup(sender, instance, **kwargs):
+    rollups.refresh_for_sales([instance.sale_id])
+
+
+@receiver(post_save, sender=Sale)
+def handle_sale_rollup(sender, instance, created, update_fields=None, **kwargs):
+    # A new sale has no items yet; later saves may soft-delete it.
+    if created or (update_fields is not None and 'is_deleted' not in update_fields):
+        return
+    rollups.refresh_days([(instance.company_id, instance.date)])
+
+
+@receiver(post_delete, sender=Sale)
+def handle_sale_delete_rollup(sender, instance, **kwargs):
+    rollups.refresh_days([(instance.company_id, instance.date)])
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def handle_report_data_changed(sender, instance, **kwargs):
+    response_cache.invalidate([instance.company_id])
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def handle_sale_item_report_data_changed(sender, instance, **kwargs):
+    response_cache.invalidate(Sale.objects.filter(pk=instance.sale_id).values_list('company_id', flat=True))
+
+
+@receiver(post_save, sender=Payment)
+@receiver(pre_delete, sender=Payment)
+def handle_payment_report_data_changed(sender, instance, **kwargs):
+    # Payments belong to companies through the invoices and sales they pay;
+    # pre_delete, since the links are gone by post_delete.
+    invoices = PaymentInvoice.objects.filter(payment_id=instance.pk).values_list('invoice__company_id', flat=True)
+    sales = PaymentSale.objects.filter(payment_id=instance.pk).values_list('sale__company_id', flat=True)
+    response_cache.invalidate(set(invoices) | set(sales))
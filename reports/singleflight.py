@@ -0,0 +1,128 @@
+"""
+Coalescing of identical concurrent computations.
+
+``do(key, fn)`` runs ``fn`` at most once at a time per key within the
+process: threads that ask for the same key while it runs wait for it and
+share its result, or its exception. ``advisory_lock(key)`` does the same
+job across processes with a PostgreSQL session advisory lock; the leader
+publishes its result somewhere shared (the cache, the database) and the
+processes that waited on the lock read it from there. ``coalesce`` combines
+both, and tells its caller whether it ran ``fn`` or was handed another
+thread's result.
+
+Waiting is bounded by ``SINGLE_FLIGHT_TIMEOUT`` seconds. A caller that times
+out computes on its own rather than failing the request.
+"""
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger("csm")
+
+POLL_INTERVAL = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def _timeout(timeout):
+    return settings.SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+
+
+def do(key, fn, timeout=None):
+    """Return ``fn()``, sharing one in-flight call between the threads asking for ``key``."""
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if call.done.wait(_timeout(timeout)):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        logger.warning("single-flight wait for %s timed out, computing independently", key)
+        return fn()
+
+    try:
+        call.result = fn()
+        return call.result
+    except Exception as exc:
+        call.error = exc
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+def _lock_id(key):
+    """Signed 64-bit id of ``key`` for pg_advisory_lock."""
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(key, timeout=None):
+    """
+    Hold the PostgreSQL session advisory lock of ``key`` for the block.
+
+    Yields whether the lock was obtained: on timeout the block runs without
+    it. Other databases have no advisory locks and always yield False.
+    """
+    if connection.vendor != 'postgresql':
+        yield False
+        return
+
+    lock_id = _lock_id(key)
+    deadline = time.monotonic() + _timeout(timeout)
+    with connection.cursor() as cursor:
+        # Polled with pg_try_advisory_lock so a timeout does not abort an
+        # enclosing transaction the way lock_timeout would.
+        while True:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [lock_id])
+            if cursor.fetchone()[0]:
+                break
+            if time.monotonic() >= deadline:
+                logger.warning("advisory lock wait for %s timed out, computing independently", key)
+                yield False
+                return
+            time.sleep(POLL_INTERVAL)
+
+    try:
+        yield True
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id])
+
+
+def coalesce(key, fn, timeout=None):
+    """
+    ``do`` across threads, serialised across processes by the advisory lock.
+
+    ``fn`` must look for a result published by another process before
+    computing, since it runs once per process. Returns ``(result, led)``,
+    ``led`` being False for the threads that got the result of another
+    thread's call, so side effects of the result are left to its leader.
+    """
+    ran = []
+
+    def locked():
+        ran.append(True)
+        with advisory_lock(key, timeout):
+            return fn()
+
+    return do(key, locked, timeout), bool(ran)
@@ -0,0 +1,226 @@
+"""
+Synthetic multi-tenant data for load testing.
+
+``generate_company`` builds one tenant with an owner, employees with
+commission settings, customers with vehicles, services, inventory and
+``days`` of history: sales with items, employee assignments and
+commissions, monthly invoices per customer and payments for most of them.
+Everything is inserted with ``bulk_create``; dates that are ``auto_now_add``
+are moved back with one UPDATE per day or month. ``bulk_create`` sends no
+signals, so the stored totals, invoice sequences and the daily sales rollup
+are rebuilt at the end, the way the bulk code paths of the app do it.
+
+Data is drawn from ``random.Random(seed)``, so a seed reproduces a dataset.
+"""
+import datetime
+import random
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from companies.models import Company, Employee, EmployeeCommission, EmployeeCommissionSetting
+from customers.models import Customer, CustomerVehicle
+from inventory.models import InventoryItem
+from sales_invoices.models import (
+    Invoice, InvoiceSequence, Payment, PaymentInvoice, PaymentSale, Sale, SaleItem, SaleItemEmployee,
+)
+from services.models import Service
+from . import rollups
+
+User = get_user_model()
+
+NAME_PREFIX = "Synthetic"
+TAX_RATE = Decimal('16')
+COMMISSION_RATE = Decimal('10')
+CENT = Decimal('0.01')
+
+FIRST_NAMES = ["Amina", "Brian", "Cynthia", "David", "Esther", "Felix", "Grace", "Hassan", "Irene", "James"]
+LAST_NAMES = ["Otieno", "Mwangi", "Wanjiru", "Kamau", "Achieng", "Njoroge", "Mutua", "Chebet", "Kiprop", "Omondi"]
+SERVICES = ["Body Wash", "Interior Detailing", "Engine Wash", "Waxing", "Tyre Shine", "Vacuuming",
+            "Upholstery Cleaning", "Headlight Restoration", "Polishing", "Underbody Wash"]
+PRODUCTS = ["Car Shampoo", "Wax", "Air Freshener", "Tyre Gel", "Microfiber Cloth", "Glass Cleaner",
+            "Dashboard Polish", "Wiper Fluid", "Engine Degreaser", "Leather Conditioner"]
+MAKES = [("Toyota", "Axio"), ("Toyota", "Probox"), ("Nissan", "Note"), ("Mazda", "Demio"),
+         ("Subaru", "Forester"), ("Honda", "Fit"), ("Mitsubishi", "Outlander"), ("Isuzu", "D-Max")]
+
+
+def money(value):
+    return Decimal(value).quantize(CENT)
+
+
+def generate_company(index, tag, rng, customers=200, employees=10, services=10, products=20,
+                     days=365, sales_per_day=20, items_per_sale=2, invoiced_share=0.5,
+                     paid_share=0.8, deleted_share=0.02, end_date=None, log=None):
+    """Create one synthetic company with ``days`` of history ending at ``end_date``; returns it."""
+    log = log or (lambda message: None)
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+
+    with transaction.atomic():
+        company = Company.objects.create(
+            name=f"{NAME_PREFIX} {tag} {index}", email=f"synthetic-{tag}-{index}@example.com",
+            phone=f"{tag}{index:04d}", address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        User.objects.create_user(email=f"owner-{tag}-{index}@example.com", username=f"owner-{tag}-{index}",
+                                 password=None, company=company, role='CompanyOwner')
+        fixtures = _create_fixtures(company, tag, index, rng, customers, employees, services, products)
+
+        day = start_date
+        month_sales = []
+        while day <= end_date:
+            month_sales.extend(_create_day(company, day, rng, fixtures, sales_per_day, items_per_sale, deleted_share))
+            last_of_month = (day + datetime.timedelta(days=1)).month != day.month
+            if last_of_month or day == end_date:
+                _invoice_month(company, day, rng, month_sales, invoiced_share, paid_share)
+                log(f"{company.name}: {day:%Y-%m}")
+                month_sales = []
+            day += datetime.timedelta(days=1)
+
+        Sale.objects.filter(company=company).refresh_totals()
+        Invoice.objects.filter(company=company).refresh_totals()
+        rollups.backfill(company_id=company.pk)
+    return company
+
+
+def _create_fixtures(company, tag, index, rng, customers, employees, services, products):
+    employee_rows = []
+    for i in range(employees):
+        user = User.objects.create_user(
+            email=f"emp{i}-{tag}-{index}@example.com", username=f"emp{i}-{tag}-{index}", password=None,
+            company=company, first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+        )
+        employee_rows.append(Employee(
+            company=company, user=user, position="Attendant", salary=rng.randrange(20_000, 80_000, 500),
+            date_employed=datetime.date(2020, 1, 1), account_number=f"{rng.randrange(10 ** 9, 10 ** 10)}",
+            bank_name="Equity Bank",
+        ))
+    employee_objs = Employee.objects.bulk_create(employee_rows)
+
+    customer_objs = Customer.objects.bulk_create([
+        Customer(company=company, full_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                 email=f"customer{i}-{tag}-{index}@example.com", phone=f"07{i:08d}")
+        for i in range(customers)
+    ])
+    vehicles = CustomerVehicle.objects.bulk_create([
+        CustomerVehicle(customer=customer, make=make, model=model, year=rng.randrange(2005, 2024),
+                        plate_number=f"K{chr(65 + i % 26)}{chr(65 + i // 26 % 26)} {i % 1000:03d}X")
+        for i, customer in enumerate(customer_objs)
+        for make, model in [rng.choice(MAKES)]
+    ])
+    service_objs = Service.objects.bulk_create([
+        Service(company=company, name=f"{SERVICES[i % len(SERVICES)]} {i // len(SERVICES) or ''}".strip(),
+                price=rng.randrange(300, 3000, 50), duration_minutes=rng.randrange(15, 120, 15))
+        for i in range(services)
+    ])
+    product_objs = InventoryItem.objects.bulk_create([
+        InventoryItem(company=company, name=f"{PRODUCTS[i % len(PRODUCTS)]} {i // len(PRODUCTS) or ''}".strip(),
+                      quantity=10 ** 6, buying_unit_price=price, selling_unit_price=price * 2)
+        for i in range(products)
+        for price in [rng.randrange(50, 1000, 10)]
+    ])
+    EmployeeCommissionSetting.objects.bulk_create([
+        EmployeeCommissionSetting(employee=employee, service=service, commission_percentage=COMMISSION_RATE)
+        for employee in employee_objs for service in service_objs
+    ])
+    return {
+        'employees': employee_objs,
+        'customers': list(zip(customer_objs, vehicles)),
+        'services': service_objs,
+        'products': product_objs,
+    }
+
+
+def _create_day(company, day, rng, fixtures, sales_per_day, items_per_sale, deleted_share):
+    """Sales of one day with their items and commissions; returns (sale, customer_id, total) rows."""
+    count = rng.randint(sales_per_day // 2, sales_per_day * 3 // 2)
+    if not count:
+        return []
+    buyers = [rng.choice(fixtures['customers']) if rng.random() < 0.9 else (None, None) for _ in range(count)]
+    sales = Sale.objects.bulk_create([
+        Sale(company=company, customer=customer, vehicle=vehicle, is_deleted=rng.random() < deleted_share)
+        for customer, vehicle in buyers
+    ])
+    # date is auto_now_add
+    Sale.objects.filter(pk__in=[sale.pk for sale in sales]).update(date=day)
+
+    items, item_employees, sale_totals = [], [], defaultdict(Decimal)
+    for sale in sales:
+        for _ in range(rng.randint(1, items_per_sale * 2 - 1)):
+            if rng.random() < 0.7:
+                service = rng.choice(fixtures['services'])
+                item = SaleItem(sale=sale, type='service', service=service, quantity=1, amount=service.price)
+                employee = rng.choice(fixtures['employees'])
+            else:
+                product = rng.choice(fixtures['products'])
+                item = SaleItem(sale=sale, type='product', product=product, quantity=rng.randint(1, 3),
+                                amount=product.selling_unit_price)
+                employee = None
+            item.subtotal = money(Decimal(item.amount) * item.quantity)
+            item.tax_rate = TAX_RATE
+            item.tax_amount = money(item.subtotal * TAX_RATE / 100)
+            item.total = item.subtotal + item.tax_amount
+            sale_totals[sale.pk] += item.total
+            items.append(item)
+            item_employees.append(employee)
+    SaleItem.objects.bulk_create(items)
+
+    assigned = [(item, employee) for item, employee in zip(items, item_employees) if employee]
+    SaleItemEmployee.objects.bulk_create([
+        SaleItemEmployee(sale_item=item, employee=employee) for item, employee in assigned
+    ])
+    EmployeeCommission.objects.bulk_create([
+        EmployeeCommission(sale_item=item, employee=employee,
+                           commission_amount=money(Decimal(item.amount) * COMMISSION_RATE / 100))
+        for item, employee in assigned
+    ])
+    return [(sale, sale.customer_id, sale_totals[sale.pk]) for sale in sales if not sale.is_deleted]
+
+
+def _invoice_month(company, day, rng, month_sales, invoiced_share, paid_share):
+    """Invoice part of the month's sales per customer on its last day and pay most invoices."""
+    per_customer = defaultdict(list)
+    for sale, customer_id, total in month_sales:
+        if customer_id and rng.random() < invoiced_share:
+            per_customer[customer_id].append((sale.pk, total))
+    if not per_customer:
+        return
+
+    invoices = Invoice.objects.bulk_create([
+        Invoice(company=company, customer_id=customer_id, due_date=day + datetime.timedelta(days=30),
+                invoice_number=Invoice.number_for(day, number))
+        for number, customer_id in enumerate(per_customer, start=1)
+    ])
+    Invoice.objects.filter(pk__in=[invoice.pk for invoice in invoices]).update(date_created=day)
+    InvoiceSequence.objects.create(company=company, date=day, last_value=len(invoices))
+    Link = Invoice.sales.through
+    Link.objects.bulk_create([
+        Link(invoice_id=invoice.pk, sale_id=sale_id)
+        for invoice in invoices
+        for sale_id, _ in per_customer[invoice.customer_id]
+    ])
+    Sale.objects.filter(pk__in=[sale_id for rows in per_customer.values() for sale_id, _ in rows]).update(
+        is_invoiced=True
+    )
+
+    paid = [invoice for invoice in invoices if rng.random() < paid_share]
+    if not paid:
+        return
+    payments = Payment.objects.bulk_create([
+        Payment(amount_paid=sum(total for _, total in per_customer[invoice.customer_id]),
+                payment_method=rng.choice(Payment.PAYMENT_METHODS)[0])
+        for invoice in paid
+    ])
+    Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(date_paid=day)
+    PaymentInvoice.objects.bulk_create([
+        PaymentInvoice(payment=payment, invoice=invoice) for payment, invoice in zip(payments, paid)
+    ])
+    paid_sales = [
+        (payment, sale_id)
+        for payment, invoice in zip(payments, paid)
+        for sale_id, _ in per_customer[invoice.customer_id]
+    ]
+    PaymentSale.objects.bulk_create([PaymentSale(payment=payment, sale_id=sale_id) for payment, sale_id in paid_sales])
+    Invoice.objects.filter(pk__in=[invoice.pk for invoice in paid]).update(status='Paid')
+    Sale.objects.filter(pk__in=[sale_id for _, sale_id in paid_sales]).update(status='Paid')
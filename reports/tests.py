@@ -1,3 +1,445 @@
+import datetime
+import random
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from companies.models import Company
+from core.models import CustomUser
+from customers.models import Customer
+from inventory.models import InventoryItem
+from sales_invoices.models import Invoice, Sale, SaleItem
+from services.models import Service
+from . import jobs, queries, response_cache, rollups, singleflight, synthetic, views
+from .models import DailySalesRollup, RenderJob
+from .views import get_sales_data_by_company, get_top_services_and_products
+
+
+def fake_renderer(job):
+    return f"reports/{job.kind}.pdf", {'rows': 3}
+
+
+def failing_renderer(job):
+    raise ValueError("template missing")
+
+
+class RenderJobTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_claim_hands_out_each_job_once(self):
+        queued = [jobs.enqueue('sales_report', self.company, self.user, {'page': page}) for page in range(3)]
+
+        first = jobs.claim_jobs(2)
+        second = jobs.claim_jobs(2)
+
+        self.assertEqual(first, [queued[0].pk, queued[1].pk])
+        self.assertEqual(second, [queued[2].pk])
+        self.assertEqual(jobs.claim_jobs(2), [])
+        self.assertFalse(RenderJob.objects.exclude(status=RenderJob.RUNNING).exists())
+
+    def test_stale_jobs_are_requeued_until_attempts_run_out(self):
+        job = jobs.enqueue('sales_report', self.company, self.user)
+        with self.settings(RENDER_JOB_MAX_ATTEMPTS=2):
+            self.assertEqual(jobs.claim_jobs(1), [job.pk])
+            self.assertEqual(jobs.claim_jobs(1, stale_after=-1), [job.pk])
+            self.assertEqual(jobs.claim_jobs(1, stale_after=-1), [])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_identical_pending_requests_share_a_job(self):
+        first = jobs.enqueue('sales_report', self.company, self.user, {'start_date': '2025-01-01'})
+        again = jobs.enqueue('sales_report', self.company, None, {'start_date': '2025-01-01'})
+        other = jobs.enqueue('sales_report', self.company, self.user, {'start_date': '2025-02-01'})
+        self.assertEqual(again.pk, first.pk)
+        self.assertNotEqual(other.pk, first.pk)
+
+        jobs.claim_jobs(2)
+        self.assertEqual(jobs.enqueue('sales_report', self.company, self.user, {'start_date': '2025-01-01'}).pk, first.pk)
+        RenderJob.objects.filter(pk=first.pk).update(status=RenderJob.DONE)
+        self.assertNotEqual(jobs.enqueue('sales_report', self.company, self.user, {'start_date': '2025-01-01'}).pk, first.pk)
+
+    def test_status_endpoint_reports_result_url(self):
+        job = jobs.enqueue('sales_report', self.company, self.user, {'start_date': '2025-01-01'})
+        response = self.client.get(f"/api/v1/reports/jobs/{job.pk}/")
+        self.assertEqual(response.data['status'], RenderJob.QUEUED)
+        self.assertIsNone(response.data['result_url'])
+
+        jobs.claim_jobs(1)
+        with mock.patch.dict(jobs.RENDERERS, {'sales_report': 'reports.tests.fake_renderer'}):
+            self.assertEqual(jobs.run_job(job.pk, close_connections=False), RenderJob.DONE)
+
+        response = self.client.get(f"/api/v1/reports/jobs/{job.pk}/")
+        self.assertEqual(response.data['status'], RenderJob.DONE)
+        self.assertEqual(response.data['result_url'], "http://testserver/media/reports/sales_report.pdf")
+        self.assertEqual(response.data['result'], {'rows': 3})
+
+    def test_failed_render_records_the_error(self):
+        job = jobs.enqueue('inventory_report', self.company, self.user)
+        jobs.claim_jobs(1)
+        with mock.patch.dict(jobs.RENDERERS, {'inventory_report': 'reports.tests.failing_renderer'}):
+            self.assertEqual(jobs.run_job(job.pk, close_connections=False), RenderJob.FAILED)
+
+        response = self.client.get(f"/api/v1/reports/jobs/{job.pk}/")
+        self.assertEqual(response.data['status'], RenderJob.FAILED)
+        self.assertEqual(response.data['error'], "template missing")
+
+    def test_jobs_of_other_companies_are_hidden(self):
+        other = Company.objects.create(
+            name="Other", email="other@example.com", phone="0700000001",
+            address="Mombasa", subscription_fee=0, is_active=True,
+        )
+        job = jobs.enqueue('sales_report', other)
+        response = self.client.get(f"/api/v1/reports/jobs/{job.pk}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_report_endpoint_returns_a_job(self):
+        response = self.client.get("/api/v1/sales/sales/generate-sales-report/",
+                                   {'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+        self.assertEqual(response.status_code, 202)
+        job = RenderJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.kind, 'sales_report')
+        self.assertEqual(job.params, {'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+        self.assertEqual(job.requested_by, self.user)
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'total': len(calls)}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(singleflight.do('k', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(singleflight.do('k', compute)))
+                     for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'total': 1}] * 4)
+
+    def test_coalesce_reports_the_leader(self):
+        started, release = threading.Event(), threading.Event()
+
+        def create():
+            started.set()
+            release.wait(5)
+            return 'job', True
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(singleflight.coalesce('k', create)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(singleflight.coalesce('k', create)))
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in (leader, follower):
+            thread.join(5)
+
+        self.assertEqual(sorted(results, key=lambda result: result[1]),
+                         [(('job', True), False), (('job', True), True)])
+
+    def test_errors_are_shared_and_not_remembered(self):
+        with self.assertRaises(ValueError):
+            singleflight.do('k', mock.Mock(side_effect=ValueError("boom")))
+        self.assertEqual(singleflight.do('k', lambda: 2), 2)
+
+    def test_waiting_is_bounded(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'leader'
+
+        leader = threading.Thread(target=singleflight.do, args=('k', slow))
+        leader.start()
+        started.wait(5)
+        try:
+            self.assertEqual(singleflight.do('k', lambda: 'own', timeout=0.05), 'own')
+        finally:
+            release.set()
+            leader.join(5)
+
+
+class SalesReportQueryTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=100, buying_unit_price=50, selling_unit_price=100,
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        self.today = datetime.date.today()
+
+    def create_sales(self, count):
+        for _ in range(count):
+            sale = Sale.objects.create(company=self.company, customer=self.customer)
+            SaleItem.objects.create(sale=sale, type='service', service=self.service,
+                                    amount=500, quantity=2, tax_amount=80)
+            SaleItem.objects.create(sale=sale, type='product', product=self.product, amount=100)
+
+    def test_lines_are_read_in_one_query(self):
+        self.create_sales(5)
+        with self.assertNumQueries(1):
+            lines = list(queries.sales_report_lines(self.company, self.today, self.today))
+
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[0]['customer'], "Jane")
+        self.assertEqual(lines[0]['item_type'], "Service")
+        self.assertEqual(lines[0]['item_name'], "Wash")
+        self.assertEqual(lines[0]['vehicle'], "")
+        self.assertEqual(lines[0]['item_total'], Decimal('1000'))
+        self.assertEqual(lines[0]['item_grand_total'], Decimal('1080'))
+        self.assertEqual(lines[1]['item_name'], "Wax")
+
+    def test_totals_use_the_stored_tax(self):
+        self.create_sales(3)
+        totals = queries.empty_totals()
+        with self.assertNumQueries(1):
+            list(queries.tally(queries.sales_report_lines(self.company, self.today, self.today), totals))
+
+        self.assertEqual(totals['rows'], 6)
+        self.assertEqual(totals['total_amount'], Decimal('3300'))
+        self.assertEqual(totals['total_tax'], Decimal('240'))
+        self.assertEqual(totals['grand_total'], Decimal('3540'))
+
+    def test_empty_range_totals_are_zero(self):
+        totals = queries.empty_totals()
+        list(queries.tally(queries.sales_report_lines(self.company, self.today, self.today), totals))
+        self.assertEqual(totals['rows'], 0)
+        self.assertEqual(totals['grand_total'], 0)
+
+
+class DashboardInsightsTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=100, buying_unit_price=50, selling_unit_price=100,
+        )
+
+    def create_sale(self, services=0, products=0, **kwargs):
+        sale = Sale.objects.create(company=self.company, **kwargs)
+        for _ in range(services):
+            SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+        for _ in range(products):
+            SaleItem.objects.create(sale=sale, type='product', product=self.product, amount=100, total=100)
+        return sale
+
+    def test_one_query_and_no_join_duplicates(self):
+        self.create_sale(services=3, products=2)
+        self.create_sale(services=1)
+        self.create_sale(products=4)
+        self.create_sale()
+        self.create_sale(services=5, is_deleted=True)
+        last_month = self.create_sale(services=1)
+        Sale.objects.filter(pk=last_month.pk).update(date=datetime.date.today().replace(day=1) - datetime.timedelta(days=1))
+
+        with self.assertNumQueries(1):
+            data = Sale.objects.dashboard_insights(company_id=self.company.pk)
+
+        self.assertEqual(data['total_sales'], 5)
+        self.assertEqual(data['total_revenue'], Decimal('3100'))
+        self.assertEqual(data['monthly_sales'], 4)
+        self.assertEqual(data['monthly_revenue'], Decimal('2600'))
+        self.assertEqual(data['total_services'], 3)
+        self.assertEqual(data['total_products'], 2)
+        self.assertEqual(data['total_service_sale_amount'], Decimal('2500'))
+        self.assertEqual(data['total_product_sale_amount'], Decimal('600'))
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=100, buying_unit_price=50, selling_unit_price=100,
+        )
+        self.today = datetime.date.today()
+
+    def rollup(self):
+        return {
+            (row.type, row.count, row.quantity, row.total)
+            for row in DailySalesRollup.objects.filter(company=self.company, date=self.today)
+        }
+
+    def test_items_and_soft_deletes_keep_the_rollup_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = Sale.objects.create(company=self.company)
+            wash = SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+            SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+            SaleItem.objects.create(sale=sale, type='product', product=self.product, amount=100, quantity=3,
+                                    total=300)
+        self.assertEqual(self.rollup(), {('service', 2, Decimal('2'), Decimal('1000')),
+                                         ('product', 1, Decimal('3'), Decimal('300'))})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            wash.delete()
+        self.assertEqual(self.rollup(), {('service', 1, Decimal('1'), Decimal('500')),
+                                         ('product', 1, Decimal('3'), Decimal('300'))})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.is_deleted = True
+            sale.save()
+        self.assertEqual(self.rollup(), set())
+
+    def test_buckets_are_rebuilt_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            sale = Sale.objects.create(company=self.company)
+            SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+        self.assertEqual(self.rollup(), set())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.rollup(), {('service', 1, Decimal('1'), Decimal('500'))})
+
+    def test_backfill_matches_incremental_maintenance(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                sale = Sale.objects.create(company=self.company)
+                SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+        incremental = self.rollup()
+
+        DailySalesRollup.objects.all().delete()
+        self.assertEqual(rollups.backfill(company_id=self.company.pk), 1)
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_chart_and_top_lists_read_the_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = Sale.objects.create(company=self.company)
+            for _ in range(3):
+                SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+            SaleItem.objects.create(sale=sale, type='product', product=self.product, amount=100, total=100)
+
+        with self.assertNumQueries(1):
+            chart = get_sales_data_by_company(self.company.pk, time_filter='today')
+        self.assertEqual(chart, [{'period': self.today.strftime("%b %d"), 'service': 1500.0, 'product': 100.0}])
+
+        with self.assertNumQueries(2):
+            top = get_top_services_and_products(self.company.pk, 'today')
+        self.assertEqual(top['top_services'], [{'service__id': self.service.pk, 'service__name': "Wash",
+                                                'sale_count': 3}])
+        self.assertEqual(top['top_products'][0]['sale_count'], 1)
+
+
+class ReportResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/reports/{self.company.pk}/top-data/"
+
+    def add_item(self):
+        sale = Sale.objects.create(company=self.company)
+        SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=500, total=500)
+
+    def test_repeated_requests_are_served_from_the_cache(self):
+        first = self.client.get(self.url, {'time_filter': 'today'})
+        with mock.patch('reports.views.get_top_services_and_products',
+                        wraps=views.get_top_services_and_products) as compute:
+            second = self.client.get(self.url, {'time_filter': 'today'})
+            other_filter = self.client.get(self.url, {'time_filter': 'this_year'})
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertNotEqual(other_filter['ETag'], first['ETag'])
+        compute.assert_called_once()
+
+    def test_matching_etag_is_answered_with_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_sale_changes_invalidate_the_company_cache(self):
+        other = Company.objects.create(
+            name="Other", email="other@example.com", phone="0700000001",
+            address="Mombasa", subscription_fee=0, is_active=True,
+        )
+        other_version = response_cache.data_version(other.pk)
+        first = self.client.get(self.url, {'time_filter': 'today'})
+        self.assertEqual(first.data['top_services'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item()
+
+        response = self.client.get(self.url, {'time_filter': 'today'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['top_services'][0]['sale_count'], 1)
+        self.assertEqual(response_cache.data_version(other.pk), other_version)
+
+    def test_bump_survives_an_evicted_version(self):
+        version = response_cache.data_version(self.company.pk)
+        cache.delete(response_cache.VERSION_KEY.format(self.company.pk))
+        response_cache.bump_version(self.company.pk)
+        self.assertNotEqual(response_cache.data_version(self.company.pk), version)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_company_is_consistent(self):
+        company = synthetic.generate_company(0, "test", random.Random(1), customers=5, employees=2, services=3,
+                                             products=3, days=40, sales_per_day=4)
+
+        sales = Sale.objects.filter(company=company)
+        self.assertEqual(sales.dates('date', 'day').count(), 40)
+        for sale in sales.filter(is_deleted=False).prefetch_related('items')[:20]:
+            self.assertEqual(sale.total, sum(item.total for item in sale.items.all()))
+        invoice = Invoice.objects.filter(company=company).first()
+        self.assertEqual(invoice.total, sum(sale.total for sale in invoice.sales.all()))
+        self.assertTrue(Invoice.objects.filter(company=company, status='Paid').exists())
 
-# Create your tests here.
+        rollup = sorted(DailySalesRollup.objects.filter(company=company).values_list('date', 'type', 'total'))
+        rollups.backfill(company_id=company.pk)
+        self.assertEqual(
+            sorted(DailySalesRollup.objects.filter(company=company).values_list('date', 'type', 'total')), rollup
+        )
@@ -12,24 +12,38 @@ import calendar
 from django.db.models import Count, Q
 from datetime import timedelta, datetime
 from core.permissions import IsCompanyActive
+from rest_framework.exceptions import NotFound
+from .models import RenderJob, DailySalesRollup
+from . import jobs, response_cache
 
 class DashboardInsightsView(APIView):
     permission_classes = [IsAuthenticated,IsCompanyActive]  # optional
 
     def get(self, request, company_id):
+        return response_cache.cached_response(request, 'dashboard', company_id,
+                                              lambda: self.dashboard_data(company_id))
+
+    def dashboard_data(self, company_id):
         data = Sale.objects.dashboard_insights(company_id=company_id)
         top_data = get_top_services_and_products(company_id)
         serializer = DashboardInsightsSerializer(data)
-        # Get chart data
-        chart_data = get_sales_data_by_company(company_id)
 
         # Combine both into one response
-        response_data = {
+        return {
             **serializer.data,  # Unpack serializer data
             'top_data': top_data  # Add chart data
         }
+class RenderJobView(APIView):
+    """Status of a queued PDF render; result_url is set once the job is done."""
+    permission_classes = [IsAuthenticated,IsCompanyActive]
+
+    def get(self, request, job_id):
+        try:
+            job = RenderJob.objects.get(pk=job_id, company=request.user.company)
+        except RenderJob.DoesNotExist:
+            raise NotFound("Job not found")
+        return Response(jobs.job_payload(job, request), status=200)
 
-        return Response(response_data)
 class ChartDataView(APIView):
     permission_classes = [IsAuthenticated,IsCompanyActive]  # optional
     def get(self,request,company_id):
@@ -38,9 +52,10 @@ class ChartDataView(APIView):
         end_date = request.query_params.get('endDate',None)
         if not company_id:
             return  Response({"error":"There was an error fetching company data, try again"},status=400)
-        chart_data = get_sales_data_by_company(company_id=company_id,time_filter=time_filter,start_date=start_date,end_date=end_date)
-
-        return Response(chart_data,status=200)
+        return response_cache.cached_response(
+            request, 'chart', company_id,
+            lambda: get_sales_data_by_company(company_id=company_id,time_filter=time_filter,start_date=start_date,end_date=end_date),
+        )
 
 class TopDataProductsAndServicesView(APIView):
     permission_classes = [IsAuthenticated,IsCompanyActive]  # optional
@@ -48,8 +63,10 @@ class TopDataProductsAndServicesView(APIView):
     def get(self, request, company_id):
         time_filter = request.query_params.get('time_filter', "this_month")
         limit = request.query_params.get('limit', 4)
-        top_data = get_top_services_and_products(company_id,time_filter,int(limit))
-        return Response(top_data,status=200)
+        return response_cache.cached_response(
+            request, 'top', company_id,
+            lambda: get_top_services_and_products(company_id,time_filter,int(limit)),
+        )
 
 def parse_date(date_str):
     try:
@@ -97,14 +114,12 @@ def get_sales_data_by_company(company_id, time_filter='7_days', start_date=None,
     #     start_date = timezone.datetime(now.year, 1, 1)
     #     end_date = timezone.datetime(now.year, 12, 31)
 
-    filters = {
-        'sale__is_deleted': False,
-        'sale__company_id': company_id,
-    }
+    # Read from the daily rollup, so the cost follows the days in range rather than the sale items
+    filters = {'company_id': company_id}
     if start_date:
-        filters['sale__date__gte'] = start_date
+        filters['date__gte'] = start_date
     if end_date:
-        filters['sale__date__lte'] = end_date
+        filters['date__lte'] = end_date
 
     # Choose time grouping
     if time_filter == 'today' or (end_date and (end_date - start_date).days <= 7):
@@ -118,8 +133,8 @@ def get_sales_data_by_company(company_id, time_filter='7_days', start_date=None,
         label_format = "%b %Y"
 
     # Query sales
-    items = SaleItem.objects.filter(**filters).annotate(
-        period=trunc_func('sale__date')
+    items = DailySalesRollup.objects.filter(**filters).annotate(
+        period=trunc_func('date')
     ).values('period', 'type').annotate(
         total_sales=Sum('total')
     ).order_by('period')
@@ -150,36 +165,36 @@ def get_top_services_and_products(company_id, period='this_month', limit=3):
 
     # Date range filter based on the period
     if period == 'today':
-        date_filter = Q(sale__date=today)
+        date_filter = Q(date=today)
     elif period == 'this_month':
         first_day = today.replace(day=1)
-        date_filter = Q(sale__date__gte=first_day)
+        date_filter = Q(date__gte=first_day)
     elif period == 'this_year':
         first_day = today.replace(month=1, day=1)
-        date_filter = Q(sale__date__gte=first_day)
+        date_filter = Q(date__gte=first_day)
     else:
         # Default to 'this_month' if an unknown period is provided
         first_day = today.replace(day=1)
-        date_filter = Q(sale__date__gte=first_day)
+        date_filter = Q(date__gte=first_day)
 
-    # Common filter for all queries
-    base_filter = Q(sale__company_id=company_id, sale__is_deleted=False) & date_filter
+    # Common filter for all queries; the daily rollup only holds non-deleted sales
+    base_filter = Q(company_id=company_id) & date_filter
 
     # Top Services
     top_services = (
-        SaleItem.objects
+        DailySalesRollup.objects
         .filter(base_filter, type='service', service__isnull=False)
         .values('service__id', 'service__name')
-        .annotate(sale_count=Count('id'))
+        .annotate(sale_count=Sum('count'))
         .order_by('-sale_count')[:limit]
     )
 
     # Top Products
     top_products = (
-        SaleItem.objects
+        DailySalesRollup.objects
         .filter(base_filter, type='product', product__isnull=False)
         .values('product__id', 'product__name')
-        .annotate(sale_count=Count('id'))
+        .annotate(sale_count=Sum('count'))
         .order_by('-sale_count')[:limit]
     )
 
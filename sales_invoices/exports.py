@@ -0,0 +1,86 @@
+"""
+Streaming CSV/NDJSON exports of the sales report.
+
+Lines come from reports.queries and are read through ``.iterator()``, so
+PostgreSQL serves them from a server-side cursor and memory stays flat
+however long the date range is. The grand totals are added up while the
+lines are streamed and written as a trailer after the last line.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from reports import queries
+
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    'date', 'sale_id', 'customer', 'vehicle', 'item_type', 'item_name',
+    'quantity', 'amount', 'item_total', 'item_tax', 'item_grand_total',
+]
+
+
+class _ExportRenderer(BaseRenderer):
+    """
+    Registers the export format with DRF so ``?format=`` is accepted.
+
+    Successful exports bypass it with a StreamingHttpResponse; it only
+    renders error payloads, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode(self.charset)
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+RENDERERS = [CSVRenderer, NDJSONRenderer]
+FORMATS = {renderer.format: renderer.media_type for renderer in RENDERERS}
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def _stream_csv(lines, totals):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for line in lines:
+        yield writer.writerow([line[column] for column in COLUMNS])
+    yield writer.writerow(
+        ['TOTAL'] + [''] * (len(COLUMNS) - 4) + [totals['total_amount'], totals['total_tax'], totals['grand_total']]
+    )
+
+
+def _stream_ndjson(lines, totals):
+    for line in lines:
+        yield json.dumps(line, cls=DjangoJSONEncoder) + '\n'
+    yield json.dumps({'totals': totals}, cls=DjangoJSONEncoder) + '\n'
+
+
+def streaming_sales_report(company, start_date, end_date, export_format):
+    lines = queries.sales_report_lines(company, start_date, end_date).iterator(chunk_size=CHUNK_SIZE)
+    # Complete once the last line has been sent
+    totals = queries.empty_totals()
+    lines = queries.tally(lines, totals)
+    stream_lines = _stream_csv if export_format == 'csv' else _stream_ndjson
+    response = StreamingHttpResponse(stream_lines(lines, totals), content_type=FORMATS[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="sales_report_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}"'
+    )
+    return response
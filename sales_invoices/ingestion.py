@@ -0,0 +1,200 @@
+import decimal
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When, DecimalField
+from django.utils import timezone
+
+from companies.models import EmployeeCommission, EmployeeCommissionSetting
+from customers.models import CustomerServiceRecord, LoyaltyPoint
+from inventory.models import InventoryItem, InventoryTransaction
+from reports import response_cache, rollups
+from services.models import Service
+from .managers import TOTAL_FIELDS
+from .models import SaleItem, SaleItemEmployee
+from .signals import refresh_totals_for_sales
+
+
+def _pk(value):
+    """Normalise a product/service reference coming from the request payload."""
+    if value in (None, '', 'null'):
+        return None
+    if hasattr(value, 'pk'):
+        return value.pk
+    return int(value)
+
+
+def create_sale_items(sale, items_data, user=None):
+    """
+    Create all line items of ``sale`` in a fixed number of queries.
+
+    Services and products are resolved with one query each, items, employee
+    assignments and inventory transactions are bulk inserted and stock is
+    decremented with a single conditional UPDATE. The side effects of the
+    ``SaleItem``/``SaleItemEmployee`` post_save signals (service records,
+    loyalty points and commissions) are applied in bulk as well, since
+    ``bulk_create`` does not send signals; the same goes for refreshing the
+    sale's stored totals, its day in the sales rollup and the company's
+    cached reports.
+
+    Raises ``ValidationError`` when a product does not have enough stock;
+    callers are expected to run this inside ``transaction.atomic`` so the
+    whole sale is rolled back.
+    """
+    items_data = [dict(item_data) for item_data in items_data]
+    if not items_data:
+        return []
+
+    product_ids = {_pk(d.get('product')) for d in items_data} - {None}
+    service_ids = {_pk(d.get('service')) for d in items_data} - {None}
+    products = InventoryItem.objects.in_bulk(product_ids) if product_ids else {}
+    services = Service.objects.in_bulk(service_ids) if service_ids else {}
+
+    items = []
+    employees_per_item = []
+    stock_required = OrderedDict()
+    for item_data in items_data:
+        employees = item_data.pop('employees', None) or []
+        item_data['product'] = products.get(_pk(item_data.get('product')))
+        item_data['service'] = services.get(_pk(item_data.get('service')))
+
+        item = SaleItem(sale=sale, **item_data)
+        items.append(item)
+        employees_per_item.append(list(dict.fromkeys(int(e) for e in employees)))
+
+        if item.product:
+            quantity = abs(decimal.Decimal(str(item.quantity)))
+            stock_required[item.product.pk] = stock_required.get(item.product.pk, 0) + quantity
+
+    with transaction.atomic():
+        SaleItem.objects.bulk_create(items)
+        _reduce_stock(stock_required, sale, user)
+
+        assignments = [
+            SaleItemEmployee(sale_item=item, employee_id=employee_id)
+            for item, employee_ids in zip(items, employees_per_item)
+            for employee_id in employee_ids
+        ]
+        SaleItemEmployee.objects.bulk_create(assignments)
+
+        _create_commissions(items, employees_per_item)
+        _create_service_records(sale, items)
+
+        refresh_totals_for_sales([sale.pk])
+        rollups.refresh_days([(sale.company_id, sale.date)])
+        response_cache.invalidate([sale.company_id])
+        sale.refresh_from_db(fields=TOTAL_FIELDS)
+
+    return items
+
+
+def _reduce_stock(stock_required, sale, user):
+    """Decrement stock for every product in one guarded UPDATE."""
+    if not stock_required:
+        return
+
+    enough_stock = Q()
+    for product_id, quantity in stock_required.items():
+        enough_stock |= Q(pk=product_id, quantity__gte=quantity)
+
+    decrement = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in stock_required.items()],
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    updated = InventoryItem.objects.filter(enough_stock).update(
+        quantity=F('quantity') - decrement,
+        updated_at=timezone.now(),
+    )
+    # Any product short on stock fails its guard, so fewer rows are updated.
+    if updated != len(stock_required):
+        raise ValidationError("The requested sale quantity exceeds the available quantity")
+
+    InventoryTransaction.objects.bulk_create([
+        InventoryTransaction(
+            item_id=product_id,
+            transaction_type=InventoryTransaction.REMOVE,
+            quantity=quantity,
+            performed_by=user,
+            notes=f"Stock reduction from a sale {sale.id}",
+        )
+        for product_id, quantity in stock_required.items()
+    ])
+
+
+def _create_commissions(items, employees_per_item):
+    """Bulk equivalent of ``signals.update_commissions_for_sale_item``."""
+    pairs = [
+        (item, employee_id)
+        for item, employee_ids in zip(items, employees_per_item)
+        if item.type == 'service' and item.service
+        for employee_id in employee_ids
+    ]
+    if not pairs:
+        return
+
+    rates = {
+        (s.employee_id, s.service_id): s.commission_percentage
+        for s in EmployeeCommissionSetting.objects.filter(
+            employee_id__in={employee_id for _, employee_id in pairs},
+            service_id__in={item.service_id for item, _ in pairs},
+        )
+    }
+
+    commissions = []
+    for item, employee_id in pairs:
+        percentage = rates.get((employee_id, item.service_id))
+        if percentage is None:
+            continue
+        commission_amount = (percentage / 100) * decimal.Decimal(item.amount)
+        if commission_amount > 0:
+            commissions.append(EmployeeCommission(
+                sale_item=item,
+                employee_id=employee_id,
+                commission_amount=commission_amount,
+            ))
+    EmployeeCommission.objects.bulk_create(commissions)
+
+
+def _create_service_records(sale, items):
+    """Bulk equivalent of ``signals.create_customer_service_record``."""
+    if not (sale.customer_id and sale.vehicle_id):
+        return
+
+    service_items = [item for item in items if item.type == 'service' and item.service]
+    if not service_items:
+        return
+
+    existing = set(
+        CustomerServiceRecord.objects.filter(
+            customer_id=sale.customer_id,
+            vehicle_id=sale.vehicle_id,
+            date_started=sale.date,
+            service_id__in={item.service_id for item in service_items},
+        ).values_list('service_id', flat=True)
+    )
+
+    records = []
+    new_items = []
+    for item in service_items:
+        if item.service_id in existing:
+            continue
+        existing.add(item.service_id)
+        new_items.append(item)
+        records.append(CustomerServiceRecord(
+            customer_id=sale.customer_id,
+            vehicle_id=sale.vehicle_id,
+            service=item.service,
+            date_started=sale.date,
+            date_completed=sale.date,
+        ))
+    if not records:
+        return
+    CustomerServiceRecord.objects.bulk_create(records)
+
+    customer_points = LoyaltyPoint.objects.filter(customer_id=sale.customer_id).first()
+    base_points = customer_points.points if customer_points else 0
+    LoyaltyPoint.objects.bulk_create([
+        LoyaltyPoint(customer_id=sale.customer_id, points=base_points + item.service.points)
+        for item in new_items
+    ])
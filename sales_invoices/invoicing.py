@@ -0,0 +1,120 @@
+from itertools import groupby
+
+from django.db import transaction
+from django.utils.timezone import now
+
+from reports import response_cache
+from .models import Sale, Invoice, InvoiceSequence, PaymentInvoice, PaymentSale
+
+
+def bulk_invoice(company, start_date, end_date, due_date, customer_ids=None):
+    """
+    Invoice every uninvoiced sale of ``company`` dated within the range, one invoice per customer.
+
+    The statement count does not depend on how many customers or sales are
+    billed: the invoice numbers are reserved as one block of the company's
+    InvoiceSequence, invoices are inserted with one ``bulk_create``, linked
+    to their sales with one ``bulk_create`` on the through table and
+    totalled with one UPDATE, and the sales are flagged with one UPDATE. ``bulk_create`` sends no ``post_save``/``m2m_changed`` signals, so
+    the stored totals and the company's cached reports are refreshed explicitly.
+
+    Candidate sales are locked with ``SELECT ... FOR UPDATE``, so running this
+    twice, even concurrently, never invoices a sale twice. A re-run finds
+    nothing left to bill and returns an empty list. Sales without a customer
+    are skipped.
+
+    Returns the created invoices as dicts of id, invoice_number, customer,
+    sales and total.
+    """
+    with transaction.atomic():
+        sales = (
+            Sale.objects.select_for_update()
+            .filter(company=company, is_deleted=False, is_invoiced=False, customer__isnull=False,
+                    date__range=[start_date, end_date])
+            .exclude(invoices__isnull=False)
+            .order_by('customer_id', 'date', 'id')
+        )
+        if customer_ids is not None:
+            sales = sales.filter(customer_id__in=customer_ids)
+        sales_per_customer = {
+            customer_id: [sale_id for sale_id, _ in rows]
+            for customer_id, rows in groupby(sales.values_list('pk', 'customer_id'), key=lambda row: row[1])
+        }
+        if not sales_per_customer:
+            return []
+
+        # One block of consecutive numbers for the whole batch
+        day = now().date()
+        first = InvoiceSequence.allocate(company.pk, count=len(sales_per_customer), day=day)
+        invoices = Invoice.objects.bulk_create([
+            Invoice(company=company, customer_id=customer_id, due_date=due_date,
+                    invoice_number=Invoice.number_for(day, first + offset))
+            for offset, customer_id in enumerate(sales_per_customer)
+        ])
+        invoice_ids = [invoice.pk for invoice in invoices]
+
+        Link = Invoice.sales.through
+        Link.objects.bulk_create([
+            Link(invoice_id=invoice.pk, sale_id=sale_id)
+            for invoice in invoices
+            for sale_id in sales_per_customer[invoice.customer_id]
+        ])
+        sale_ids = [sale_id for sale_ids in sales_per_customer.values() for sale_id in sale_ids]
+        Sale.objects.filter(pk__in=sale_ids).update(is_invoiced=True)
+
+        created = Invoice.objects.filter(pk__in=invoice_ids)
+        created.refresh_totals()
+        response_cache.invalidate([company.pk])
+        summary = list(created.order_by('pk').values('id', 'invoice_number', 'customer', 'total'))
+
+    for row in summary:
+        row['sales'] = len(sales_per_customer[row['customer']])
+    return summary
+
+
+def allocate_payments(payments, invoice_ids, sale_ids, company=None):
+    """
+    Link every payment to every given invoice and sale and mark those as Paid.
+
+    Runs in one transaction with a fixed number of queries: the invoice and
+    sale ids are validated with one query each, the link rows are inserted
+    with ``bulk_create(ignore_conflicts=True)`` so links that already exist
+    are left alone, and the statuses are flipped with one UPDATE per model.
+    Ids that do not exist (or belong to another company when ``company`` is
+    given) are skipped and reported back. The cached reports of the companies
+    owning the invoices and sales are invalidated.
+    """
+    invoices = Invoice.objects.filter(pk__in=invoice_ids or [])
+    sales = Sale.objects.filter(pk__in=sale_ids or [])
+    if company is not None:
+        invoices = invoices.filter(company=company)
+        sales = sales.filter(company=company)
+
+    with transaction.atomic():
+        found_invoices = dict(invoices.values_list('pk', 'company_id')) if invoice_ids else {}
+        found_sales = dict(sales.values_list('pk', 'company_id')) if sale_ids else {}
+
+        if payments and found_invoices:
+            PaymentInvoice.objects.bulk_create([
+                PaymentInvoice(payment=payment, invoice_id=invoice_id)
+                for payment in payments
+                for invoice_id in found_invoices
+            ], ignore_conflicts=True)
+            Invoice.objects.filter(pk__in=found_invoices).update(status='Paid')
+        if payments and found_sales:
+            PaymentSale.objects.bulk_create([
+                PaymentSale(payment=payment, sale_id=sale_id)
+                for payment in payments
+                for sale_id in found_sales
+            ], ignore_conflicts=True)
+            Sale.objects.filter(pk__in=found_sales).update(status='Paid')
+        if payments:
+            response_cache.invalidate(set(found_invoices.values()) | set(found_sales.values()))
+
+    return {
+        'payments': [payment.pk for payment in payments],
+        'invoices': sorted(found_invoices),
+        'sales': sorted(found_sales),
+        'missing_invoices': [pk for pk in invoice_ids or [] if int(pk) not in found_invoices],
+        'missing_sales': [pk for pk in sale_ids or [] if int(pk) not in found_sales],
+    }
@@ -0,0 +1,149 @@
+import decimal
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from companies.models import Company, Employee, EmployeeCommissionSetting
+from customers.models import Customer, CustomerVehicle
+from inventory.models import InventoryItem
+from services.models import Service
+from sales_invoices.ingestion import create_sale_items
+from sales_invoices.models import Sale, SaleItem, SaleItemEmployee
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def legacy_create_sale_items(sale, items_data, user=None):
+    """The per-line loop ``SaleViewSet.create`` used before the batched pipeline."""
+    for item_data in items_data:
+        item_data = dict(item_data)
+        employees = item_data.pop('employees', [])
+
+        _product = InventoryItem.objects.filter(pk=item_data.get('product')).first()
+        _service = Service.objects.filter(pk=item_data.get('service')).first()
+
+        item_data['product'] = _product
+        item_data['service'] = _service
+
+        item = SaleItem.objects.create(sale=sale, **item_data)
+
+        if _product:
+            quantity_diff = decimal.Decimal(item_data.get('quantity'))
+            _product.reduce_stock(abs(quantity_diff), user=user, notes=f"Stock reduction from a sale {sale.id}")
+
+        for emp_id in employees:
+            SaleItemEmployee.objects.create(sale_item=item, employee_id=emp_id)
+
+
+class Command(BaseCommand):
+    help = "Benchmark query count and latency of sale creation, per-line loop vs batched pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,50', help="Comma separated line counts per sale")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per size, the median latency is reported")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+        repeat = options['repeat']
+        results = []
+
+        # Everything, fixtures included, is rolled back at the end.
+        try:
+            with transaction.atomic():
+                fixtures = self._create_fixtures(max(sizes))
+                for size in sizes:
+                    for label, pipeline in (('before', legacy_create_sale_items), ('after', create_sale_items)):
+                        results.append((size, label) + self._measure(fixtures, size, pipeline, repeat))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'lines':>6} {'path':>7} {'queries':>8} {'median ms':>10}")
+        for size, label, queries, latency in results:
+            self.stdout.write(f"{size:>6} {label:>7} {queries:>8} {latency:>10.2f}")
+
+    def _measure(self, fixtures, size, pipeline, repeat):
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            items_data = self._items_payload(fixtures, size)
+            # A fresh vehicle per sale keeps service records unique per run.
+            vehicle = CustomerVehicle.objects.create(customer=fixtures['customer'], make="Make",
+                                                     model="Model", plate_number=uuid.uuid4().hex[:12])
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                with transaction.atomic():
+                    sale = Sale.objects.create(
+                        company=fixtures['company'],
+                        customer=fixtures['customer'],
+                        vehicle=vehicle,
+                    )
+                    pipeline(sale, items_data, user=fixtures['user'])
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = len(ctx.captured_queries)
+        return queries, statistics.median(timings)
+
+    def _items_payload(self, fixtures, size):
+        items = []
+        for i in range(size):
+            if i % 2 == 0:
+                service = fixtures['services'][i]
+                items.append({
+                    'type': 'service', 'service': service.pk, 'product': None,
+                    'quantity': '1', 'amount': str(service.price), 'subtotal': str(service.price),
+                    'total': str(service.price), 'employees': [e.pk for e in fixtures['employees']],
+                })
+            else:
+                product = fixtures['products'][i]
+                items.append({
+                    'type': 'product', 'product': product.pk, 'service': None,
+                    'quantity': '1', 'amount': str(product.selling_unit_price),
+                    'subtotal': str(product.selling_unit_price), 'total': str(product.selling_unit_price),
+                    'employees': [],
+                })
+        return items
+
+    def _create_fixtures(self, size):
+        tag = uuid.uuid4().hex[:8]
+        company = Company.objects.create(
+            name=f"Benchmark {tag}", email=f"bench-{tag}@example.com", phone=tag,
+            address="-", subscription_fee=0, is_active=True,
+        )
+        user = User.objects.create_user(email=f"owner-{tag}@example.com", username=f"owner-{tag}",
+                                        password=None, company=company, role='CompanyOwner')
+        customer = Customer.objects.create(company=company, full_name="Bench Customer",
+                                           email=f"cust-{tag}@example.com", phone=tag)
+        employees = [
+            Employee.objects.create(
+                company=company,
+                user=User.objects.create_user(email=f"emp{i}-{tag}@example.com", username=f"emp{i}-{tag}",
+                                              password=None, company=company),
+            )
+            for i in range(2)
+        ]
+        services = [
+            Service.objects.create(company=company, name=f"Service {i}", price=500)
+            for i in range(size)
+        ]
+        products = [
+            InventoryItem.objects.create(company=company, name=f"Product {i}", quantity=10 ** 6,
+                                         buying_unit_price=50, selling_unit_price=100)
+            for i in range(size)
+        ]
+        EmployeeCommissionSetting.objects.bulk_create([
+            EmployeeCommissionSetting(employee=employee, service=service, commission_percentage=10)
+            for employee in employees for service in services
+        ])
+        return {
+            'company': company, 'user': user, 'customer': customer,
+            'employees': employees, 'services': services, 'products': products,
+        }
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sales_invoices.models import Sale, Invoice
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored subtotal/tax/discount/total columns of sales and invoices, or verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report rows whose stored totals are stale, without writing")
+        parser.add_argument('--company', type=int, help="Limit to a single company id")
+
+    def handle(self, *args, **options):
+        sales = Sale.objects.all()
+        invoices = Invoice.objects.all()
+        if options['company']:
+            sales = sales.filter(company_id=options['company'])
+            invoices = invoices.filter(company_id=options['company'])
+
+        if options['verify']:
+            stale_sales = list(sales.stale_totals().values_list('pk', flat=True))
+            stale_invoices = list(invoices.stale_totals().values_list('pk', flat=True))
+            self.stdout.write(f"Stale sales: {len(stale_sales)} {stale_sales[:20]}")
+            self.stdout.write(f"Stale invoices: {len(stale_invoices)} {stale_invoices[:20]}")
+            if stale_sales or stale_invoices:
+                raise CommandError("Stored totals are out of date, run recompute_totals without --verify")
+            self.stdout.write(self.style.SUCCESS("All stored totals are up to date"))
+            return
+
+        # Invoices sum the sale columns, so sales must be refreshed first.
+        with transaction.atomic():
+            sale_count = sales.refresh_totals()
+            invoice_count = invoices.refresh_totals()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {sale_count} sales and {invoice_count} invoices"))
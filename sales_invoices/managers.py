@@ -1,53 +1,140 @@
+from decimal import Decimal
+
+from django.apps import apps
 from django.db import models
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, OuterRef, Subquery, Value, Q, Prefetch
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
 from datetime import timedelta
 
-class SaleQuerySet(models.QuerySet):
+# Stored total column -> SaleItem column it is summed from.
+SALE_TOTAL_FIELDS = {
+    'subtotal': 'subtotal',
+    'tax_total': 'tax_amount',
+    'discount_total': 'discount_amount',
+    'total': 'total',
+}
+TOTAL_FIELDS = tuple(SALE_TOTAL_FIELDS)
+
+
+def _summed(queryset, group_by, field):
+    """Correlated ``SUM(field)`` subquery, 0 when there are no rows."""
+    rows = queryset.order_by().values(group_by).annotate(value=Sum(field)).values('value')
+    return Coalesce(Subquery(rows), Value(Decimal('0')),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+class TotalsQuerySetMixin:
+    """
+    Shared helpers for models that store denormalized totals.
+
+    ``totals_source`` names the child rows the totals are summed from:
+    (model label, field linking a child to its row, {stored total: child column}).
+    """
+    totals_source = None
+
+    def computed_totals(self):
+        """Correlated subqueries computing each stored total from the child rows."""
+        label, link, fields = self.totals_source
+        children = apps.get_model(label).objects.filter(**{link: OuterRef('pk')})
+        return {field: _summed(children, link, source) for field, source in fields.items()}
+
+    def refresh_totals(self):
+        """Recompute the stored totals of every row in the queryset with one UPDATE."""
+        return self.update(**self.computed_totals())
+
+    def stale_totals(self):
+        """Rows whose stored totals differ from the ones computed from their children."""
+        computed = {f'computed_{field}': expression for field, expression in self.computed_totals().items()}
+        mismatch = Q()
+        for field in TOTAL_FIELDS:
+            mismatch |= ~Q(**{field: models.F(f'computed_{field}')})
+        return self.annotate(**computed).filter(mismatch)
+
+class SaleQuerySet(TotalsQuerySetMixin, models.QuerySet):
+    totals_source = ('sales_invoices.SaleItem', 'sale', SALE_TOTAL_FIELDS)
+
+    def with_details(self):
+        """Load everything SaleSerializer renders: items, their service/product and assigned employees."""
+        SaleItem = apps.get_model('sales_invoices', 'SaleItem')
+        SaleItemEmployee = apps.get_model('sales_invoices', 'SaleItemEmployee')
+        assigned = SaleItemEmployee.objects.select_related('employee__user')
+        items = SaleItem.objects.select_related('service', 'product').prefetch_related(
+            Prefetch('assigned_employees', queryset=assigned)
+        )
+        return self.select_related('customer', 'vehicle').prefetch_related(Prefetch('items', queryset=items))
+
     def active(self):
         return self.filter(is_deleted=False)
 
-    def this_month(self):
-        today = now().date()
-        first_day = today.replace(day=1)
-        return self.active().filter(date__gte=first_day)
+class SaleManager(models.Manager.from_queryset(SaleQuerySet)):
+    def dashboard_insights(self, company_id):
+        """
+        All dashboard figures in one conditional-aggregation query.
 
-    def total_revenue(self):
-        return self.active().aggregate(total=Sum('items__total'))['total'] or 0
+        Sales are joined to their items once. Sale counts are distinct so the
+        join does not inflate them, and revenue is summed from the item totals,
+        which add up to each sale's stored total (see SALE_TOTAL_FIELDS).
+        """
+        first_day = now().date().replace(day=1)
+        this_month = Q(date__gte=first_day)
+        service = Q(items__type='service')
+        product = Q(items__type='product')
+        money = models.DecimalField(max_digits=14, decimal_places=2)
+        zero = Value(Decimal('0'), output_field=money)
 
-    def total_sales_count(self):
-        return self.active().count()
+        return self.get_queryset().active().filter(company_id=company_id).aggregate(
+            total_sales=Count('id', distinct=True),
+            total_revenue=Coalesce(Sum('items__total'), zero),
+            monthly_sales=Count('id', distinct=True, filter=this_month),
+            monthly_revenue=Coalesce(Sum('items__total', filter=this_month), zero),
+            total_services=Count('id', distinct=True, filter=service),
+            total_products=Count('id', distinct=True, filter=product),
+            total_service_sale_amount=Coalesce(Sum('items__total', filter=service), zero),
+            total_product_sale_amount=Coalesce(Sum('items__total', filter=product), zero),
+        )
 
-    def total_services(self):
-        return self.active().filter(items__type='service').count()
 
-    def total_products(self):
-        return self.active().filter(items__type='product').count()
 
-    def total_service_sale_amount(self):
-        return self.active().filter(items__type='service').aggregate(
-            total=Sum('items__total'))['total'] or 0
+class InvoiceQuerySet(TotalsQuerySetMixin, models.QuerySet):
+    # Summed over the invoice's sales, through the sales m2m table
+    totals_source = ('sales_invoices.Invoice_sales', 'invoice', {field: f'sale__{field}' for field in TOTAL_FIELDS})
 
-    def total_product_sale_amount(self):
-        return self.active().filter(items__type='product').aggregate(
-            total=Sum('items__total'))['total'] or 0
+    def with_details(self):
+        """Load the whole invoice -> sales -> items -> employees -> user tree InvoiceSerializer renders."""
+        Sale = apps.get_model('sales_invoices', 'Sale')
+        return self.select_related('company', 'customer').prefetch_related(
+            Prefetch('sales', queryset=Sale.objects.with_details())
+        )
 
-class SaleManager(models.Manager):
-    def get_queryset(self):
-        return SaleQuerySet(self.model, using=self._db)
 
-    def dashboard_insights(self, company_id):
-        qs = self.get_queryset().active().filter(company_id=company_id)
-        this_month = qs.this_month()
-
-        return {
-            "total_sales": qs.total_sales_count(),
-            "total_revenue": qs.total_revenue(),
-            "monthly_sales": this_month.count(),
-            "monthly_revenue": this_month.total_revenue(),
-            "total_services": qs.total_services(),
-            "total_products": qs.total_products(),
-            "total_service_sale_amount": qs.total_service_sale_amount(),
-            "total_product_sale_amount": qs.total_product_sale_amount(),
-        }
 
+class PaymentQuerySet(models.QuerySet):
+    def with_links(self, expand=()):
+        """
+        Load the linked invoices and sales the compact PaymentSerializer renders,
+        and the full trees of the relations named in ``expand`` ('invoices',
+        'sales') rendered by ``?expand=``.
+        """
+        Invoice = apps.get_model('sales_invoices', 'Invoice')
+        Sale = apps.get_model('sales_invoices', 'Sale')
+        PaymentInvoice = apps.get_model('sales_invoices', 'PaymentInvoice')
+        PaymentSale = apps.get_model('sales_invoices', 'PaymentSale')
+        invoices = PaymentInvoice.objects.order_by('pk')
+        if 'invoices' in expand:
+            invoices = invoices.prefetch_related(Prefetch('invoice', queryset=Invoice.objects.with_details()))
+        else:
+            invoices = invoices.select_related('invoice')
+        sales = PaymentSale.objects.order_by('pk')
+        if 'sales' in expand:
+            sales = sales.prefetch_related(Prefetch('sale', queryset=Sale.objects.with_details()))
+        else:
+            sales = sales.select_related('sale')
+        return self.prefetch_related(
+            Prefetch('paymentinvoice_set', queryset=invoices),
+            Prefetch('paymentsale_set', queryset=sales),
+        )
+
+    def with_details(self):
+        """Load the full invoice and sale trees."""
+        return self.with_links(expand=('invoices', 'sales'))
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.7 on 2026-10-17 16:18
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _summed(queryset, group_by, field):
+    rows = queryset.order_by().values(group_by).annotate(value=Sum(field)).values('value')
+    return Coalesce(Subquery(rows), Value(Decimal('0')),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+def backfill_totals(apps, schema_editor):
+    Sale = apps.get_model('sales_invoices', 'Sale')
+    SaleItem = apps.get_model('sales_invoices', 'SaleItem')
+    Invoice = apps.get_model('sales_invoices', 'Invoice')
+
+    items = SaleItem.objects.filter(sale=OuterRef('pk'))
+    Sale.objects.update(
+        subtotal=_summed(items, 'sale', 'subtotal'),
+        tax_total=_summed(items, 'sale', 'tax_amount'),
+        discount_total=_summed(items, 'sale', 'discount_amount'),
+        total=_summed(items, 'sale', 'total'),
+    )
+
+    links = Invoice.sales.through.objects.filter(invoice=OuterRef('pk'))
+    Invoice.objects.update(**{
+        field: _summed(links, 'invoice', f'sale__{field}')
+        for field in ('subtotal', 'tax_total', 'discount_total', 'total')
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_invoices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='discount_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tax_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='discount_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='tax_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
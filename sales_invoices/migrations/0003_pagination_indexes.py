@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-17 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_rename_effective_month_employeeremuneration_effective_date'),
+        ('customers', '0001_initial'),
+        ('sales_invoices', '0002_sale_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'date_created', 'id'], name='invoice_company_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date_paid', 'id'], name='payment_date_paid_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date', 'id'], name='sale_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_rename_effective_month_employeeremuneration_effective_date'),
+        ('customers', '0001_initial'),
+        ('sales_invoices', '0003_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='invoice_number',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('company', 'invoice_number'), name='invoice_company_number_uniq'),
+        ),
+        migrations.AddField(
+            model_name='invoicesequence',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_sequences', to='companies.company'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoicesequence',
+            constraint=models.UniqueConstraint(fields=('company', 'date'), name='invoicesequence_company_date_uniq'),
+        ),
+    ]
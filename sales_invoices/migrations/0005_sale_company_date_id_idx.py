@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_invoices', '0004_invoice_sequence'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_date_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['company', 'date', 'id'], name='sale_company_date_id_idx'),
+        ),
+    ]
@@ -2,11 +2,12 @@ from datetime import date
 
 from django.utils import timezone
 from django.utils.timezone import now
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from companies.models import Company
 from customers.models import Customer,CustomerVehicle
-from .managers import SaleManager
+from .managers import SaleManager, InvoiceQuerySet, PaymentQuerySet
 
 class Sale(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -17,9 +18,18 @@ class Sale(models.Model):
     is_invoiced = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=[('Pending', 'Pending'), ('Paid', 'Paid')], default='Pending')
+    # Denormalized sums of the sale items, kept in sync by sales_invoices.signals
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     objects = SaleManager()
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # Keyset pagination key within a company, see SalePagination
+            models.Index(fields=['company', 'date', 'id'], name='sale_company_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"Sale #{self.id} - {self.customer.full_name if self.customer else 'No Customer'}"
@@ -72,16 +82,69 @@ class SaleItemRequirement(models.Model):
     class Meta:
         unique_together = ('sale', 'inventory_item')
 
+class InvoiceSequence(models.Model):
+    """Last invoice number handed out per company and day."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="invoice_sequences")
+    date = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'date'], name='invoicesequence_company_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Invoice sequence {self.company_id} {self.date}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, company_id, count=1, day=None):
+        """
+        Reserve ``count`` consecutive numbers of the company's day and return the first one.
+
+        Call it inside the transaction that inserts the invoices. The UPDATE
+        keeps the counter row locked until that transaction ends, so
+        concurrent callers queue up behind it, and a rollback hands the
+        numbers back, which keeps the sequence free of gaps.
+        """
+        day = day or now().date()
+        counter = cls.objects.filter(company_id=company_id, date=day)
+        with transaction.atomic():
+            if not counter.update(last_value=F('last_value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(company_id=company_id, date=day, last_value=count)
+                    return 1
+                except IntegrityError:
+                    # Created concurrently; this UPDATE waits for that transaction's lock.
+                    counter.update(last_value=F('last_value') + count)
+            return counter.values_list('last_value', flat=True).get() - count + 1
+
 class Invoice(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     sales = models.ManyToManyField(Sale,related_name="invoices",blank=True)  # Change to ManyToManyField for multiple sales
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    invoice_number = models.CharField(max_length=100,unique=True)
+    invoice_number = models.CharField(max_length=100)
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(blank=True, null=True)
     date_created = models.DateField(auto_now_add=True)
     due_date = models.DateField()
     status = models.CharField(max_length=20, choices=[('Pending', 'Pending'), ('Paid', 'Paid')],default='Pending')
+    # Denormalized sums of the linked sales, kept in sync by sales_invoices.signals
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    objects = InvoiceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key within a company, see InvoicePagination
+            models.Index(fields=['company', 'date_created', 'id'], name='invoice_company_created_id_idx'),
+        ]
+        constraints = [
+            # Numbers come from a per-company sequence, see InvoiceSequence
+            models.UniqueConstraint(fields=['company', 'invoice_number'], name='invoice_company_number_uniq'),
+        ]
 
     def __str__(self):
         return f"Invoice {self.id} - {self.status}"
@@ -96,19 +159,23 @@ class Invoice(models.Model):
             if sale.is_deleted:
                 raise ValidationError(f"Cannot create an invoice for a deleted sale with ID {sale.id}.")
 
+    @staticmethod
+    def number_for(day, value):
+        return f"INV-{day:%Y%m%d}-{value:04d}"
+
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
         self.clean()
 
-        # First save to get ID
+        # New invoices are numbered before their single INSERT, in the same
+        # transaction as the counter bump so a failed insert frees the number.
+        if self.pk is None and not self.invoice_number:
+            with transaction.atomic():
+                day = now().date()
+                self.invoice_number = self.number_for(day, InvoiceSequence.allocate(self.company_id, day=day))
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
-        # If it's new and invoice_number is empty, generate it and save again
-        if is_new and not self.invoice_number:
-            today_str = now().strftime('%Y%m%d')
-            self.invoice_number = f"INV-{today_str}-{self.id}"
-            super().save(update_fields=['invoice_number'])
-
 class SoftDeleteManager(models.Manager):
     """Custom manager to handle soft deletions."""
 
@@ -134,6 +201,13 @@ class Payment(models.Model):
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(blank=True, null=True)
     remarks = models.TextField(blank=True, null=True)
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key, see PaymentPagination
+            models.Index(fields=['date_paid', 'id'], name='payment_date_paid_id_idx'),
+        ]
 
     def delete(self, *args, **kwargs):
         """Soft delete the payment."""
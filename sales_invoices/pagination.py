@@ -0,0 +1,13 @@
+from core.pagination import KeysetPagination
+
+
+class SalePagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class InvoicePagination(KeysetPagination):
+    ordering = ('-date_created', '-id')
+
+
+class PaymentPagination(KeysetPagination):
+    ordering = ('-date_paid', '-id')
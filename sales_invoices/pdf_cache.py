@@ -0,0 +1,148 @@
+"""
+Content-addressed cache for rendered invoice PDFs.
+
+A PDF is stored as ``media/invoices/invoice_<company>-<number>_<digest>.pdf``
+where the digest hashes everything the render depends on: the serialized
+invoice (with its sales and items), the customer, the company and the
+template source. When the digest of a request matches a file on disk the
+file is served as is and WeasyPrint is skipped.
+
+Eviction: storing a new version of an invoice removes its older versions, and
+the directory is trimmed least-recently-served first once it holds more than
+``INVOICE_PDF_CACHE_MAX_FILES`` files or ``INVOICE_PDF_CACHE_MAX_BYTES`` bytes.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import get_template
+
+logger = logging.getLogger("csm")
+
+TEMPLATE_NAME = 'invoice_template.html'
+STATS_KEY = 'invoice_pdf_cache:{}'
+
+
+def cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'invoices')
+
+
+@lru_cache(maxsize=None)
+def template_version():
+    """Hash of the invoice template source, so template edits invalidate cached PDFs."""
+    source = get_template(TEMPLATE_NAME).template.source
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def _row(obj):
+    return {field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields}
+
+
+def invoice_digest(invoice_data, customer, company):
+    payload = {
+        'invoice': invoice_data,
+        'customer': _row(customer),
+        'company': _row(company),
+        'template': template_version(),
+    }
+    encoded = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+
+def invoice_key(invoice):
+    """Invoice numbers are unique per company only, so cache entries are keyed by both."""
+    return f'{invoice.company_id}-{invoice.invoice_number}'
+
+
+def _filename(key, digest):
+    return f'invoice_{key}_{digest}.pdf'
+
+
+def lookup(key, digest):
+    """Return the path of the cached PDF for this digest, or None on a miss."""
+    path = os.path.join(cache_dir(), _filename(key, digest))
+    try:
+        # Touch on hit so eviction drops the least recently served files first.
+        os.utime(path)
+    except FileNotFoundError:
+        _count('misses')
+        return None
+    _count('hits')
+    return path
+
+
+def store(key, digest, pdf_bytes):
+    """Atomically write a freshly rendered PDF and evict stale files."""
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _filename(key, digest))
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    for old_path in glob.glob(os.path.join(directory, glob.escape(f'invoice_{key}_') + '*.pdf')):
+        if old_path != path:
+            _remove(old_path)
+    evict()
+    return path
+
+
+def evict(max_files=None, max_bytes=None):
+    """Trim the cache directory to its file/size budget, least recently used first."""
+    max_files = max_files or getattr(settings, 'INVOICE_PDF_CACHE_MAX_FILES', 1000)
+    max_bytes = max_bytes or getattr(settings, 'INVOICE_PDF_CACHE_MAX_BYTES', 500 * 1024 * 1024)
+
+    entries = []
+    with os.scandir(cache_dir()) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    entries.sort()
+    evicted = 0
+    while entries and (len(entries) > max_files or total_bytes > max_bytes):
+        _, size, path = entries.pop(0)
+        _remove(path)
+        total_bytes -= size
+        evicted += 1
+    if evicted:
+        logger.info("Evicted %s cached invoice PDFs", evicted)
+    return evicted
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _count(outcome):
+    key = STATS_KEY.format(outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr; losing one count is acceptable.
+        pass
+
+
+def stats():
+    """Hit/miss counters, as seen by the configured cache backend."""
+    return {outcome: cache.get(STATS_KEY.format(outcome), 0) for outcome in ('hits', 'misses')}
@@ -0,0 +1,70 @@
+"""Render functions for the background job queue, see reports.jobs.RENDERERS."""
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+from weasyprint import HTML
+
+from core import metrics
+from reports import queries
+from . import pdf_cache
+from .models import Invoice
+from .serializers import InvoiceSerializer
+
+
+def render_invoice_pdf(job):
+    invoice = Invoice.objects.with_details().get(pk=job.params['invoice_id'], company=job.company)
+
+    invoice_data = InvoiceSerializer(invoice).data
+    customer = invoice.customer
+    company = invoice.company
+
+    # Serve the cached PDF when none of the render inputs changed
+    digest = pdf_cache.invoice_digest(invoice_data, customer, company)
+    pdf_path = pdf_cache.lookup(pdf_cache.invoice_key(invoice), digest)
+
+    if pdf_path is None:
+        # Sale and invoice totals are read from the stored columns
+        sales = invoice_data.get('sale_details', [])
+
+        html_content = render_to_string(pdf_cache.TEMPLATE_NAME, {
+            'invoice': invoice_data,
+            'sales': sales,
+            'subtotal_amount': invoice.subtotal,
+            'tax_total_amount': invoice.tax_total,
+            'discount_total_amount': invoice.discount_total,
+            'total_amount': invoice.total,
+            'customer': customer,
+            'company': company,
+        })
+        with metrics.timed('weasyprint'):
+            pdf_file = HTML(string=html_content).write_pdf()
+        pdf_path = pdf_cache.store(pdf_cache.invoice_key(invoice), digest, pdf_file)
+
+    return os.path.relpath(pdf_path, settings.MEDIA_ROOT), {'invoice_number': invoice.invoice_number}
+
+
+def render_sales_report(job):
+    start_date = job.params.get('start_date')
+    end_date = job.params.get('end_date')
+    # Line totals are computed by the database, the grand totals while reading, see reports.queries
+    totals = queries.empty_totals()
+    report_data = list(queries.tally(queries.sales_report_lines(job.company, start_date, end_date), totals))
+
+    # Generate the PDF content (HTML format)
+    html_content = render_to_string('sales-report.html', {
+        'report_data': report_data,
+        'total_amount': totals['total_amount'],
+        'total_tax': totals['total_tax'],
+        'grand_total': totals['grand_total'],
+        'start_date': start_date,
+        'end_date': end_date,
+        'company': job.company,
+        'generated_at': timezone.now()
+    })
+
+    filename = f"sales_report_{timezone.now().strftime('%Y%m%d%H%M%S')}_{job.id.hex[:8]}.pdf"
+    with metrics.timed('weasyprint'):
+        HTML(string=html_content).write_pdf(os.path.join(settings.MEDIA_ROOT, filename))
+    return filename, {}
@@ -13,9 +13,9 @@ from companies.serializers import EmployeeSerializer
 
 class DashboardInsightsSerializer(serializers.Serializer):
     total_sales = serializers.IntegerField()
-    total_revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
     monthly_sales = serializers.IntegerField()
-    monthly_revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
+    monthly_revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
     total_services = serializers.IntegerField()
     total_products = serializers.IntegerField()
     total_service_sale_amount = serializers.IntegerField()
@@ -63,23 +63,17 @@ class SaleSerializer(serializers.ModelSerializer):
             'id', 'company', 'customer', 'customer_name',
             'vehicle', 'vehicle_plate', 'date',
             'is_deleted', 'is_invoiced', 'deleted_at',
-            'sale_items','serviced_vehicle','sale_amount','status'
+            'sale_items','serviced_vehicle','sale_amount','status',
+            'subtotal','tax_total','discount_total','total'
         ]
+        read_only_fields = ['subtotal', 'tax_total', 'discount_total', 'total']
     def get_serviced_vehicle(self,obj):
         if obj.vehicle:
             return f"{obj.vehicle.model}-{obj.vehicle.plate_number}"
         else:
             return ''
     def get_sale_amount(self,obj):
-        amount = 0
-        taxes = 0
-        discount = 0
-        for item in obj.items.all():
-            amount+=item.total
-            # taxes+=item.tax_amount
-            # discount+=item.discount_amount
-
-        return amount
+        return obj.total
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
@@ -88,8 +82,9 @@ class InvoiceSerializer(serializers.ModelSerializer):
     invoice_amount = serializers.SerializerMethodField()
     class Meta:
         model = Invoice
-        fields = ['id','company', 'sales', 'sale_details','due_date', 'status', 'invoice_number', 'date_created','customer','invoice_amount']
-        read_only_fields = ['invoice_number', 'date_created']
+        fields = ['id','company', 'sales', 'sale_details','due_date', 'status', 'invoice_number', 'date_created','customer','invoice_amount',
+                  'subtotal','tax_total','discount_total','total']
+        read_only_fields = ['invoice_number', 'date_created', 'subtotal', 'tax_total', 'discount_total', 'total']
 
     def validate_due_date(self, value):
         # Ensure the due date is in the future
@@ -103,11 +98,24 @@ class InvoiceSerializer(serializers.ModelSerializer):
         return value
 
     def get_invoice_amount(self, obj):
-        amount = 0
-        for sale in obj.sales.all():  # Access related sales directly
-            for item in sale.items.all():  # Assuming each sale has related items
-                amount += item.amount  # Access the amount of each item
-        return amount
+        return obj.total
+class BulkInvoiceSerializer(serializers.Serializer):
+    """Input of InvoiceViewSet.bulk_create: bill uninvoiced sales dated start_date..end_date."""
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    due_date = serializers.DateField()
+    customers = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate_due_date(self, value):
+        if value <= date.today():
+            raise serializers.ValidationError("Due date must be in the future.")
+        return value
+
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError("start_date must not be after end_date.")
+        return attrs
+
 class PaymentInvoiceSerializer(serializers.ModelSerializer):
     invoice = InvoiceSerializer()
 
@@ -125,6 +133,12 @@ class PaymentSaleSerializer(serializers.ModelSerializer):
 
 
 class PaymentSerializer(serializers.ModelSerializer):
+    """
+    Linked invoices and sales are rendered as compact summaries (id, number,
+    status, total). Pass ``expand`` in the context, e.g. ``{'invoices', 'sales'}``,
+    to get the full nested invoice/sale representation instead. Use with
+    ``Payment.objects.with_links(expand)`` so the links are prefetched.
+    """
     invoices = serializers.SerializerMethodField()
     sales = serializers.SerializerMethodField()
 
@@ -136,10 +150,33 @@ class PaymentSerializer(serializers.ModelSerializer):
             'invoices', 'sales'
         ]
 
+    def expanded(self, field):
+        return field in self.context.get('expand', ())
+
     def get_invoices(self, obj):
-        invoices = PaymentInvoice.objects.filter(payment=obj)
-        return PaymentInvoiceSerializer(invoices, many=True).data
+        links = obj.paymentinvoice_set.all()
+        if self.expanded('invoices'):
+            return PaymentInvoiceSerializer(links, many=True).data
+        return [
+            {
+                'id': link.invoice.id,
+                'invoice_number': link.invoice.invoice_number,
+                'status': link.invoice.status,
+                'total': str(link.invoice.total),
+            }
+            for link in links
+        ]
 
     def get_sales(self, obj):
-        sales = PaymentSale.objects.filter(payment=obj)
-        return PaymentSaleSerializer(sales, many=True).data
\ No newline at end of file
+        links = obj.paymentsale_set.all()
+        if self.expanded('sales'):
+            return PaymentSaleSerializer(links, many=True).data
+        return [
+            {
+                'id': link.sale.id,
+                'date': link.sale.date,
+                'status': link.sale.status,
+                'total': str(link.sale.total),
+            }
+            for link in links
+        ]
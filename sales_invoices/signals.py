@@ -1,11 +1,16 @@
 import decimal
+import logging
 
-from django.db.models.signals import post_save, m2m_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from sales_invoices.models import Sale, SaleItem, SaleItemEmployee
+from sales_invoices.models import Sale, SaleItem, SaleItemEmployee, Invoice
+from sales_invoices.managers import TOTAL_FIELDS
 from companies.models import EmployeeCommissionSetting, EmployeeCommission
 from customers.models import CustomerServiceRecord, LoyaltyPoint
 
+logger = logging.getLogger("csm")
+
 
 @receiver(post_save, sender=SaleItemEmployee)
 def handle_sale_item_employee_save(sender, instance, created, **kwargs):
@@ -39,24 +44,56 @@ def update_commissions_for_sale_item(sale_item):
                 commission_amount=commission_amount
             )
 
+def refresh_totals_for_sales(sale_ids):
+    """Recompute the stored totals of the given sales and of every invoice they belong to."""
+    Sale.objects.filter(pk__in=sale_ids).refresh_totals()
+    invoice_ids = Invoice.sales.through.objects.filter(sale_id__in=sale_ids).values('invoice_id')
+    Invoice.objects.filter(pk__in=invoice_ids).refresh_totals()
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def handle_sale_item_totals(sender, instance, **kwargs):
+    refresh_totals_for_sales([instance.sale_id])
+
+
+@receiver(m2m_changed, sender=Invoice.sales.through)
+def handle_invoice_sales_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # instance is the Invoice whose sales changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Invoice.objects.filter(pk=instance.pk).refresh_totals()
+            instance.refresh_from_db(fields=TOTAL_FIELDS)
+        return
+
+    # instance is a Sale added to / removed from invoices via sale.invoices
+    if action == 'pre_clear':
+        instance._cleared_invoice_ids = list(instance.invoices.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        Invoice.objects.filter(pk__in=pk_set).refresh_totals()
+    elif action == 'post_clear':
+        Invoice.objects.filter(pk__in=getattr(instance, '_cleared_invoice_ids', [])).refresh_totals()
+
+
 @receiver(post_save, sender=SaleItem)
 def handle_sale_item_save(sender, instance, created, **kwargs):
     if created:
         create_customer_service_record(instance)
 
 def create_customer_service_record(sale_item):
-    print("Running service record signal...")
     sale = sale_item.sale
     if sale.customer and sale.vehicle and sale_item.type == 'service' and sale_item.service:
         try:
-            record = CustomerServiceRecord.objects.create(
-                customer=sale.customer,
-                vehicle=sale.vehicle,
-                service=sale_item.service,
-                date_started=sale.date,
-                date_completed=sale.date,
-            )
-            print("Service record created:", record)
+            # Savepoint so a duplicate record does not break an enclosing transaction
+            with transaction.atomic():
+                record = CustomerServiceRecord.objects.create(
+                    customer=sale.customer,
+                    vehicle=sale.vehicle,
+                    service=sale_item.service,
+                    date_started=sale.date,
+                    date_completed=sale.date,
+                )
+            logger.debug("Service record %s created for sale item %s", record.pk, sale_item.pk)
             if sale.customer:
                 customer_points = LoyaltyPoint.objects.filter(customer=sale.customer).first()
                 LoyaltyPoint.objects.create(
@@ -64,6 +101,4 @@ def create_customer_service_record(sale_item):
                     points = (customer_points.points if customer_points else 0) + sale_item.service.points
                 )
         except Exception:
-            import traceback
-            print("Error occurred while creating service record")
-            traceback.print_exc()
\ No newline at end of file
+            logger.exception("Could not create the service record of sale item %s", sale_item.pk)
\ No newline at end of file
@@ -1,3 +1,806 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from companies.models import Company, Employee, EmployeeCommission, EmployeeCommissionSetting
+from core.models import CustomUser
+from customers.models import Customer, CustomerServiceRecord, CustomerVehicle, LoyaltyPoint
+from inventory.models import InventoryItem, InventoryTransaction
+from services.models import Service
+from . import pdf_cache
+from .ingestion import create_sale_items
+from .invoicing import allocate_payments
+from .managers import TOTAL_FIELDS
+from .models import Sale, SaleItem, SaleItemEmployee, Invoice, InvoiceSequence, Payment, PaymentInvoice, PaymentSale
+
+
+class StoredTotalsTests(TestCase):
+    """Sale and invoice total columns follow their items and sales, whichever side changes them."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+
+    def sale(self, *totals):
+        sale = Sale.objects.create(company=self.company, customer=self.customer)
+        for total in totals:
+            SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=total,
+                                    subtotal=total, tax_amount=total / 10, discount_amount=1, total=total)
+        return sale
+
+    def invoice(self):
+        return Invoice.objects.create(company=self.company, customer=self.customer,
+                                      due_date=datetime.date.today() + datetime.timedelta(days=30))
+
+    def stored(self, obj):
+        obj.refresh_from_db(fields=TOTAL_FIELDS)
+        return [getattr(obj, field) for field in TOTAL_FIELDS]
+
+    def test_sale_follows_its_items(self):
+        sale = self.sale(500, 100)
+        self.assertEqual(self.stored(sale), [600, 60, 2, 600])
+
+        item = sale.items.get(total=100)
+        item.total = item.subtotal = 300
+        item.save()
+        self.assertEqual(self.stored(sale), [800, 60, 2, 800])
+
+        item.delete()
+        self.assertEqual(self.stored(sale), [500, 50, 1, 500])
+
+    def test_invoice_follows_its_sales_from_the_invoice_side(self):
+        first, second = self.sale(500), self.sale(200)
+        invoice = self.invoice()
+
+        invoice.sales.add(first, second)
+        self.assertEqual(self.stored(invoice), [700, 70, 2, 700])
+        invoice.sales.remove(second)
+        self.assertEqual(self.stored(invoice), [500, 50, 1, 500])
+        invoice.sales.clear()
+        self.assertEqual(self.stored(invoice), [0, 0, 0, 0])
+
+    def test_invoice_follows_its_sales_from_the_sale_side(self):
+        sale = self.sale(500)
+        invoices = [self.invoice(), self.invoice()]
+
+        sale.invoices.add(*invoices)
+        self.assertEqual([self.stored(invoice) for invoice in invoices], [[500, 50, 1, 500]] * 2)
+        sale.invoices.remove(invoices[0])
+        self.assertEqual([self.stored(invoice)[-1] for invoice in invoices], [0, 500])
+        sale.invoices.clear()
+        self.assertEqual([self.stored(invoice)[-1] for invoice in invoices], [0, 0])
+
+        # A sale item change reaches the invoices the sale is on
+        invoices[0].sales.add(sale)
+        SaleItem.objects.create(sale=sale, type='service', service=self.service, amount=100, subtotal=100,
+                                total=100)
+        self.assertEqual(self.stored(invoices[0])[-1], 600)
+
+    def test_corrupted_rows_are_caught_and_repaired(self):
+        sale = self.sale(500)
+        invoice = self.invoice()
+        invoice.sales.add(sale)
+        call_command('recompute_totals', verify=True, stdout=io.StringIO())
+
+        Sale.objects.filter(pk=sale.pk).update(total=1)
+        Invoice.objects.filter(pk=invoice.pk).update(tax_total=1)
+        self.assertEqual(list(Sale.objects.stale_totals()), [sale])
+        self.assertEqual(list(Invoice.objects.stale_totals()), [invoice])
+        with self.assertRaises(CommandError):
+            call_command('recompute_totals', verify=True, stdout=io.StringIO())
+
+        call_command('recompute_totals', stdout=io.StringIO())
+        self.assertFalse(Sale.objects.stale_totals().exists())
+        self.assertEqual(self.stored(invoice), [500, 50, 1, 500])
+
+
+class SaleItemIngestionTests(TestCase):
+    """create_sale_items does what the per-item saves and their signals did, in a fixed number of queries."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.services = [Service.objects.create(company=self.company, name=f"Wash {i}", price=500, points=i + 1)
+                         for i in range(6)]
+        self.product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=10, buying_unit_price=50, selling_unit_price=100,
+        )
+        self.employees = [
+            Employee.objects.create(
+                company=self.company,
+                user=CustomUser.objects.create_user(
+                    email=f"emp{i}@example.com", username=f"emp{i}", password="secret", company=self.company,
+                ),
+            )
+            for i in range(2)
+        ]
+        # Only the first employee earns commission, on the first service
+        EmployeeCommissionSetting.objects.create(employee=self.employees[0], service=self.services[0],
+                                                 commission_percentage=10)
+
+    def new_sale(self, name):
+        customer = Customer.objects.create(company=self.company, full_name=name,
+                                           email=f"{name.lower()}@example.com", phone=name)
+        vehicle = CustomerVehicle.objects.create(customer=customer, make="Toyota", model="Axio",
+                                                 plate_number=f"KAA {name}")
+        LoyaltyPoint.objects.create(customer=customer, points=5)
+        return Sale.objects.create(company=self.company, customer=customer, vehicle=vehicle)
+
+    def lines(self):
+        employees = [employee.pk for employee in self.employees]
+        return [
+            {'type': 'service', 'service': self.services[0].pk, 'amount': 500, 'total': 500, 'employees': employees},
+            # The same service twice on a sale gets one service record
+            {'type': 'service', 'service': self.services[0].pk, 'amount': 300, 'total': 300,
+             'employees': employees[:1]},
+            {'type': 'service', 'service': self.services[1].pk, 'amount': 200, 'total': 200, 'employees': employees},
+            {'type': 'product', 'product': self.product.pk, 'amount': 100, 'quantity': 2, 'total': 200},
+        ]
+
+    def outcome(self, sale):
+        return {
+            'commissions': sorted(EmployeeCommission.objects.filter(sale_item__sale=sale)
+                                  .values_list('employee_id', 'commission_amount')),
+            'service_records': sorted(CustomerServiceRecord.objects.filter(customer=sale.customer)
+                                      .values_list('service_id', flat=True)),
+            'loyalty_points': sorted(LoyaltyPoint.objects.filter(customer=sale.customer)
+                                     .values_list('points', flat=True)),
+            'total': Sale.objects.get(pk=sale.pk).total,
+        }
+
+    def test_side_effects_match_the_per_item_signals(self):
+        bulk = self.new_sale("Bulk")
+        create_sale_items(bulk, self.lines(), user=self.user)
+
+        single = self.new_sale("Single")
+        for line in self.lines():
+            employees = line.pop('employees', [])
+            item = SaleItem.objects.create(
+                sale=single, type=line['type'], amount=line['amount'], total=line['total'],
+                quantity=line.get('quantity', 1),
+                service=Service.objects.filter(pk=line.get('service')).first(),
+                product=InventoryItem.objects.filter(pk=line.get('product')).first(),
+            )
+            for employee_id in employees:
+                SaleItemEmployee.objects.create(sale_item=item, employee_id=employee_id)
+
+        self.assertEqual(self.outcome(bulk), self.outcome(single))
+        self.assertEqual(self.outcome(bulk)['loyalty_points'], [5, 6, 7])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 8)
+        self.assertEqual(InventoryTransaction.objects.get(item=self.product).quantity, 2)
+
+    def test_shortage_rolls_back_the_whole_sale(self):
+        lines = self.lines()
+        lines[-1]['quantity'] = 11
+
+        with self.assertRaises(ValidationError):
+            with transaction.atomic():
+                create_sale_items(self.new_sale("Short"), lines, user=self.user)
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertFalse(EmployeeCommission.objects.exists())
+        self.assertFalse(CustomerServiceRecord.objects.exists())
+        self.assertFalse(InventoryTransaction.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        def count(name, services):
+            lines = [{'type': 'service', 'service': service.pk, 'amount': 500, 'total': 500,
+                      'employees': [employee.pk for employee in self.employees]} for service in services]
+            lines.append({'type': 'product', 'product': self.product.pk, 'amount': 100, 'total': 100})
+            sale = self.new_sale(name)
+            with CaptureQueriesContext(connection) as ctx:
+                create_sale_items(sale, lines, user=self.user)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count("Small", self.services[:1]), count("Large", self.services * 3))
+
+
+class InvoiceQueryBudgetTests(TestCase):
+    """Invoice list/retrieve must cost the same number of queries however large the tree is."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        self.vehicle = CustomerVehicle.objects.create(
+            customer=self.customer, make="Toyota", model="Axio", plate_number="KAA 001A",
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=100, buying_unit_price=50, selling_unit_price=100,
+        )
+        self.employees = [
+            Employee.objects.create(
+                company=self.company,
+                user=CustomUser.objects.create_user(
+                    email=f"emp{i}@example.com", username=f"emp{i}", password="secret", company=self.company,
+                ),
+            )
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_invoices(self, invoices, sales_per_invoice, items_per_sale):
+        for _ in range(invoices):
+            sales = []
+            for _ in range(sales_per_invoice):
+                sale = Sale.objects.create(company=self.company, customer=self.customer, vehicle=self.vehicle)
+                for i in range(items_per_sale):
+                    if i % 2:
+                        SaleItem.objects.create(sale=sale, type='product', product=self.product,
+                                                amount=100, subtotal=100, total=100)
+                        continue
+                    item = SaleItem.objects.create(sale=sale, type='service', service=self.service,
+                                                   amount=500, subtotal=500, total=500)
+                    for employee in self.employees:
+                        SaleItemEmployee.objects.create(sale_item=item, employee=employee)
+                sales.append(sale)
+            invoice = Invoice.objects.create(
+                company=self.company, customer=self.customer,
+                due_date=datetime.date.today() + datetime.timedelta(days=30),
+            )
+            invoice.sales.set(sales)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self.create_invoices(invoices=1, sales_per_invoice=1, items_per_sale=2)
+        small = self.count_queries('/api/v1/sales/invoices/')
+
+        self.create_invoices(invoices=5, sales_per_invoice=3, items_per_sale=4)
+        large = self.count_queries('/api/v1/sales/invoices/')
+
+        self.assertEqual(small, large)
+
+    def test_retrieve_query_count_is_constant(self):
+        self.create_invoices(invoices=1, sales_per_invoice=1, items_per_sale=1)
+        first = Invoice.objects.get()
+        small = self.count_queries(f'/api/v1/sales/invoices/{first.pk}/')
+
+        self.create_invoices(invoices=1, sales_per_invoice=4, items_per_sale=6)
+        second = Invoice.objects.exclude(pk=first.pk).get()
+        large = self.count_queries(f'/api/v1/sales/invoices/{second.pk}/')
+
+        self.assertEqual(small, large)
+
+
+class SalesReportExportTests(TestCase):
+    """format=csv|ndjson streams the caller's company's line items with a totals trailer."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        other = Company.objects.create(
+            name="Other", email="other@example.com", phone="0700000001",
+            address="Mombasa", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        service = Service.objects.create(company=self.company, name="Wash", price=500, tax_rate=16)
+        product = InventoryItem.objects.create(
+            company=self.company, name="Wax", quantity=100, buying_unit_price=50, selling_unit_price=100,
+        )
+        sale = Sale.objects.create(company=self.company, customer=customer)
+        SaleItem.objects.create(sale=sale, type='service', service=service, amount=500, quantity=2, tax_amount=160)
+        SaleItem.objects.create(sale=sale, type='product', product=product, amount=100, quantity=1)
+        other_sale = Sale.objects.create(company=other)
+        SaleItem.objects.create(sale=other_sale, type='service', service=service, amount=999)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        today = datetime.date.today().isoformat()
+        self.params = {'start_date': today, 'end_date': today}
+
+    def stream(self, export_format):
+        response = self.client.get('/api/v1/sales/sales/generate-sales-report/',
+                                   {**self.params, 'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_csv(self):
+        lines = self.stream('csv')
+        self.assertEqual(lines[0].split(',')[:3], ['date', 'sale_id', 'customer'])
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1].split(',')[0], 'TOTAL')
+        self.assertEqual([float(v) for v in lines[-1].split(',')[-3:]], [1100, 160, 1260])
+
+    def test_ndjson(self):
+        lines = [json.loads(line) for line in self.stream('ndjson')]
+        self.assertEqual([row['item_name'] for row in lines[:-1]], ['Wash', 'Wax'])
+        totals = lines[-1]['totals']
+        self.assertEqual(totals['rows'], 2)
+        self.assertEqual(float(totals['grand_total']), 1260)
+
+    def test_missing_dates_are_rejected(self):
+        response = self.client.get('/api/v1/sales/sales/generate-sales-report/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkInvoicingTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        today = datetime.date.today()
+        self.payload = {
+            'start_date': today.isoformat(),
+            'end_date': today.isoformat(),
+            'due_date': (today + datetime.timedelta(days=30)).isoformat(),
+        }
+
+    def create_customers(self, count, sales_each=2):
+        for i in range(count):
+            customer = Customer.objects.create(
+                company=self.company, full_name=f"Customer {i}",
+                email=f"customer{i}-{Customer.objects.count()}@example.com", phone=f"07{i:08d}",
+            )
+            for _ in range(sales_each):
+                sale = Sale.objects.create(company=self.company, customer=customer)
+                SaleItem.objects.create(sale=sale, type='service', service=self.service,
+                                        amount=500, subtotal=500, total=500)
+
+    def bulk_create(self):
+        return self.client.post('/api/v1/sales/invoices/bulk-create/', self.payload, format='json')
+
+    def test_one_invoice_per_customer(self):
+        self.create_customers(3)
+        response = self.bulk_create()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['invoices_created'], 3)
+        self.assertEqual(response.data['sales_invoiced'], 6)
+        today = datetime.date.today()
+        self.assertEqual(sorted(Invoice.objects.values_list('invoice_number', flat=True)),
+                         [f"INV-{today:%Y%m%d}-{n:04d}" for n in (1, 2, 3)])
+        for invoice in Invoice.objects.all():
+            self.assertEqual(invoice.sales.count(), 2)
+            self.assertEqual(invoice.total, 1000)
+        self.assertFalse(Sale.objects.filter(is_invoiced=False).exists())
+
+    def test_rerun_does_not_double_invoice(self):
+        self.create_customers(2)
+        self.bulk_create()
+        response = self.bulk_create()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['invoices_created'], 0)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_customers(self):
+        # Today's number sequence exists already in both runs
+        InvoiceSequence.objects.create(company=self.company, date=datetime.date.today())
+        self.create_customers(2)
+        with CaptureQueriesContext(connection) as small:
+            self.bulk_create()
+
+        self.create_customers(6, sales_each=3)
+        with CaptureQueriesContext(connection) as large:
+            self.bulk_create()
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class PaymentAllocationTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_invoices(self, count):
+        due_date = datetime.date.today() + datetime.timedelta(days=30)
+        return [
+            Invoice.objects.create(company=self.company, customer=self.customer, due_date=due_date)
+            for _ in range(count)
+        ]
+
+    def test_new_payment_is_allocated(self):
+        invoices = self.create_invoices(3)
+        sale = Sale.objects.create(company=self.company, customer=self.customer)
+        response = self.client.post('/api/v1/sales/payments/', {
+            'receivedAmount': 1500, 'createDate': datetime.date.today().isoformat(), 'paymentMethod': 'cash',
+            'invoices': [invoice.pk for invoice in invoices] + [999999], 'sales': [sale.pk],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        allocation = response.data['allocation']
+        self.assertEqual(allocation['invoices'], sorted(invoice.pk for invoice in invoices))
+        self.assertEqual(allocation['missing_invoices'], [999999])
+        self.assertEqual(PaymentInvoice.objects.count(), 3)
+        self.assertEqual(PaymentSale.objects.count(), 1)
+        self.assertFalse(Invoice.objects.exclude(status='Paid').exists())
+        self.assertEqual(Sale.objects.get().status, 'Paid')
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        payments = [Payment.objects.create(amount_paid=100, payment_method='cash') for _ in range(2)]
+        few = [invoice.pk for invoice in self.create_invoices(2)]
+        many = [invoice.pk for invoice in self.create_invoices(20)]
+
+        with CaptureQueriesContext(connection) as small:
+            allocate_payments(payments, few, [], company=self.company)
+        with CaptureQueriesContext(connection) as large:
+            allocate_payments(payments, many, [], company=self.company)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(PaymentInvoice.objects.count(), 44)
+
+    def test_existing_links_are_kept(self):
+        payment = Payment.objects.create(amount_paid=100, payment_method='cash')
+        invoice_ids = [invoice.pk for invoice in self.create_invoices(2)]
+        allocate_payments([payment], invoice_ids, [])
+        allocate_payments([payment], invoice_ids, [])
+        self.assertEqual(PaymentInvoice.objects.count(), 2)
+
+    def test_other_company_invoices_are_skipped(self):
+        other = Company.objects.create(
+            name="Other", email="other@example.com", phone="0700000001",
+            address="Mombasa", subscription_fee=0, is_active=True,
+        )
+        other_customer = Customer.objects.create(
+            company=other, full_name="John", email="john@example.com", phone="0722222222",
+        )
+        foreign = Invoice.objects.create(company=other, customer=other_customer,
+                                         due_date=datetime.date.today() + datetime.timedelta(days=30))
+        payment = Payment.objects.create(amount_paid=100, payment_method='cash')
+
+        allocation = allocate_payments([payment], [foreign.pk], [], company=self.company)
+
+        self.assertEqual(allocation['missing_invoices'], [foreign.pk])
+        self.assertEqual(Invoice.objects.get(pk=foreign.pk).status, 'Pending')
+
+
+class PaymentListingTests(TestCase):
+    """Payment listing cost must not depend on how many payments or links there are."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        self.service = Service.objects.create(company=self.company, name="Wash", price=500)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_payments(self, count, links=2):
+        for _ in range(count):
+            payment = Payment.objects.create(amount_paid=100, payment_method='cash')
+            for _ in range(links):
+                sale = Sale.objects.create(company=self.company, customer=self.customer)
+                SaleItem.objects.create(sale=sale, type='service', service=self.service,
+                                        amount=500, subtotal=500, total=500)
+                invoice = Invoice.objects.create(company=self.company, customer=self.customer,
+                                                 due_date=datetime.date.today() + datetime.timedelta(days=30))
+                invoice.sales.add(sale)
+                PaymentInvoice.objects.create(payment=payment, invoice=invoice)
+                PaymentSale.objects.create(payment=payment, sale=sale)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_compact_listing(self):
+        self.create_payments(1)
+        small, _ = self.count_queries('/api/v1/sales/payments/')
+
+        self.create_payments(5, links=3)
+        large, response = self.count_queries('/api/v1/sales/payments/')
+
+        self.assertEqual(small, large)
+        invoice = response.data['results'][0]['invoices'][0]
+        self.assertEqual(set(invoice), {'id', 'invoice_number', 'status', 'total'})
+        self.assertEqual(invoice['total'], '500.00')
+        self.assertEqual(set(response.data['results'][0]['sales'][0]), {'id', 'date', 'status', 'total'})
+
+    def test_expanded_listing(self):
+        self.create_payments(1)
+        small, _ = self.count_queries('/api/v1/sales/payments/?expand=invoices,sales')
+
+        self.create_payments(4, links=3)
+        large, response = self.count_queries('/api/v1/sales/payments/?expand=invoices,sales')
+
+        self.assertEqual(small, large)
+        invoice = response.data['results'][0]['invoices'][0]['invoice']
+        self.assertEqual(len(invoice['sale_details'][0]['sale_items']), 1)
+        self.assertIn('sale_items', response.data['results'][0]['sales'][0]['sale'])
+
+    def test_only_the_expanded_relation_is_loaded_in_full(self):
+        self.create_payments(1)
+        compact, _ = self.count_queries('/api/v1/sales/payments/')
+        expanded, _ = self.count_queries('/api/v1/sales/payments/?expand=invoices,sales')
+        sales, response = self.count_queries('/api/v1/sales/payments/?expand=sales')
+
+        self.assertLess(compact, sales)
+        self.assertLess(sales, expanded)
+        payment = response.data['results'][0]
+        self.assertIn('sale', payment['sales'][0])
+        self.assertEqual(set(payment['invoices'][0]), {'id', 'invoice_number', 'status', 'total'})
+
+    def test_unknown_expansion_is_rejected(self):
+        response = self.client.get('/api/v1/sales/payments/', {'expand': 'sales,customers'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('customers', str(response.data['expand']))
+
+
+class SalePaginationTests(TestCase):
+    """Keyset pages over (-date, -id): no row skipped or repeated, in either direction."""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email="owner@example.com", username="owner", password="secret",
+            company=self.company, role="CompanyOwner",
+        )
+        customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+        today = datetime.date.today()
+        # Three sales share a date, so pages break inside the tie
+        for days_ago in (0, 1, 1, 1, 3):
+            sale = Sale.objects.create(company=self.company, customer=customer)
+            Sale.objects.filter(pk=sale.pk).update(date=today - datetime.timedelta(days=days_ago))
+        self.expected = list(Sale.objects.filter(company=self.company).order_by('-date', '-id')
+                             .values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [sale['id'] for sale in response.data['results']], response.data
+
+    def test_forward_and_backward(self):
+        pages, url = [], '/api/v1/sales/sales/?page_size=2'
+        while url:
+            ids, data = self.page(url)
+            pages.append(ids)
+            url = data['next']
+        self.assertEqual(pages, [self.expected[:2], self.expected[2:4], self.expected[4:]])
+
+        backward, url = [], data['previous']
+        while url:
+            ids, data = self.page(url)
+            backward.append(ids)
+            url = data['previous']
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_only_the_callers_company_is_listed(self):
+        other = Company.objects.create(
+            name="Other", email="other@example.com", phone="0700000001",
+            address="Mombasa", subscription_fee=0, is_active=True,
+        )
+        Sale.objects.create(company=other)
+
+        ids, _ = self.page('/api/v1/sales/sales/?page_size=10')
+
+        self.assertEqual(ids, self.expected)
+
+    def test_malformed_cursor(self):
+        for cursor in ('not-base64!', 'eyJwIjogWzFdfQ=='):  # the second lacks the date
+            response = self.client.get('/api/v1/sales/sales/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_empty_last_page(self):
+        _, data = self.page('/api/v1/sales/sales/?page_size=2')
+        Sale.objects.exclude(pk__in=self.expected[:2]).delete()
+
+        ids, data = self.page(data['next'])
+
+        self.assertEqual(ids, [])
+        self.assertIsNone(data['next'])
+        ids, _ = self.page(data['previous'])
+        self.assertEqual(ids, self.expected[:2])
+
+
+class InvoicePdfCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+
+    def digest(self, total):
+        return pdf_cache.invoice_digest({'invoice_number': 'INV-1', 'total': total}, self.customer, self.company)
+
+    def test_hit_and_miss_after_change(self):
+        digest = self.digest('500.00')
+        self.assertIsNone(pdf_cache.lookup('1-INV-1', digest))
+        path = pdf_cache.store('1-INV-1', digest, b'%PDF v1')
+
+        self.assertEqual(pdf_cache.lookup('1-INV-1', digest), path)
+        changed = self.digest('600.00')
+        self.assertNotEqual(changed, digest)
+        self.assertIsNone(pdf_cache.lookup('1-INV-1', changed))
+        self.assertEqual(pdf_cache.stats(), {'hits': 1, 'misses': 2})
+
+    def test_store_removes_old_versions(self):
+        old = pdf_cache.store('1-INV-1', self.digest('500.00'), b'%PDF v1')
+        other = pdf_cache.store('1-INV-10', self.digest('500.00'), b'%PDF other')
+        new = pdf_cache.store('1-INV-1', self.digest('600.00'), b'%PDF v2')
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(other))
+        self.assertTrue(os.path.exists(new))
+
+    def test_eviction_drops_least_recently_served(self):
+        paths = [pdf_cache.store(f'1-INV-{i}', self.digest('500.00'), b'x' * 100) for i in range(4)]
+        for age, path in enumerate(reversed(paths)):
+            os.utime(path, (1000 - age, 1000 - age))
+        pdf_cache.lookup('1-INV-0', self.digest('500.00'))  # served last, so kept
+
+        self.assertEqual(pdf_cache.evict(max_files=3), 1)
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertEqual(pdf_cache.evict(max_bytes=250), 1)
+        self.assertFalse(os.path.exists(paths[2]))
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[3]))
+
+
+class InvoiceNumberingTests(TestCase):
+    def setUp(self):
+        self.companies = [
+            Company.objects.create(
+                name=f"Company {i}", email=f"company{i}@example.com", phone=f"070000000{i}",
+                address="Nairobi", subscription_fee=0, is_active=True,
+            )
+            for i in range(2)
+        ]
+        self.customers = [
+            Customer.objects.create(company=company, full_name="Jane", email=f"jane{i}@example.com",
+                                    phone=f"071111111{i}")
+            for i, company in enumerate(self.companies)
+        ]
+        self.due_date = datetime.date.today() + datetime.timedelta(days=30)
+        self.prefix = f"INV-{datetime.date.today():%Y%m%d}-"
+
+    def create_invoice(self, i):
+        return Invoice.objects.create(company=self.companies[i], customer=self.customers[i], due_date=self.due_date)
+
+    def test_numbers_are_sequential_per_company(self):
+        numbers = [self.create_invoice(i).invoice_number for i in (0, 0, 1, 0)]
+        self.assertEqual(numbers, [self.prefix + n for n in ('0001', '0002', '0001', '0003')])
+
+    def test_invoice_is_written_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.create_invoice(0)
+        invoice_writes = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith(('INSERT INTO "sales_invoices_invoice"', 'UPDATE "sales_invoices_invoice"'))
+        ]
+        self.assertEqual(len(invoice_writes), 1)
+
+    def test_rolled_back_invoice_frees_its_number(self):
+        self.create_invoice(0)
+        try:
+            with transaction.atomic():
+                self.create_invoice(0)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.create_invoice(0).invoice_number, self.prefix + '0002')
+
+
+@skipUnless(connection.vendor == 'postgresql', "needs row-level locking")
+class InvoiceNumberingConcurrencyTests(TransactionTestCase):
+    """Many threads creating invoices at once must get distinct, gap-free numbers."""
+
+    threads = 16
+    invoices_per_thread = 5
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name="Acme", email="acme@example.com", phone="0700000000",
+            address="Nairobi", subscription_fee=0, is_active=True,
+        )
+        self.customer = Customer.objects.create(
+            company=self.company, full_name="Jane", email="jane@example.com", phone="0711111111",
+        )
+
+    def create_invoices(self, barrier):
+        try:
+            barrier.wait()
+            for _ in range(self.invoices_per_thread):
+                Invoice.objects.create(company=self.company, customer=self.customer,
+                                       due_date=datetime.date.today() + datetime.timedelta(days=30))
+        finally:
+            connection.close()
+
+    def test_concurrent_creation(self):
+        barrier = threading.Barrier(self.threads)
+        workers = [threading.Thread(target=self.create_invoices, args=(barrier,)) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        total = self.threads * self.invoices_per_thread
+        prefix = f"INV-{datetime.date.today():%Y%m%d}-"
+        self.assertEqual(sorted(Invoice.objects.values_list('invoice_number', flat=True)),
+                         [f"{prefix}{n:04d}" for n in range(1, total + 1)])
@@ -35,7 +35,6 @@ class ServiceSerializer(serializers.ModelSerializer):
         ]
 
     def create(self, validated_data):
-        print("creating....123")
         item_types = validated_data.pop('item_types', [])
         service_products_data = validated_data.pop('service_products', [])
 
@@ -50,8 +49,6 @@ class ServiceSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         item_types = validated_data.pop('item_types', None)
         service_products_data = validated_data.pop('service_products', None)
-        print("Item Types ",item_types)
-        print("Service Products",service_products_data)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
@@ -35,7 +35,6 @@ class ItemTypeViewSet(viewsets.ModelViewSet):
         SuperAdmin can view all item types.
         Exclude soft-deleted items.
         """
-        print("coming.....")
         user = self.request.user
         queryset = ItemType.objects.filter(deleted=False)  # Exclude deleted items
 
@@ -108,8 +107,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         user = request.user
         data = request.data.copy()
-        print("User Company",user.company.id)
-        print("Request data",request.data)
+        logger.debug("Service create payload: %s", request.data)
         if user.role == "SuperAdmin":
             company_id = data.get("company")
             if not company_id: